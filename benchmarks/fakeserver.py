@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+A local stand-in for the Graylog REST API, for end-to-end and load tests of glogcli.
+
+It serves `users/<name>`, `streams/enabled`, `search/saved`, `search/universal/{relative,absolute}` and
+their `terms` and `histogram` aggregations from a synthetic timeline of messages ingested at `rate` messages per second. Messages become
+searchable `index_lag` seconds after their timestamp, every request is delayed by `latency` seconds
+and pages past `max_result_window` are refused like Graylog does.
+
+    with FakeGraylog(rate=200, latency=0.05) as server:
+        api = GraylogAPI("127.0.0.1", server.port, "loadtest", password="secret", host_tz="UTC")
+"""
+from __future__ import division, print_function
+import calendar
+import datetime
+import json
+import re
+import socket
+import sys
+import threading
+import time
+from six.moves import BaseHTTPServer, socketserver
+from six.moves.urllib.parse import urlparse, parse_qs
+from benchmarks.synthetic import SyntheticMessages
+
+ABSOLUTE_TIME = re.compile(r'(\d{4})-(\d\d)-(\d\d) (\d\d):(\d\d):(\d\d)\.(\d{3})')
+ISO_TIME = re.compile(r'(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)')
+STREAM_TERM = re.compile(r'streams:(\S+)')
+FIELD_TERM = re.compile(r'^([\w.]+):(.+)$')
+
+
+class FakeGraylog(object):
+
+    def __init__(self, rate=100, backfill=3600, latency=0.0, index_lag=0.0, max_result_window=10000,
+                 streams=("stream-1", "stream-2"), seed=0, message_size=80, extra_fields=0, port=0):
+        self.latency = latency
+        self.index_lag = index_lag
+        self.max_result_window = max_result_window
+        self.start_ms = int((time.time() - backfill) * 1000)
+        self.timeline = SyntheticMessages(
+            None, message_size, extra_fields, seed, start=self.start_ms / 1000.0, streams=streams, rate=rate
+        )
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.messages_served = 0
+        self.server = _ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        self.server.graylog = self
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}/api/".format(self.port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05})
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.close_connections()
+        self.server.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def visible_until_ms(self):
+        return int((time.time() - self.index_lag) * 1000)
+
+    def ids_between(self, from_ms, to_ms, streams=None):
+        """
+        Returns the ids of the messages with a timestamp between `from_ms` and `to_ms`, searchable or not.
+        """
+        first, last = self.timeline.index_range(from_ms, to_ms)
+        return [self.timeline.message(i)['message']['_id'] for i in range(first, last + 1)
+                if streams is None or self.timeline.stream(i) in streams]
+
+    # request handling
+
+    def handle(self, path, params):
+        with self.lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        if path.startswith("users/"):
+            return 200, {"username": path[len("users/"):], "permissions": ["*"], "roles": ["Admin"], "timezone": "UTC"}
+        elif path == "streams/enabled":
+            streams = [{"id": s, "title": "Stream {}".format(s)} for s in self.timeline.streams]
+            return 200, {"streams": streams, "total": len(streams)}
+        elif path == "search/saved":
+            return 200, {"searches": [{"title": "Errors", "query": {"query": "level:3", "fields": "timestamp,level,message"}}], "total": 1}
+        elif path in ("search/universal/relative", "search/universal/absolute"):
+            return self.search(path.rsplit("/", 1)[1], params)
+        elif path.startswith("search/universal/") and path.rsplit("/", 1)[1] in ("terms", "histogram"):
+            kind, aggregation = path.split("/")[2:4]
+            return 200, getattr(self, aggregation)(kind, params)
+        return 404, {"type": "ApiError", "message": "Not found: " + path}
+
+    def search(self, kind, params):
+        limit = int(params["limit"]) if "limit" in params else self.max_result_window
+        offset = int(params.get("offset", "0"))
+        if offset + limit > self.max_result_window:
+            return 500, {"type": "ApiError", "message": "Result window is too large, [from + size] must be less than or equal to: [{}]".format(
+                self.max_result_window)}
+
+        from_ms, to_ms = self._range(kind, params)
+        descending = params.get("sort", "timestamp:desc").endswith(":desc")
+        indices = self._indices(from_ms, to_ms, params, descending)
+        terms = self._terms(params)
+        fields = params["fields"].split(",") if params.get("fields") else None
+
+        if terms:
+            # free text has to be matched against every generated message
+            matching = (m for m in (self.timeline.message(i) for i in indices) if self._matches(terms, m["message"]))
+            matching = list(matching)
+            total = len(matching)
+            messages = matching[offset:offset + limit]
+        else:
+            total = len(indices)
+            messages = [self.timeline.message(i) for i in indices[offset:offset + limit]]
+
+        if fields is not None:
+            for message in messages:
+                message["message"] = dict((k, v) for k, v in message["message"].items() if k in fields)
+
+        with self.lock:
+            self.messages_served += len(messages)
+        return 200, {
+            "query": params.get("query", "*"), "built_query": "{}", "used_indices": [], "fields": fields or [],
+            "time": 1, "total_results": total, "messages": messages,
+            "from": datetime.datetime.utcfromtimestamp(from_ms / 1000.0).isoformat() + "Z",
+            "to": datetime.datetime.utcfromtimestamp(to_ms / 1000.0).isoformat() + "Z",
+        }
+
+    def terms(self, kind, params):
+        counts = {}
+        missing = 0
+        messages = self._matching(kind, params)
+        for message in messages:
+            value = message.get(params["field"])
+            if value is None:
+                missing += 1
+            else:
+                counts[value] = counts.get(value, 0) + 1
+        top = sorted(counts.items(), key=lambda term: -term[1])[:int(params.get("size", "50"))]
+        return {"terms": dict(top), "missing": missing, "other": len(messages) - missing - sum(c for _, c in top),
+                "total": len(messages), "time": 1, "built_query": "{}"}
+
+    def histogram(self, kind, params):
+        width = {"minute": 60, "hour": 3600, "day": 86400, "week": 7 * 86400}[params["interval"]]
+        results = {}
+        for message in self._matching(kind, params):
+            start = str(_parse_iso_seconds(message["timestamp"]) // width * width)
+            results[start] = results.get(start, 0) + 1
+        return {"interval": params["interval"], "results": results, "time": 1, "built_query": "{}"}
+
+    def _range(self, kind, params):
+        now_ms = int(time.time() * 1000)
+        if kind == "relative":
+            return now_ms - int(params.get("range", "300")) * 1000, now_ms
+        return _parse_time(params["from"]), _parse_time(params["to"])
+
+    def _indices(self, from_ms, to_ms, params, descending=False):
+        first, last = self.timeline.index_range(from_ms, min(to_ms, self.visible_until_ms()))
+        indices = range(last, first - 1, -1) if descending else range(first, last + 1)
+        streams = set(STREAM_TERM.findall(params.get("filter") or ""))
+        if streams:
+            indices = [i for i in indices if self.timeline.stream(i) in streams]
+        return indices
+
+    @staticmethod
+    def _terms(params):
+        return [t for t in (params.get("query") or "*").split() if t not in ("*", "AND")]
+
+    def _matching(self, kind, params):
+        from_ms, to_ms = self._range(kind, params)
+        terms = self._terms(params)
+        messages = (self.timeline.message(i)["message"] for i in self._indices(from_ms, to_ms, params))
+        return [m for m in messages if self._matches(terms, m)]
+
+    @staticmethod
+    def _matches(terms, message):
+        for term in terms:
+            field = FIELD_TERM.match(term)
+            if field:
+                if str(message.get(field.group(1))) != field.group(2).strip('"'):
+                    return False
+            elif term.strip('"') not in message["message"]:
+                return False
+        return True
+
+
+def _parse_time(value):
+    # strptime is not safe to call from several threads on Python 2
+    year, month, day, hour, minute, second, millis = (int(v) for v in ABSOLUTE_TIME.match(value).groups())
+    return calendar.timegm((year, month, day, hour, minute, second)) * 1000 + millis
+
+
+def _parse_iso_seconds(value):
+    year, month, day, hour, minute, second = (int(v) for v in ISO_TIME.match(value).groups())
+    return calendar.timegm((year, month, day, hour, minute, second))
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, server_address, handler):
+        BaseHTTPServer.HTTPServer.__init__(self, server_address, handler)
+        self.lock = threading.Lock()
+        self.connections = {}
+
+    def process_request(self, request, client_address):
+        thread = threading.Thread(target=self.process_request_thread, args=(request, client_address))
+        thread.daemon = True
+        with self.lock:
+            self.connections[thread] = request
+        thread.start()
+
+    def process_request_thread(self, request, client_address):
+        try:
+            socketserver.ThreadingMixIn.process_request_thread(self, request, client_address)
+        finally:
+            with self.lock:
+                self.connections.pop(threading.current_thread(), None)
+
+    def close_connections(self):
+        # keep-alive connections of a client that stopped early would outlive the server
+        with self.lock:
+            connections = list(self.connections.items())
+        for thread, request in connections:
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            thread.join()
+
+    def handle_error(self, request, client_address):
+        # clients dropping keep-alive connections are expected, anything else is reported
+        if not isinstance(sys.exc_info()[1], socket.error):
+            BaseHTTPServer.HTTPServer.handle_error(self, request, client_address)
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        path = url.path.split("/api/", 1)[-1]
+        params = dict((k.rstrip("[]"), v[-1]) for k, v in parse_qs(url.query).items())
+        status, payload = self.server.graylog.handle(path, params)
+
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+End-to-end load test of LogPrinter against the local fake Graylog server.
+
+The dump scenario copies a past time range through TimeSlicedSearch, and the follow scenario tails
+the live timeline for `--duration` seconds. Both compare the message ids LogPrinter delivered with
+the ids the server ingested and report dropped and duplicated messages:
+
+    python benchmarks/loadtest.py --rate 500 --latency 0.05 --index-lag 1 --duration 20
+"""
+from __future__ import division, print_function
+import argparse
+import errno
+import os
+import sys
+import time
+
+# load test the working tree rather than an installed glogcli
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import arrow  # noqa: E402
+from benchmarks.fakeserver import FakeGraylog  # noqa: E402
+from glogcli.graylog_api import GraylogAPI, SearchRange, SearchQuery  # noqa: E402
+from glogcli.output import LogPrinter  # noqa: E402
+from glogcli.parallel import TimeSlicedSearch  # noqa: E402
+
+
+class IdFormatter(object):
+
+    def format(self, message):
+        return u"{} {}".format(message.message_dict["_id"], message.message_dict["timestamp"])
+
+
+class CollectingOutput(object):
+    """
+    LogPrinter output that keeps the delivered lines and closes after `duration` seconds.
+    """
+
+    def __init__(self, duration=None):
+        self.deadline = time.time() + duration if duration else None
+        self.lines = []
+
+    def _check_open(self):
+        if self.deadline is not None and time.time() >= self.deadline:
+            raise IOError(errno.EPIPE, "Broken pipe")
+
+    def write(self, data):
+        self._check_open()
+        self.lines.extend(line for line in data.decode("utf-8").split(u"\n") if line)
+
+    def flush(self):
+        self._check_open()
+
+    def delivered(self):
+        return [line.split(u" ", 1) for line in self.lines]
+
+
+def _millis(timestamp):
+    return timestamp.timestamp * 1000 + timestamp.microsecond // 1000
+
+
+def _report(name, server, output, expected, elapsed):
+    delivered = output.delivered()
+    ids = [message_id for message_id, _ in delivered]
+    unique = set(ids)
+    return {
+        "scenario": name,
+        "seconds": elapsed,
+        "delivered": len(ids),
+        "per_second": len(ids) / elapsed if elapsed else 0,
+        "expected": len(expected),
+        "dropped": len(set(expected) - unique),
+        "duplicated": len(ids) - len(unique),
+        "requests": server.requests,
+    }
+
+
+def build_api(server, max_workers=4):
+    api = GraylogAPI("127.0.0.1", server.port, "loadtest", password="loadtest", max_result_window=server.max_result_window,
+                     max_workers=max_workers)
+    api.update_host_timezone(api.user_info().get("timezone"))
+    return api
+
+
+def run_dump(server, range_seconds, workers=4):
+    """
+    Dumps `range_seconds` of already searchable messages and compares them with the ingested ones.
+    """
+    api = build_api(server, workers)
+    to_time = arrow.utcnow().replace(seconds=-(server.index_lag + 1))
+    from_time = to_time.replace(seconds=-range_seconds)
+    query = SearchQuery(SearchRange(from_time=from_time, to_time=to_time))
+
+    output = CollectingOutput()
+    start = time.time()
+    try:
+        LogPrinter().run_logprint(TimeSlicedSearch(api, workers), query, IdFormatter(), output=output)
+    finally:
+        api.close()
+    elapsed = time.time() - start
+
+    expected = server.ids_between(_millis(from_time), _millis(to_time))
+    return _report("dump", server, output, expected, elapsed)
+
+
+def run_follow(server, duration, latency=2, interval=500):
+    """
+    Follows the live timeline for `duration` seconds.
+    """
+    api = build_api(server)
+    from_time = arrow.utcnow().replace(seconds=-latency)
+    query = SearchQuery(SearchRange(from_time=from_time))
+
+    output = CollectingOutput(duration)
+    start = time.time()
+    try:
+        LogPrinter().run_logprint(api, query, IdFormatter(), follow=True, output=output, interval=interval, latency=latency)
+    finally:
+        api.close()
+    elapsed = time.time() - start
+
+    delivered = output.delivered()
+    last_ms = _millis(arrow.get(delivered[-1][1])) if delivered else _millis(from_time)
+    expected = server.ids_between(_millis(from_time), last_ms)
+    return _report("follow", server, output, expected, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="glogcli end-to-end load test against a fake Graylog server")
+    parser.add_argument("--scenario", choices=["dump", "follow", "both"], default="both")
+    parser.add_argument("--rate", type=int, default=200, help="messages ingested per second (default: 200)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request (default: 0)")
+    parser.add_argument("--index-lag", type=float, default=0.0, help="seconds before a message becomes searchable (default: 0)")
+    parser.add_argument("--window", type=int, default=10000, help="server max result window (default: 10000)")
+    parser.add_argument("--range", type=int, default=300, help="seconds of messages copied by the dump scenario (default: 300)")
+    parser.add_argument("--duration", type=int, default=10, help="seconds the follow scenario runs (default: 10)")
+    parser.add_argument("--follow-latency", type=int, default=2, help="glogcli follow --latency (default: 2)")
+    parser.add_argument("--workers", type=int, default=4, help="dump workers (default: 4)")
+    options = parser.parse_args()
+
+    scenarios = ["dump", "follow"] if options.scenario == "both" else [options.scenario]
+    print("{:<8} {:>9} {:>10} {:>9} {:>8} {:>10} {:>9}".format(
+        "scenario", "seconds", "delivered", "msgs/s", "dropped", "duplicated", "requests"))
+    for scenario in scenarios:
+        server = FakeGraylog(rate=options.rate, backfill=options.range + 60, latency=options.latency, index_lag=options.index_lag,
+                             max_result_window=options.window)
+        with server:
+            try:
+                if scenario == "dump":
+                    report = run_dump(server, options.range, options.workers)
+                else:
+                    report = run_follow(server, options.duration, options.follow_latency)
+            except SystemExit:
+                # GraylogAPI exits on the first failed request
+                print("{:<8} failed after {} requests".format(scenario, server.requests))
+                continue
+        print("{scenario:<8} {seconds:>9.1f} {delivered:>10} {per_second:>9.0f} {dropped:>8} {duplicated:>10} {requests:>9}".format(**report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmarks of the message pipeline over synthetic Graylog payloads.
+
+Every (stage, shape, size) case runs in a forked process that builds its input, then times the
+stage `--repeat` times and reports the best throughput in messages per second, together with the
+process peak RSS and how much it grew while the stage ran. Results can be saved as JSON and compared
+with an earlier run:
+
+    python benchmarks/pipeline.py --save before.json
+    python benchmarks/pipeline.py --compare before.json
+    python benchmarks/pipeline.py --sizes 1000000 --shapes short --stages decode,tail_format
+"""
+from __future__ import division, print_function
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+
+# benchmark the working tree rather than an installed glogcli
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import SyntheticMessages, SHAPES  # noqa: E402
+
+QUERIES = [u'level:ERROR AND source:web-1', u'timeout', u'level: warning message:"slow query"', u'source:worker-* AND NOT level:DEBUG']
+
+
+def _messages(synthetic):
+    from glogcli.graylog_api import Message
+    messages = [Message(m) for m in synthetic]
+    for message in messages:
+        message.timestamp
+    return messages
+
+
+def _format(formatter_name, **kwargs):
+    def prepare(synthetic):
+        from glogcli import formats, utils
+        formatter = getattr(formats, formatter_name)(utils.DEFAULT_MESSAGE_FORMAT_TEMPLATE, **kwargs)
+        return formatter, _messages(synthetic)
+
+    def run(data):
+        formatter, messages = data
+        for message in messages:
+            formatter.format(message)
+    return prepare, run
+
+
+def _decode():
+    def prepare(synthetic):
+        return list(synthetic.chunks())
+
+    def run(chunks):
+        from glogcli.graylog_api import SearchResult
+        for message in SearchResult.from_stream(iter(chunks)).messages:
+            pass
+    return prepare, run
+
+
+def _message():
+    def prepare(synthetic):
+        return list(synthetic)
+
+    def run(payloads):
+        from glogcli.graylog_api import Message
+        for payload in payloads:
+            message = Message(payload)
+            message.timestamp
+            message.level
+    return prepare, run
+
+
+def _buffer():
+    def prepare(synthetic):
+        messages = _messages(synthetic)
+        return [(m.message_dict['_id'], m.timestamp) for m in messages]
+
+    def run(entries):
+        from glogcli.output import MessageBuffer
+        buffer = MessageBuffer()
+        for message_id, timestamp in entries:
+            if not buffer.is_object_buffered(message_id):
+                buffer.insert(message_id, timestamp)
+    return prepare, run
+
+
+def _replace_log_level():
+    def prepare(synthetic):
+        return [QUERIES[i % len(QUERIES)] for i in range(synthetic.count)]
+
+    def run(queries):
+        from glogcli.graylog_api import SearchQuery
+        for query in queries:
+            SearchQuery.replace_log_level(query)
+    return prepare, run
+
+
+def _level_histogram(use_numpy):
+    def prepare(synthetic):
+        from glogcli.graylog_api import Message
+        return [Message(m) for m in synthetic]
+
+    def run(messages):
+        from glogcli.histogram import LevelHistogram
+        LevelHistogram(60, use_numpy).consume(messages).counts()
+    return prepare, run
+
+
+STAGES = [
+    ('decode', _decode()),
+    ('message', _message()),
+    ('tail_format', _format('TailFormatter', color=True)),
+    ('csv_format', _format('CsvFormatter')),
+    ('quoted_format', _format('DumpFormatter')),
+    ('ndjson_format', _format('NdjsonFormatter')),
+    ('buffer', _buffer()),
+    ('replace_log_level', _replace_log_level()),
+    ('level_histogram', _level_histogram(True)),
+    ('level_histogram_array', _level_histogram(False)),
+]
+
+
+def _max_rss_kb():
+    # kilobytes on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def run_case(stage, shape, size, repeat):
+    """
+    Runs one benchmark case in the current process and returns its result dict.
+    """
+    # import outside the timed runs; glogcli.output also sets the default encoding the cli runs with
+    import glogcli.graylog_api
+    import glogcli.formats
+    import glogcli.output  # noqa: F401
+
+    prepare, run = dict(STAGES)[stage]
+    data = prepare(SyntheticMessages.shape(shape, size))
+    before = _max_rss_kb()
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        run(data)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {
+        'stage': stage,
+        'shape': shape,
+        'size': size,
+        'seconds': best,
+        'per_second': size / best if best else None,
+        'peak_kb': _max_rss_kb(),
+        'stage_kb': _max_rss_kb() - before,
+    }
+
+
+def _run_case_in_child(queue, *args):
+    try:
+        queue.put(run_case(*args))
+    except Exception as e:
+        queue.put({'error': '{}: {}'.format(type(e).__name__, e)})
+        raise
+
+
+def run_isolated(stage, shape, size, repeat):
+    """
+    Runs one case in a child process, so its peak memory is not inflated by the cases before it.
+    """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run_case_in_child, args=(queue, stage, shape, size, repeat))
+    process.start()
+    result = queue.get()
+    process.join()
+    if 'error' in result:
+        raise RuntimeError("{}/{}/{} failed with {}".format(stage, shape, size, result['error']))
+    return result
+
+
+def case_key(result):
+    return '{stage}/{shape}/{size}'.format(**result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="glogcli message pipeline benchmarks")
+    parser.add_argument('--sizes', default='100,10000', help="comma separated message counts (default: 100,10000)")
+    parser.add_argument('--shapes', default=','.join(sorted(SHAPES)), help="comma separated payload shapes: " + ', '.join(sorted(SHAPES)))
+    parser.add_argument('--stages', default=','.join(name for name, _ in STAGES), help="comma separated stages")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per case, the best one is reported (default: 3)")
+    parser.add_argument('--save', default=None, help="write the results to a JSON file")
+    parser.add_argument('--compare', default=None, help="compare the throughput with results saved by an earlier run")
+    options = parser.parse_args()
+
+    baseline = {}
+    if options.compare:
+        with open(options.compare) as f:
+            baseline = dict((case_key(r), r) for r in json.load(f)['results'])
+
+    results = []
+    print("{:<36} {:>14} {:>10} {:>10} {:>8}".format("case", "msgs/s", "peak MB", "stage MB", "vs base"))
+    for size in [int(s) for s in options.sizes.split(',')]:
+        for shape in options.shapes.split(','):
+            for stage in options.stages.split(','):
+                result = run_isolated(stage, shape, size, options.repeat)
+                results.append(result)
+                previous = baseline.get(case_key(result))
+                ratio = "{:.2f}x".format(result['per_second'] / previous['per_second']) if previous and previous['per_second'] else "-"
+                print("{:<36} {:>14,.0f} {:>10.1f} {:>10.1f} {:>8}".format(
+                    case_key(result), result['per_second'] or 0, result['peak_kb'] / 1024, result['stage_kb'] / 1024, ratio))
+                sys.stdout.flush()
+
+    if options.save:
+        with open(options.save, 'w') as f:
+            json.dump({'python': platform.python_version(), 'platform': platform.platform(), 'results': results}, f, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures the startup time of glogcli per mode and checks it against a budget.
+
+Every mode runs in a fresh interpreter against an empty configuration and, for the --local modes,
+an empty mirror, so no Graylog server is needed. The best of `--runs` runs is reported, together
+with the heavy dependencies the mode imported.
+
+    python benchmarks/startup.py [--runs 5] [--check] [--budget-scale 1.0]
+"""
+from __future__ import division, print_function
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ('keyring', 'requests', 'arrow', 'parsedatetime', 'termcolor', 'pyarrow', 'sqlite3')
+
+# mode: (glogcli arguments, budget in milliseconds)
+MODES = [
+    ('version', ['-v'], 250),
+    ('help', ['--help'], 250),
+    ('sync-help', ['--sync', '--help'], 250),
+    ('local-tail', ['--local', '-@', '2016-01-01 00:00:00', '-#', '2016-01-01 01:00:00'], 600),
+    ('local-dump', ['--local', '-d', '--dump-format', 'ndjson', '-n', '0', '-@', '2016-01-01 00:00:00', '-#', '2016-01-01 01:00:00'], 600),
+]
+
+RUNNER = """
+import json, sys
+sys.argv = ['glogcli'] + json.loads(sys.argv[1])
+from glogcli.cli import main
+try:
+    main()
+except SystemExit:
+    pass
+sys.stderr.write(json.dumps(sorted(m for m in {heavy!r} if m in sys.modules)))
+""".format(heavy=HEAVY_MODULES)
+
+
+class StartupBenchmark(object):
+
+    def __init__(self, python=sys.executable):
+        self.python = python
+        self.directory = tempfile.mkdtemp()
+        self.config = os.path.join(self.directory, "glogcli.cfg")
+        self.db = os.path.join(self.directory, "mirror.db")
+        with open(self.config, "w") as f:
+            f.write("[environment:default]\nhost=localhost\n")
+
+    def close(self):
+        shutil.rmtree(self.directory)
+
+    def arguments(self, args):
+        if '--help' in args or '-v' in args:
+            return args
+        return args + ['-c', self.config, '--db', self.db]
+
+    def run(self, args):
+        """
+        Runs glogcli once, returning the wall time in milliseconds and the heavy modules it imported.
+        """
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        start = time.time()
+        process = subprocess.Popen([self.python, '-c', RUNNER, json.dumps(self.arguments(args))],
+                                   cwd=self.directory, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        _, err = process.communicate()
+        elapsed = (time.time() - start) * 1000
+        modules = json.loads(err.decode('utf-8').strip().splitlines()[-1])
+        return elapsed, modules
+
+    def measure(self, args, runs):
+        results = [self.run(args) for _ in range(runs)]
+        return min(elapsed for elapsed, _ in results), results[-1][1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="glogcli startup time per mode")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--check', action='store_true', help="exit with an error when a mode is over its budget")
+    parser.add_argument('--budget-scale', type=float, default=1.0, help="multiplies every budget, for slower machines")
+    options = parser.parse_args()
+
+    benchmark = StartupBenchmark()
+    over_budget = []
+    try:
+        print("{:<12} {:>10} {:>10}  {}".format("mode", "best ms", "budget ms", "heavy imports"))
+        for name, args, budget in MODES:
+            best, modules = benchmark.measure(args, options.runs)
+            budget *= options.budget_scale
+            if best > budget:
+                over_budget.append(name)
+            print("{:<12} {:>10.1f} {:>10.1f}  {}".format(name, best, budget, ", ".join(modules) or "-"))
+    finally:
+        benchmark.close()
+
+    if options.check and over_budget:
+        print("Over budget: {}".format(", ".join(over_budget)), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Deterministic synthetic Graylog universal search payloads for benchmarks and load tests.
+
+Payloads are generated lazily, so a million-message response can be streamed as text chunks without
+holding it in memory, and the same seed always produces the same messages.
+"""
+from __future__ import division, print_function
+import json
+import random
+import time
+import uuid
+import arrow
+
+SOURCES = ['web-{}'.format(i) for i in range(1, 9)] + ['worker-{}'.format(i) for i in range(1, 5)]
+FACILITIES = ['nginx', 'gunicorn', 'celery', 'kernel', 'cron']
+LEVELS = [7, 6, 6, 6, 6, 5, 4, 3, 2]
+WORDS = (u'request timeout connection upstream user payment order cache miss hit retry backend database '
+         u'query slow failed accepted queued processed commit rollback replica primary shard índice ação').split()
+
+# (message size in bytes, custom fields) of the payload shapes
+SHAPES = {
+    'short': (80, 0),
+    'long': (4096, 0),
+    'wide': (200, 50),
+}
+
+
+class SyntheticMessages(object):
+    """
+    Generates Graylog message wrappers `rate` per second, message `i` only depends on the seed and `i`.
+    """
+
+    def __init__(self, count, message_size=80, extra_fields=0, seed=0, start="2016-01-01T00:00:00.000Z", streams=("stream-1",), rate=1000):
+        self.count = count
+        self.message_size = message_size
+        self.extra_fields = extra_fields
+        self.seed = seed
+        self.start = arrow.get(start)
+        self.start_ms = self.start.timestamp * 1000 + self.start.microsecond // 1000
+        self.streams = list(streams)
+        self.rate = rate
+
+    @staticmethod
+    def shape(name, count, seed=0):
+        message_size, extra_fields = SHAPES[name]
+        return SyntheticMessages(count, message_size, extra_fields, seed)
+
+    def _text(self, rng):
+        words = []
+        size = 0
+        while size < self.message_size:
+            word = rng.choice(WORDS)
+            words.append(word)
+            size += len(word) + 1
+        return u' '.join(words)
+
+    def timestamp_ms(self, i):
+        return self.start_ms + i * 1000 // self.rate
+
+    def index_range(self, from_ms, to_ms):
+        """
+        Returns the first and last index of the messages with a timestamp between `from_ms` and `to_ms` (inclusive).
+        """
+        first = max(0, -(-(from_ms - self.start_ms) * self.rate // 1000))
+        last = -(-(to_ms - self.start_ms + 1) * self.rate // 1000) - 1
+        if self.count is not None:
+            last = min(last, self.count - 1)
+        return first, last
+
+    def stream(self, i):
+        return self.streams[i % len(self.streams)]
+
+    def message(self, i):
+        rng = random.Random(self.seed * 1000003 + i)
+        timestamp_ms = self.timestamp_ms(i)
+        message = {
+            '_id': str(uuid.UUID(int=rng.getrandbits(128))),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(timestamp_ms // 1000)) + '.{:03d}Z'.format(timestamp_ms % 1000),
+            'level': rng.choice(LEVELS),
+            'source': rng.choice(SOURCES),
+            'facility': rng.choice(FACILITIES),
+            'message': self._text(rng),
+            'streams': [self.stream(i)],
+        }
+        for field in range(self.extra_fields):
+            message['field_{}'.format(field)] = rng.randint(0, 10 ** 6) if field % 2 else rng.choice(WORDS)
+        return {'index': 'graylog_0', 'message': message}
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self.message(i)
+
+    def members(self):
+        return {
+            'query': '*',
+            'built_query': '{}',
+            'used_indices': [],
+            'fields': sorted(set(['_id', 'timestamp', 'level', 'source', 'facility', 'message', 'streams'] +
+                                 ['field_{}'.format(f) for f in range(self.extra_fields)])),
+            'time': 1,
+            'total_results': self.count,
+            'from': self.start.isoformat(),
+            'to': arrow.get(self.timestamp_ms(self.count) / 1000.0).isoformat(),
+        }
+
+    def payload(self):
+        payload = self.members()
+        payload['messages'] = list(self)
+        return payload
+
+    def chunks(self, chunk_size=64 * 1024):
+        """
+        Yields the JSON text of the search response in chunks of about `chunk_size` characters.
+        """
+        members = json.dumps(self.members())
+        buffered = [u'{"messages": [']
+        size = 0
+        for i, message in enumerate(self):
+            text = json.dumps(message)
+            buffered.append(text if i == 0 else u',' + text)
+            size += len(text) + 1
+            if size >= chunk_size:
+                yield u''.join(buffered)
+                buffered = []
+                size = 0
+        buffered.append(u'], ' + members[1:])
+        yield u''.join(buffered)
@@ -0,0 +1,156 @@
+from __future__ import division, print_function
+import hashlib
+import io
+import json
+import os
+import six
+import tempfile
+import time
+from glogcli import utils
+
+
+class ResultCache(object):
+    """
+    Caches raw API responses on disk, one file per request, evicting the least recently used past `max_size` bytes.
+    """
+
+    def __init__(self, directory=utils.DEFAULT_CACHE_DIR, max_size=utils.DEFAULT_CACHE_SIZE):
+        self.directory = os.path.expanduser(directory)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    @staticmethod
+    def from_config(cfg):
+        directory = utils.DEFAULT_CACHE_DIR
+        if cfg.has_option(utils.CACHE_SECTION, utils.CACHE_DIR):
+            directory = cfg.get(utils.CACHE_SECTION, utils.CACHE_DIR)
+
+        max_size = utils.DEFAULT_CACHE_SIZE
+        if cfg.has_option(utils.CACHE_SECTION, utils.CACHE_SIZE):
+            max_size = cfg.getint(utils.CACHE_SECTION, utils.CACHE_SIZE) * 1024 * 1024
+
+        return ResultCache(directory, max_size)
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha1(json.dumps(parts, sort_keys=True).encode(utils.UTF8)).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def read(self, key):
+        path = self._path(key)
+        try:
+            f = io.open(path, encoding=utils.UTF8)
+        except IOError:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        os.utime(path, None)
+        return self._read_chunks(f)
+
+    @staticmethod
+    def _read_chunks(f):
+        with f:
+            while True:
+                chunk = f.read(utils.STREAM_CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+
+    def write_through(self, key, chunks):
+        """
+        Yields the text chunks and stores them once every chunk has been read.
+        """
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        complete = False
+        try:
+            with io.open(fd, "w", encoding=utils.UTF8) as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            complete = True
+        finally:
+            if complete:
+                os.rename(temp_path, self._path(key))
+                self.evict()
+            else:
+                os.remove(temp_path)
+
+    def store(self, key, text):
+        for _ in self.write_through(key, [text]):
+            pass
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
+
+    def summary(self):
+        return "Result cache: {} hits, {} misses".format(self.hits, self.misses)
+
+
+class MetadataCache(object):
+    """
+    Keeps the user info, streams and saved searches of an environment on disk for `ttl` seconds.
+    """
+
+    def __init__(self, directory=os.path.join(utils.DEFAULT_CACHE_DIR, "metadata"), ttl=utils.DEFAULT_METADATA_TTL, refresh=False):
+        self.directory = os.path.expanduser(directory)
+        self.ttl = ttl
+        self.refresh = refresh
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    @staticmethod
+    def from_config(cfg, refresh=False):
+        directory = utils.DEFAULT_CACHE_DIR
+        if cfg.has_option(utils.CACHE_SECTION, utils.CACHE_DIR):
+            directory = cfg.get(utils.CACHE_SECTION, utils.CACHE_DIR)
+
+        ttl = utils.DEFAULT_METADATA_TTL
+        if cfg.has_option(utils.CACHE_SECTION, utils.METADATA_TTL):
+            ttl = cfg.getint(utils.CACHE_SECTION, utils.METADATA_TTL)
+
+        return MetadataCache(os.path.join(directory, "metadata"), ttl, refresh)
+
+    def _path(self, base_url, username, name):
+        return os.path.join(self.directory, ResultCache.key(base_url, username, name) + ".json")
+
+    def read(self, base_url, username, name):
+        if self.refresh:
+            return None
+        path = self._path(base_url, username, name)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with io.open(path, encoding=utils.UTF8) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def write(self, base_url, username, name, data):
+        # user info lists the user's permissions, keep it readable by its owner only
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with io.open(fd, "w", encoding=utils.UTF8) as f:
+            f.write(six.text_type(json.dumps(data)))
+        os.rename(temp_path, self._path(base_url, username, name))
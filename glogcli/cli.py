@@ -2,20 +2,26 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import division, print_function, absolute_import
+import sys
+from collections import OrderedDict
 import click
-import arrow
-from glogcli.graylog_api import SearchRange, SearchQuery, GraylogAPIFactory
-from glogcli.utils import get_config, get_color_option, get_glogcli_version
-from glogcli.output import LogPrinter
-from glogcli.input import CliInterface
-from glogcli.formats import FormatterFactory
+from glogcli.utils import get_config, get_color_option, get_glogcli_version, get_environments, cli_error
 from glogcli import utils
 
+# Only click and glogcli.utils are imported up front, so --version, --help and shell completion
+# don't pay for requests, keyring, arrow or pyarrow. Each mode imports what it needs in run().
+
+
+def print_version(ctx, param, value):
+    if value and not ctx.resilient_parsing:
+        click.echo(get_glogcli_version())
+        ctx.exit()
+
 
 @click.command()
-@click.option("-v", "--version", default=False, is_flag=True, help="Prints your glogcli version")
+@click.option("-v", "--version", is_flag=True, is_eager=True, expose_value=False, callback=print_version, help="Prints your glogcli version")
 @click.option("-h", "--host", default=None, help="Your graylog node's host")
-@click.option("-e", "--environment", default='default', help="Label of a preconfigured graylog node")
+@click.option("-e", "--environment", default='default', help="Label of a preconfigured graylog node, several comma separated labels or a glob such as 'dc*' search them all at once")
 @click.option("-sq", "--saved-query", is_flag=True, default=False, help="List user saved queries for selection")
 @click.option("--port", default=None, help="Your graylog port")
 @click.option("--no-tls", default=False, is_flag=True, help="Not use TLS to connect to Graylog server")
@@ -26,21 +32,40 @@ from glogcli import utils
 @click.option("-#", "--search-to", default=None, help="Query range to (default: now)")
 @click.option('--tail', 'mode', flag_value='tail', default=True, help="Show the last n lines for the query (default)")
 @click.option('-d', '--dump', 'mode', flag_value='dump', help="Print the query result as a csv")
+@click.option('--count', 'aggregation', flag_value='count', help="Print the number of messages matching the query, counted by the server")
+@click.option('--top', default=None, help="Print the most frequent values of this field with their counts, computed by the server (-n sets how many, default: 10)")
+@click.option('--histogram', 'aggregation', flag_value='histogram', help="Print the number of messages matching the query per --bucket, computed by the server")
+@click.option('--chart', 'aggregation', flag_value='chart', help="Draw the number of matching messages per --bucket split by level as a bar chart, counted locally from the fetched timestamps and levels")
+@click.option('--bucket', default=utils.DEFAULT_HISTOGRAM_INTERVAL, type=click.Choice(('second',) + utils.HISTOGRAM_INTERVALS), help="Time bucket of --histogram (minute to year) and --chart (second to day) (default: minute)")
+@click.option('--group-by', default=None, help="Print the most frequent values of this field, counted locally over all the matching messages in bounded memory (-n sets how many, default: 10)")
+@click.option('--distinct', default=None, help="Print the approximate number of distinct values of this field over all the matching messages")
+@click.option('--quantiles', default=None, help="Print the min, --percentiles and max of these comma separated numeric fields, per --group-by value when given, over the last --window seconds with -f", callback=lambda ctx, param, v: v.split(',') if v else None)
+@click.option('--percentiles', default=utils.DEFAULT_PERCENTILES, help="Comma separated percentiles printed by --quantiles (default: 50,95,99)")
+@click.option('--window', default=utils.DEFAULT_QUANTILE_WINDOW, help="Seconds of messages in the rolling --quantiles of follow mode, reported every sixth of it (default: 60)")
+@click.option('--sketch-error', default=utils.DEFAULT_SKETCH_ERROR, type=float, help="Error bound of --group-by counts, as a share of the messages, and --distinct estimates (default: 0.01)")
+@click.option('--dump-format', default=None, type=click.Choice(['csv', 'tsv', 'ndjson', 'quoted'] + list(utils.COLUMNAR_FORMATS)), help="Format of the dump output (default: quoted, csv for aggregations)")
 @click.option('--fields', default=None, help="Comma separated fields to be printed in the csv. ", callback=lambda ctx, param, v: v.split(',') if v else None)
 @click.option('-o', '--output', default=None, help="Output logs to file (only tail/dump mode)")
 @click.option("-f", "--follow", default=False, is_flag=True, help="Poll the logging server for new logs matching the query (sets search from to now, limit to None)")
-@click.option("-n", "--limit", default=100, help="Limit the number of results (default: 100)")
-@click.option("-a", "--latency", default=2, help="Latency of polling queries (default: 2)")
-@click.option("-st", "--stream", default=None, help="Stream ID of the stream to query (default: no stream filter)")
+@click.option("-n", "--limit", default=None, type=int, help="Limit the number of results (default: 100, or 10 terms with --top)")
+@click.option("-w", "--workers", default=None, type=int, help="Concurrent requests used by unlimited dumps (default: the environment's max_workers)")
+@click.option("-a", "--latency", default=utils.DEFAULT_LATENCY, help="Seconds of indexing lag tolerated in follow mode, older late messages are missed (default: 2)")
+@click.option("--interval", default=utils.DEFAULT_MIN_INTERVAL, help="Shortest follow mode polling interval in milliseconds, it backs off while idle (default: 500)")
+@click.option("-st", "--stream", default=None, help="Comma separated IDs of the streams to query (default: no stream filter)")
 @click.option('--sort', '-s', default=None, help="Field used for sorting (default: timestamp)")
 @click.option("--asc/--desc", default=False, help="Sort ascending / descending")
+@click.option("--no-cache", default=False, is_flag=True, help="Don't read or store past query results in the local cache")
+@click.option("--refresh-metadata", default=False, is_flag=True, help="Fetch the cached user, stream and saved search information again")
 @click.option("--proxy", default=None, help="Proxy to use for the http/s request")
+@click.option("--stats", "show_stats", default=False, is_flag=True, help="Print request, decode, format and write timings and result cache hits to stderr at exit (every minute in follow mode)")
+@click.option("--profile", default=None, help="Write a cProfile dump of the run to this file")
 @click.option('-r', '--format-template', default="default", help="Message format template for the log (default: default format")
 @click.option("--no-color", default=False, is_flag=True, help="Don't show colored logs")
 @click.option("-c", "--config", default="~/.glogcli.cfg", help="Custom config file path")
+@click.option("--local", default=False, is_flag=True, help="Query the local mirror filled by 'glogcli --sync' instead of the graylog server")
+@click.option("--db", default=utils.DEFAULT_MIRROR_PATH, help="Local mirror database path (default: ~/.glogcli/mirror.db)")
 @click.argument('query', default="*")
-def run(version,
-        host,
+def run(host,
         environment,
         saved_query,
         port,
@@ -51,59 +76,292 @@ def run(version,
         search_from,
         search_to,
         mode,
+        aggregation,
+        top,
+        bucket,
+        group_by,
+        distinct,
+        quantiles,
+        percentiles,
+        window,
+        sketch_error,
+        dump_format,
         fields,
         output,
         follow,
         limit,
+        workers,
         latency,
+        interval,
         stream,
         sort,
         asc,
+        no_cache,
+        refresh_metadata,
         proxy,
+        show_stats,
+        profile,
         format_template,
         no_color,
         config,
+        local,
+        db,
         query):
 
+    start_instrumentation(show_stats, profile)
     cfg = get_config(config_file_path=config)
 
-    if version:
-        click.echo(get_glogcli_version())
-        exit()
-
     if search_from and follow:
         click.echo("-f (follow) and -@ (search from) are conflicting options, please choose one of them.")
         exit()
 
-    if cfg.has_option(section='environment:%s' % environment, option='port') and port is None:
-        port = cfg.get(section='environment:%s' % environment, option='port')
+    if local and (follow or saved_query):
+        cli_error("-f (follow) and -sq (saved query) need a graylog server and can't be used with --local.")
+
+    # --group-by sets the groups of --quantiles, on its own it counts the values of the field
+    aggregations = [a for a, given in ((aggregation, aggregation), ('top', top), ('quantiles', quantiles),
+                                       ('group_by', group_by and not quantiles), ('distinct', distinct)) if given]
+    if len(aggregations) > 1:
+        cli_error("--count, --top, --histogram, --chart, --group-by, --distinct and --quantiles are conflicting options, please choose one of them.")
+    aggregation = aggregations[0] if aggregations else None
+
+    if aggregation and aggregation != 'quantiles' and follow:
+        cli_error("--count, --top, --histogram, --chart, --group-by and --distinct can't be used with -f (follow).")
+
+    if quantiles:
+        try:
+            percentiles = [float(p) for p in percentiles.split(",")]
+        except ValueError:
+            cli_error("--percentiles must be comma separated numbers, e.g. 50,95,99.")
+        if not all(0 <= p <= 100 for p in percentiles):
+            cli_error("--percentiles must be between 0 and 100.")
+
+    if aggregation == 'histogram' and bucket == 'second' or aggregation == 'chart' and bucket not in utils.CHART_BUCKET_SECONDS:
+        cli_error("--histogram buckets range from minute to year and --chart buckets from second to day.")
+
+    if aggregation in ('count', 'top', 'histogram') and local:
+        cli_error("--count, --top and --histogram are computed by the graylog server and can't be used with --local.")
+
+    if not 0 < sketch_error < 1:
+        cli_error("--sketch-error must be between 0 and 1.")
+
+    if aggregation and mode == 'dump' and dump_format not in (None, 'csv', 'tsv'):
+        cli_error("--count, --top, --histogram, --chart, --group-by, --distinct and --quantiles can only be dumped as csv or tsv.")
+
+    if mode == 'dump' and dump_format in utils.COLUMNAR_FORMATS and (output is None or follow):
+        cli_error("The {} dump format writes to a file, use -o and no -f.".format(dump_format))
+
+    import arrow
+    from glogcli.graylog_api import SearchRange, SearchQuery
+    from glogcli.input import CliInterface
+    from glogcli.output import LogPrinter, AggregationPrinter, OutputClosed
+    from glogcli.formats import Formatter, FormatterFactory
+
+    environments = get_environments(cfg, environment)
+    if len(environments) > 1 and (local or saved_query):
+        cli_error("--local and -sq (saved query) can only be used with a single environment.")
 
     if search_from is None:
         search_from = "5 minutes ago"
 
-    graylog_api = GraylogAPIFactory.get_graylog_api(cfg, environment, host, password, port, proxy, no_tls, username, keyring)
-
     sr = SearchRange(from_time=search_from, to_time=search_to)
 
+    if aggregation == 'chart':
+        # the chart has a row per bucket from the first to the last message, however sparse they are
+        from_time, to_time = sr.absolute_bounds()
+        span = (to_time - from_time).total_seconds()
+        if span / utils.CHART_BUCKET_SECONDS[bucket] > utils.MAX_CHART_BUCKETS:
+            coarser = [b for b in sorted(utils.CHART_BUCKET_SECONDS, key=utils.CHART_BUCKET_SECONDS.get)
+                       if span / utils.CHART_BUCKET_SECONDS[b] <= utils.MAX_CHART_BUCKETS]
+            cli_error("--chart draws at most {} bars, use {} for this range.".format(
+                utils.MAX_CHART_BUCKETS, "--bucket " + coarser[0] if coarser else "a shorter range"))
+
+    result_cache = None
+    if local:
+        from glogcli.mirror import LocalMirror
+        apis = {}
+    else:
+        from glogcli.graylog_api import GraylogAPIFactory
+        from glogcli.parallel import TimeSlicedSearch, MergedSearch
+        from glogcli.cache import ResultCache, MetadataCache
+        result_cache = None if no_cache else ResultCache.from_config(cfg)
+        metadata_cache = MetadataCache.from_config(cfg, refresh_metadata)
+        prefetch = (["streams"] if stream is None else []) + (["get_saved_queries"] if saved_query else [])
+        apis = OrderedDict(
+            (env, GraylogAPIFactory.get_graylog_api(cfg, env, host, password, port, proxy, no_tls, username, keyring, metadata_cache, prefetch))
+            for env in environments
+        )
+        for api in apis.values():
+            api.cache = result_cache
+
+    if limit is None:
+        limit = utils.DEFAULT_TOP_SIZE if top or group_by else 100
+    # with the aggregations -n sets the number of rows printed
+    size = limit if limit > 0 else None
+
     if follow:
         limit = None
         sort = None
-        sr.from_time = arrow.now().replace(seconds=-latency - 1)
-        sr.to_time = arrow.now().replace(seconds=-latency)
+        sr.from_time = arrow.now().replace(seconds=-latency)
+        sr.to_time = None
 
     limit = None if limit <= 0 else limit
     fields = fields if mode == 'dump' else utils.extract_fields_from_format(cfg, format_template)
     color = get_color_option(cfg, format_template, no_color)
 
-    stream_filter = CliInterface.select_stream(graylog_api, stream)
+    if len(environments) > 1 and mode == 'dump':
+        fields = fields or list(Formatter.DEFAULT_FIELDS)
+        if utils.ENVIRONMENT not in fields:
+            fields = [utils.ENVIRONMENT] + fields
+
+    if local:
+        graylog_api = LocalMirror(db)
+        stream_filter = CliInterface.streams_filter(stream.split(",")) if stream and stream != '*' else None
+    else:
+        # stream ids differ between graylog clusters, so each environment selects its own
+        stream_filters = dict((env, CliInterface.select_stream(apis[env], stream)) for env in environments)
+        stream_filter = stream_filters[environments[0]]
+        if (mode == 'dump' or aggregation in ('chart', 'group_by', 'distinct', 'quantiles')) and not follow and aggregation not in ('count', 'top', 'histogram'):
+            apis = OrderedDict((env, TimeSlicedSearch(api, workers)) for env, api in apis.items())
+        if len(environments) > 1:
+            graylog_api = MergedSearch(apis, stream_filters)
+        else:
+            graylog_api = apis[environments[0]]
     if saved_query:
         query, fields = CliInterface.select_saved_query(graylog_api)
 
-    q = SearchQuery(search_range=sr, query=query, limit=limit, filter=stream_filter, fields=fields, sort=sort, ascending=asc)
+    if aggregation in ('chart', 'group_by', 'distinct', 'quantiles'):
+        # the sketches read every matching message, but only need the summarized fields
+        if aggregation == 'chart':
+            fields = [utils.TIMESTAMP, utils.LEVEL]
+        elif quantiles:
+            fields = quantiles + ([group_by] if group_by else [])
+        else:
+            fields = [group_by or distinct]
+        limit = None
+
+    query_fields = [f for f in fields if f != utils.ENVIRONMENT] if fields else fields
+    q = SearchQuery(search_range=sr, query=query, limit=limit, filter=stream_filter, fields=query_fields, sort=sort, ascending=asc)
+
+    if aggregation:
+        try:
+            printer = AggregationPrinter((dump_format or 'csv') if mode == 'dump' else None)
+            if aggregation == 'count':
+                printer.print_count(graylog_api.count(q), output)
+            elif aggregation == 'top':
+                printer.print_terms(top, graylog_api.terms(q, top, size), output)
+            elif aggregation == 'histogram':
+                printer.print_histogram(graylog_api.histogram(q, bucket), output)
+            elif aggregation == 'chart':
+                from glogcli.histogram import LevelHistogram
+                histogram = LevelHistogram(utils.CHART_BUCKET_SECONDS[bucket]).consume(LogPrinter.fetch_messages(graylog_api, q))
+                printer.print_level_histogram(histogram, bucket, output, color and output is None)
+            elif aggregation == 'quantiles':
+                from glogcli.sketches import Quantiles, RollingQuantiles
+                size = size if group_by else None
+                if follow:
+                    def print_window(window_quantiles, end):
+                        printer.print_quantiles(window_quantiles, percentiles, size, output, window_end=end)
+                    aggregator = RollingQuantiles(quantiles, group_by, print_window, window)
+                    LogPrinter().run_aggregation(graylog_api, q, aggregator, follow, interval=interval, latency=latency)
+                else:
+                    aggregator = LogPrinter().run_aggregation(graylog_api, q, Quantiles(quantiles, group_by))
+                    printer.print_quantiles(aggregator, percentiles, size, output)
+            elif aggregation == 'group_by':
+                from glogcli.sketches import GroupBy
+                group = GroupBy(group_by, sketch_error).consume(LogPrinter.fetch_messages(graylog_api, q))
+                printer.print_group_by(group, size, output)
+            else:
+                from glogcli.sketches import Distinct
+                printer.print_distinct(Distinct(distinct, sketch_error).consume(LogPrinter.fetch_messages(graylog_api, q)), output)
+        except OutputClosed:
+            pass
+    elif mode == 'dump' and dump_format in utils.COLUMNAR_FORMATS:
+        from glogcli.columnar import ColumnarWriter
+        ColumnarWriter(output, fields, dump_format).write(LogPrinter.fetch_messages(graylog_api, q))
+    else:
+        formatter = FormatterFactory.get_formatter(mode, cfg, format_template, fields, color, dump_format or 'quoted')
+        LogPrinter().run_logprint(graylog_api, q, formatter, follow, output, header=formatter.header(), interval=interval, latency=latency)
+
+    if show_stats and result_cache is not None and result_cache.hits + result_cache.misses:
+        click.echo(result_cache.summary(), err=True)
+
+
+def start_instrumentation(show_stats, profile):
+    """
+    Enables the --stats and --profile instrumentation, which reports when the command's context closes.
+    """
+    ctx = click.get_current_context()
+    if show_stats:
+        from glogcli import stats
+        run_stats = stats.enable()
+
+        def report_stats():
+            stats.disable()
+            click.echo(run_stats.summary(), err=True)
+        ctx.call_on_close(report_stats)
+    if profile:
+        import cProfile
+        profiler = cProfile.Profile()
+
+        def write_profile():
+            profiler.disable()
+            profiler.dump_stats(profile)
+            click.echo("Profile written to {}, read it with 'python -m pstats {}'".format(profile, profile), err=True)
+        ctx.call_on_close(write_profile)
+        profiler.enable()
+
+
+@click.command()
+@click.option("-h", "--host", default=None, help="Your graylog node's host")
+@click.option("-e", "--environment", default='default', help="Label of a preconfigured graylog node")
+@click.option("--port", default=None, help="Your graylog port")
+@click.option("--no-tls", default=False, is_flag=True, help="Not use TLS to connect to Graylog server")
+@click.option("-u", "--username", default=None, help="Your graylog username")
+@click.option("-p", "--password", default=None, help="Your graylog password (default: prompt)")
+@click.option("-k/-nk", "--keyring/--no-keyring", default=False, help="Use keyring to store/retrieve password")
+@click.option("-@", "--search-from", default="1 hour ago", help="Query range from (default: 1 hour ago)")
+@click.option("-#", "--search-to", default=None, help="Query range to (default: now)")
+@click.option("-st", "--stream", default=None, help="Comma separated IDs of the streams to copy (default: no stream filter)")
+@click.option("-w", "--workers", default=None, type=int, help="Concurrent requests (default: the environment's max_workers)")
+@click.option("--refresh-metadata", default=False, is_flag=True, help="Fetch the cached user, stream and saved search information again")
+@click.option("--proxy", default=None, help="Proxy to use for the http/s request")
+@click.option("-c", "--config", default="~/.glogcli.cfg", help="Custom config file path")
+@click.option("--db", default=utils.DEFAULT_MIRROR_PATH, help="Local mirror database path (default: ~/.glogcli/mirror.db)")
+@click.argument('query', default="*")
+def sync(host, environment, port, no_tls, username, password, keyring, search_from, search_to, stream, workers, refresh_metadata, proxy, config, db,
+         query):
+    """Copies the messages of a query into the local mirror used by --local."""
+    from glogcli.graylog_api import SearchRange, SearchQuery, GraylogAPIFactory
+    from glogcli.parallel import TimeSlicedSearch
+    from glogcli.cache import MetadataCache
+    from glogcli.mirror import LocalMirror
+    from glogcli.input import CliInterface
+
+    cfg = get_config(config_file_path=config)
+
+    metadata_cache = MetadataCache.from_config(cfg, refresh_metadata)
+    prefetch = ["streams"] if stream is None else []
+    graylog_api = GraylogAPIFactory.get_graylog_api(cfg, environment, host, password, port, proxy, no_tls, username, keyring, metadata_cache, prefetch)
+    stream_filter = CliInterface.select_stream(graylog_api, stream)
+    q = SearchQuery(search_range=SearchRange(from_time=search_from, to_time=search_to), query=query, filter=stream_filter)
+
+    mirror = LocalMirror(db)
+    stored = mirror.sync(TimeSlicedSearch(graylog_api, workers), q)
+    mirror.close()
+    click.echo("Stored {} new messages in {}".format(stored, mirror.path))
+
 
-    formatter = FormatterFactory.get_formatter(mode, cfg, format_template, fields, color)
-    LogPrinter().run_logprint(graylog_api, q, formatter, follow, output)
+def main():
+    # sync is picked with a flag, a 'sync' subcommand could not be told apart from a search for "sync"
+    args = sys.argv[1:]
+    options = args[:args.index('--')] if '--' in args else args
+    if '--sync' in options:
+        args.remove('--sync')
+        sync(args=args, prog_name='glogcli --sync')
+    else:
+        run()
 
 
 if __name__ == "__main__":
-    run()
+    main()
@@ -0,0 +1,120 @@
+from __future__ import division, print_function
+import six
+import time
+from glogcli import stats, utils
+from glogcli.dateutils import epoch_millis
+from glogcli.utils import cli_error
+
+pyarrow = None
+
+
+def import_pyarrow():
+    """
+    Imports pyarrow on first use, it is an optional dependency and slow to import. Returns None when it is not installed.
+    """
+    global pyarrow
+    if pyarrow is None:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            return None
+    return pyarrow
+
+
+class ColumnarWriter(object):
+    """
+    Writes messages to an Arrow IPC or Parquet file with one column per field.
+    """
+
+    FORMATS = utils.COLUMNAR_FORMATS
+    DICTIONARY_FIELDS = (utils.SOURCE, utils.FACILITY, utils.ENVIRONMENT)
+    DEFAULT_FIELDS = [utils.TIMESTAMP, utils.LEVEL, utils.MESSAGE, utils.SOURCE, utils.FACILITY]
+
+    def __init__(self, path, fields=None, file_format='parquet', batch_size=utils.DEFAULT_PAGE_SIZE):
+        if import_pyarrow() is None:
+            cli_error("The {} dump format needs pyarrow, install it with 'pip install pyarrow'.".format(file_format))
+
+        self.path = path
+        self.fields = fields if fields else self.DEFAULT_FIELDS
+        self.file_format = file_format
+        self.batch_size = batch_size
+        # arrow ipc files can't change a dictionary between record batches
+        self.dictionary_fields = self.DICTIONARY_FIELDS if file_format == 'parquet' else ()
+        self.schema = pyarrow.schema([pyarrow.field(f, self._field_type(f)) for f in self.fields])
+        self.columns = self._empty_columns()
+        self.rows = 0
+        self.writer = None
+
+    def _field_type(self, field):
+        if field == utils.TIMESTAMP:
+            return pyarrow.timestamp('ms', tz='UTC')
+        elif field == utils.LEVEL:
+            return pyarrow.int8()
+        elif field in self.dictionary_fields:
+            return pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+        return pyarrow.string()
+
+    def _empty_columns(self):
+        return dict((f, []) for f in self.fields)
+
+    def write(self, messages):
+        for message in messages:
+            self.append(message)
+        self.close()
+
+    def append(self, message):
+        for field in self.fields:
+            if field == utils.TIMESTAMP:
+                value = epoch_millis(message.timestamp)
+            elif field == utils.LEVEL:
+                value = message.level if isinstance(message.level, six.integer_types) else None
+            elif field == utils.ENVIRONMENT:
+                value = message.environment
+            else:
+                value = message.message_dict.get(field)
+                if value is not None and not isinstance(value, six.text_type):
+                    value = six.text_type(value)
+            self.columns[field].append(value)
+
+        self.rows += 1
+        if stats.current is not None:
+            stats.current.count("messages")
+        if self.rows >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+
+        started = time.time()
+        arrays = []
+        for field in self.schema:
+            if field.name in self.dictionary_fields:
+                arrays.append(pyarrow.array(self.columns[field.name], type=pyarrow.string()).dictionary_encode())
+            else:
+                arrays.append(pyarrow.array(self.columns[field.name], type=field.type))
+        batch = pyarrow.RecordBatch.from_arrays(arrays, self.schema.names)
+
+        if self.writer is None:
+            self.writer = self._open_writer()
+        if self.file_format == 'parquet':
+            self.writer.write_table(pyarrow.Table.from_batches([batch], self.schema))
+        else:
+            self.writer.write_batch(batch)
+        if stats.current is not None:
+            stats.current.add("write", time.time() - started)
+
+        self.columns = self._empty_columns()
+        self.rows = 0
+
+    def _open_writer(self):
+        if self.file_format == 'parquet':
+            return pyarrow.parquet.ParquetWriter(self.path, self.schema)
+        return pyarrow.RecordBatchFileWriter(self.path, self.schema)
+
+    def close(self):
+        self.flush()
+        if self.writer is None:
+            self.writer = self._open_writer()
+        self.writer.close()
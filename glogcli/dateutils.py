@@ -1,9 +1,16 @@
 from __future__ import division, print_function
-import parsedatetime.parsedatetime as pdt
+import calendar
 import datetime
+import re
 import arrow
 import six
-from glogcli.utils import LOCAL_TIMEZONE
+from dateutil import tz
+from glogcli.utils import LOCAL_TIMEZONE, DEFAULT_DATE_FORMAT
+
+ISO_TIMESTAMP = re.compile(r'(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d)(?:\.(\d{1,6}))?(Z|[+-]\d\d:?\d\d)?$')
+UTC = tz.tzutc()
+_timezones = {'Z': UTC}
+_utc_seconds = {}
 
 
 def datetime_parser(s):
@@ -12,6 +19,7 @@ def datetime_parser(s):
         if ts.tzinfo == arrow.get().tzinfo:
             ts = ts.replace(tzinfo=LOCAL_TIMEZONE)
     except:
+        import parsedatetime.parsedatetime as pdt
         c = pdt.Calendar()
         result, what = c.parse(s)
 
@@ -35,3 +43,92 @@ def datetime_converter(dt):
         return datetime_parser(dt)
     else:
         return arrow.get(dt)
+
+
+def iso_timestamp_parser(s):
+    """
+    Parses the ISO-8601 timestamps of Graylog messages, anything else is handed over to arrow.get.
+    """
+    match = ISO_TIMESTAMP.match(s) if isinstance(s, six.string_types) else None
+    if match is None:
+        return arrow.get(s)
+
+    year, month, day, hour, minute, second, fraction, offset = match.groups()
+    microsecond = int(fraction.ljust(6, '0')) if fraction else 0
+    return arrow.Arrow(int(year), int(month), int(day), int(hour), int(minute), int(second), microsecond, _get_timezone(offset))
+
+
+def iso_epoch_seconds(s, cache_size=65536):
+    """
+    Returns the epoch seconds of a Graylog message timestamp without building an arrow object.
+    """
+    if isinstance(s, six.string_types) and s.endswith('Z'):
+        prefix = s[:19]
+        seconds = _utc_seconds.get(prefix)
+        if seconds is not None:
+            return seconds
+        match = ISO_TIMESTAMP.match(s)
+        if match is not None:
+            seconds = calendar.timegm(tuple(int(v) for v in match.groups()[:6]))
+            if len(_utc_seconds) >= cache_size:
+                _utc_seconds.clear()
+            _utc_seconds[prefix] = seconds
+            return seconds
+    return iso_timestamp_parser(s).timestamp
+
+
+def _get_timezone(offset):
+    if offset is None:
+        return UTC
+    timezone = _timezones.get(offset)
+    if timezone is None:
+        sign = -1 if offset[0] == '-' else 1
+        digits = offset[1:].replace(':', '')
+        timezone = tz.tzoffset(None, sign * (int(digits[:2]) * 3600 + int(digits[2:]) * 60))
+        _timezones[offset] = timezone
+    return timezone
+
+
+def epoch_millis(timestamp):
+    return timestamp.timestamp * 1000 + timestamp.microsecond // 1000
+
+
+class TimestampRenderer(object):
+    """
+    Formats timestamps in a timezone, rendering each second once.
+    """
+
+    MILLISECONDS = ".SSS"
+
+    def __init__(self, timezone=LOCAL_TIMEZONE, date_format=DEFAULT_DATE_FORMAT, cache_size=4096):
+        self.timezone = timezone
+        self.date_format = date_format
+        self.cache_size = cache_size
+        self.seconds = {}
+        if date_format.endswith(self.MILLISECONDS):
+            self.second_format = date_format[:-len(self.MILLISECONDS)]
+        else:
+            self.second_format = None
+
+    def render(self, timestamp):
+        if self.second_format is None:
+            return timestamp.to(self.timezone).format(self.date_format)
+
+        second = timestamp.timestamp
+        prefix = self.seconds.get(second)
+        if prefix is None:
+            if len(self.seconds) >= self.cache_size:
+                self.seconds.clear()
+            prefix = timestamp.to(self.timezone).format(self.second_format)
+            self.seconds[second] = prefix
+        return "{}.{:03d}".format(prefix, timestamp.microsecond // 1000)
+
+
+_renderers = {}
+
+
+def render_timestamp(timestamp, timezone=LOCAL_TIMEZONE):
+    renderer = _renderers.get(timezone)
+    if renderer is None:
+        renderer = _renderers[timezone] = TimestampRenderer(timezone)
+    return renderer.render(timestamp)
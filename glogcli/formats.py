@@ -1,8 +1,13 @@
 from __future__ import division, print_function
 from termcolor import colored
+import csv
+import io
+import json
+import string
 import syslog
 import six
 from glogcli import utils
+from glogcli.dateutils import render_timestamp
 
 
 class Formatter(object):
@@ -17,64 +22,175 @@ class Formatter(object):
     def format(self, entry):
         raise NotImplementedError()
 
+    def header(self):
+        return None
+
     def encode_message(self, message):
         return message.encode('utf8')
 
 
 class TailFormatter(Formatter):
+    """
+    Compiles the format template once into literal text and field getters.
+    """
+
+    def __init__(self, format_template, fields=None, color=True):
+        super(TailFormatter, self).__init__(format_template, fields, color)
+        self.compiled_levels = {}
+        self.shows_environment = u'{' + utils.ENVIRONMENT in six.u(format_template)
+        self.pieces = self._compile(six.u(format_template))
 
     def format(self, entry):
-        message = entry.message
-        timestamp = entry.timestamp.to("local")
-        source = entry.message_dict.get("source", "")
-        facility = entry.message_dict.get("facility", "")
-        custom_fields = list(self.fields)
+        name, prefix, suffix = self._level(entry.level)
+        if self.pieces is None:
+            log = self._format_fallback(entry, name)
+        else:
+            parts = []
+            for literal, getter, spec in self.pieces:
+                parts.append(literal)
+                if getter is not None:
+                    parts.append(format(getter(entry, name), spec))
+            log = u''.join(parts)
+
+        if self.color:
+            log = prefix + log + suffix
+        if entry.environment is not None and not self.shows_environment:
+            log = u'[' + entry.environment + u'] ' + log
+        return log
+
+    def _compile(self, template):
+        pieces = []
+        for literal, field, spec, conversion in string.Formatter().parse(template):
+            if field is None:
+                pieces.append((literal, None, None))
+            elif not field or conversion or '.' in field or '[' in field:
+                return None
+            else:
+                pieces.append((literal, self._getter(field), spec))
+        return pieces
+
+    def _getter(self, field):
+        if field == utils.TIMESTAMP:
+            return lambda entry, level_name: render_timestamp(entry.timestamp)
+        elif field == utils.LEVEL:
+            return lambda entry, level_name: level_name
+        elif field == utils.MESSAGE:
+            return lambda entry, level_name: self.encode_message(entry.message)
+        elif field == utils.ENVIRONMENT:
+            return lambda entry, level_name: entry.environment or ""
+        else:
+            return lambda entry, level_name: entry.message_dict.get(field, "")
+
+    def _level(self, level):
+        compiled = self.compiled_levels.get(level)
+        if compiled is None:
+            log_level = LogLevel.find_by_syslog_code(level)
+            prefix, suffix = colored(u'\0', log_level['color'], log_level['bg_color']).split(u'\0')
+            compiled = self.compiled_levels[level] = (log_level['name'], prefix, suffix)
+        return compiled
 
-        log_level = LogLevel.find_by_syslog_code(entry.level)
+    def _format_fallback(self, entry, level_name):
         args = {
-            'timestamp': timestamp.format(utils.DEFAULT_DATE_FORMAT),
-            'level': log_level['name'],
-            'message': self.encode_message(message),
-            'source': source,
-            'facility': facility
+            'timestamp': render_timestamp(entry.timestamp),
+            'level': level_name,
+            'message': self.encode_message(entry.message),
+            'source': entry.message_dict.get("source", ""),
+            'facility': entry.message_dict.get("facility", ""),
+            'environment': entry.environment or ""
         }
 
-        for field in custom_fields:
+        for field in self.fields:
             if field not in self.DEFAULT_FIELDS:
                 args[field] = entry.message_dict.get(field, '')
 
-        log = six.u(self.format_template).format(**args)
-
-        if self.color:
-            return colored(log, log_level['color'], log_level['bg_color'])
-        else:
-            return log
+        return six.u(self.format_template).format(**args)
 
 
 class DumpFormatter(Formatter):
 
     def format(self, entry):
+        formatted_fields = self.format_fields(entry)
+        return ";".join(map(lambda f: "'{val}'".format(val=formatted_fields.get(f)), self.fields))
+
+    def format_fields(self, entry):
         formatted_fields = dict()
         for field in self.fields:
             if field == 'timestamp':
-                field_value = entry.timestamp.to('local').format(utils.DEFAULT_DATE_FORMAT)
+                field_value = render_timestamp(entry.timestamp)
             elif field == 'level':
                 field_value = LogLevel.find_by_syslog_code(entry.level).get('name')
+            elif field == utils.ENVIRONMENT:
+                field_value = entry.environment or ""
             else:
                 field_value = entry.message_dict.get(field, "")
             formatted_fields[field] = field_value
-        return ";".join(map(lambda f: "'{val}'".format(val=formatted_fields.get(f)), self.fields))
+        return formatted_fields
+
+
+class CsvFormatter(DumpFormatter):
+
+    DIALECT = 'excel'
+
+    def __init__(self, format_template, fields=None, color=True):
+        super(CsvFormatter, self).__init__(format_template, fields, color)
+        self.buffer = io.BytesIO() if six.PY2 else io.StringIO()
+        self.writer = csv.writer(self.buffer, dialect=self.DIALECT, lineterminator='')
+
+    def header(self):
+        return self.row(self.fields)
+
+    def format(self, entry):
+        formatted_fields = self.format_fields(entry)
+        return self.row([formatted_fields.get(f) for f in self.fields])
+
+    def row(self, values):
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        if six.PY2:
+            values = [v.encode(utils.UTF8) if isinstance(v, six.text_type) else v for v in values]
+            self.writer.writerow(values)
+            return self.buffer.getvalue().decode(utils.UTF8)
+        self.writer.writerow(values)
+        return self.buffer.getvalue()
+
+
+class TsvFormatter(CsvFormatter):
+
+    DIALECT = 'excel-tab'
+
+
+class NdjsonFormatter(DumpFormatter):
+
+    def format(self, entry):
+        formatted_fields = dict()
+        for field in self.fields:
+            if field == 'timestamp':
+                formatted_fields[field] = entry.timestamp.isoformat()
+            elif field == 'level':
+                formatted_fields[field] = LogLevel.find_by_syslog_code(entry.level).get('name')
+            elif field == utils.ENVIRONMENT:
+                formatted_fields[field] = entry.environment
+            else:
+                formatted_fields[field] = entry.message_dict.get(field)
+        return six.text_type(json.dumps(formatted_fields, sort_keys=True))
 
 
 class FormatterFactory(object):
 
+    DUMP_FORMATTERS = {
+        'csv': CsvFormatter,
+        'tsv': TsvFormatter,
+        'ndjson': NdjsonFormatter,
+        'quoted': DumpFormatter,
+    }
+
     @staticmethod
-    def get_formatter(mode, cfg, format_template, fields, color):
+    def get_formatter(mode, cfg, format_template, fields, color, dump_format='quoted'):
         format_template = FormatterFactory.get_message_format_template(cfg, format_template)
         if mode == "tail":
             return TailFormatter(format_template=format_template, fields=fields, color=color)
         elif mode == "dump":
-            return DumpFormatter(format_template=format_template, fields=fields)
+            return FormatterFactory.DUMP_FORMATTERS[dump_format](format_template=format_template, fields=fields)
 
     @staticmethod
     def get_message_format_template(cfg, format_template_name):
@@ -1,31 +1,74 @@
 from __future__ import division, print_function
+import json
 import re
+import threading
+import time
 import click
-import requests
 import arrow
 import syslog
 import six
-from glogcli import utils
-from glogcli.dateutils import datetime_converter
+from glogcli import stats, utils
+from glogcli.dateutils import datetime_converter, iso_timestamp_parser, iso_epoch_seconds, render_timestamp
 from glogcli.utils import cli_error, store_password_in_keyring, get_password_from_keyring
 from glogcli.formats import LogLevel
 from glogcli.input import CliInterface
+from glogcli.jsonstream import iter_json_object
+
+STREAMS_FILTER = re.compile(r'^streams:(\S+)((?: OR streams:\S+)*)$')
 
 
 class Message(object):
 
-    def __init__(self, message_dict={}):
-        self.message_dict = dict(message_dict[utils.MESSAGE])
-        self.timestamp = arrow.get(self.message_dict.get("timestamp", None))
-        self.level = self.message_dict.get("level", syslog.LOG_INFO)
-        self.message = self.message_dict.get(utils.MESSAGE, "")
+    __slots__ = ('message_dict', '_timestamp', '_level', 'environment')
+
+    def __init__(self, message_dict={}, environment=None):
+        self.message_dict = message_dict[utils.MESSAGE]
+        self._timestamp = None
+        self._level = None
+        self.environment = environment
+
+    @property
+    def timestamp(self):
+        if self._timestamp is None:
+            self._timestamp = iso_timestamp_parser(self.message_dict.get("timestamp", None))
+        return self._timestamp
+
+    @timestamp.setter
+    def timestamp(self, timestamp):
+        self._timestamp = timestamp
+
+    def epoch_seconds(self):
+        """
+        Returns the whole epoch seconds of the timestamp, parsing the payload only when the timestamp wasn't parsed yet.
+        """
+        if self._timestamp is not None:
+            return self._timestamp.timestamp
+        return iso_epoch_seconds(self.message_dict.get("timestamp", None))
+
+    @property
+    def level(self):
+        if self._level is None:
+            self._level = self.message_dict.get("level", syslog.LOG_INFO)
+        return self._level
+
+    @level.setter
+    def level(self, level):
+        self._level = level
+
+    @property
+    def message(self):
+        return self.message_dict.get(utils.MESSAGE, "")
 
 
 class SearchResult(object):
 
-    def __init__(self, result_dict={}):
-        self.query = result_dict.get("query", None)
+    def __init__(self, result_dict={}, messages=None):
         self.query_object = None
+        self._load(result_dict)
+        self.messages = list(map(Message, result_dict.get("messages", []))) if messages is None else messages
+
+    def _load(self, result_dict):
+        self.query = result_dict.get("query", None)
         self.used_indices = result_dict.get("used_indices", None)
         self.queried_range = result_dict.get("queried_range", None)
         self.range_from = arrow.get(result_dict.get("from", None))
@@ -33,7 +76,74 @@ class SearchResult(object):
         self.range_duration = result_dict.get("time", None)
         self.fields = result_dict.get("fields", [])
         self.total_results = result_dict.get("total_results", None)
-        self.messages = list(map(Message, result_dict.get("messages", [])))
+
+    @staticmethod
+    def from_stream(chunks):
+        """
+        Builds a result whose messages are decoded one by one from the response text chunks.
+        """
+        result = SearchResult(messages=[])
+        result.messages = result._stream_messages(chunks)
+        if stats.current is not None:
+            result.messages = stats.current.timed(result.messages, "decode")
+        return result
+
+    def _stream_messages(self, chunks):
+        members = {}
+        for message in iter_json_object(chunks, "messages", members):
+            yield Message(message)
+        self._load(members)
+
+
+class TermsResult(object):
+    """
+    Most frequent values of a field, sorted by decreasing count.
+    """
+
+    def __init__(self, result_dict={}):
+        self.terms = sorted(six.iteritems(result_dict.get("terms", {})), key=lambda term: (-term[1], term[0]))
+        self.missing = result_dict.get("missing", 0)
+        self.other = result_dict.get("other", 0)
+        self.total = result_dict.get("total", 0)
+
+    @staticmethod
+    def merge(results, size):
+        """
+        Adds up the terms of several results, the merged counts are lower bounds.
+        """
+        terms = {}
+        merged = TermsResult()
+        for result in results:
+            for term, count in result.terms:
+                terms[term] = terms.get(term, 0) + count
+            merged.missing += result.missing
+            merged.other += result.other
+            merged.total += result.total
+        ordered = TermsResult({"terms": terms}).terms
+        merged.terms = ordered[:size]
+        merged.other += sum(count for _, count in ordered[size:])
+        return merged
+
+
+class HistogramResult(object):
+    """
+    Number of messages per time bucket, as (bucket start in epoch seconds, count) pairs in time order.
+    """
+
+    def __init__(self, result_dict={}):
+        self.interval = result_dict.get("interval")
+        self.buckets = sorted((int(start), count) for start, count in six.iteritems(result_dict.get("results", {})))
+
+    @staticmethod
+    def merge(results):
+        buckets = {}
+        merged = HistogramResult()
+        for result in results:
+            merged.interval = merged.interval or result.interval
+            for start, count in result.buckets:
+                buckets[start] = buckets.get(start, 0) + count
+        merged.buckets = sorted(buckets.items())
+        return merged
 
 
 class SearchRange(object):
@@ -56,6 +166,29 @@ class SearchRange(object):
             return 1
         return range
 
+    def absolute_bounds(self):
+        now = arrow.now(utils.LOCAL_TIMEZONE)
+        if self.is_relative():
+            return now.replace(seconds=-self.range_in_seconds()), now
+        return self.from_time, self.to_time or now
+
+    def split(self, parts):
+        """
+        Splits the range into at most `parts` absolute, non-overlapping sub-ranges in ascending order.
+        """
+        from_time, to_time = self.absolute_bounds()
+        total_ms = int((to_time - from_time).total_seconds() * 1000)
+        parts = max(1, min(parts, total_ms))
+        step = total_ms // parts
+
+        ranges = []
+        for i in range(parts):
+            start = from_time.replace(microseconds=+i * step * 1000)
+            # graylog ranges include both ends, each sub-range stops a millisecond before the next
+            end = to_time if i == parts - 1 else from_time.replace(microseconds=+((i + 1) * step - 1) * 1000)
+            ranges.append(SearchRange(from_time=start, to_time=end))
+        return ranges
+
 
 class SearchQuery(object):
 
@@ -87,10 +220,27 @@ class SearchQuery(object):
     def copy_with_range(self, search_range):
         return SearchQuery(search_range, self.query, self.limit, self.offset, self.filter, self.fields, self.sort, self.ascending)
 
+    def streams(self):
+        """
+        Returns the ids of the streams the filter selects, empty unless the filter is one or more ORed stream terms.
+        """
+        match = STREAMS_FILTER.match(self.filter or "")
+        if not match:
+            return []
+        return [match.group(1)] + re.findall(r' OR streams:(\S+)', match.group(2))
+
+    def copy_with_filter(self, filter):
+        return SearchQuery(self.search_range, self.query, self.limit, self.offset, filter, self.fields, self.sort, self.ascending)
+
+    def copy_with_sort(self, sort, ascending):
+        return SearchQuery(self.search_range, self.query, self.limit, self.offset, self.filter, self.fields, sort, ascending)
+
 
 class GraylogAPI(object):
 
-    def __init__(self, host, port, username, api_path=utils.DEFAULT_API_PATH, password=None, host_tz='local', default_stream=None, scheme='http', proxies=None):
+    def __init__(self, host, port, username, api_path=utils.DEFAULT_API_PATH, password=None, host_tz='local', default_stream=None, scheme='http', proxies=None,
+                 pool_size=utils.DEFAULT_POOL_SIZE, timeout=utils.DEFAULT_TIMEOUT, keep_alive=True,
+                 page_size=utils.DEFAULT_PAGE_SIZE, max_result_window=utils.DEFAULT_MAX_RESULT_WINDOW, max_workers=utils.DEFAULT_MAX_WORKERS):
         self.host = host
         self.port = port
         if api_path.endswith("/") or len(api_path) == 0:
@@ -98,30 +248,94 @@ class GraylogAPI(object):
         else:
             self.api_path = api_path + "/"
         self.username = username
-        self.password = password
         self.user = None
         self.host_tz = host_tz
         self.default_stream = default_stream
         self.proxies = proxies
-        self.get_header = {"Accept": "application/json"}
+        self.timeout = timeout
+        self.page_size = page_size
+        self.max_result_window = max_result_window
+        self.max_workers = max_workers
+        self.cache = None
+        self.metadata_cache = None
+        self.metadata = {}
+        self.get_header = {"Accept": "application/json", "Accept-Encoding": "gzip, deflate"}
+        if not keep_alive:
+            self.get_header["Connection"] = "close"
         self.base_url = "{scheme}://{host}:{port}/{api_path}".format(host=host, port=port, scheme=scheme, api_path=api_path)
+        self.session = self._build_session(max(pool_size, max_workers))
+        self.password = password
+
+    def _build_session(self, pool_size):
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update(self.get_header)
+        if self.proxies:
+            session.proxies.update(self.proxies)
+        return session
+
+    @property
+    def password(self):
+        return self._password
+
+    @password.setter
+    def password(self, password):
+        self._password = password
+        self.session.auth = (self.username, password)
+
+    def close(self):
+        self.session.close()
 
     def update_host_timezone(self, timezone):
         if timezone:
             self.host_tz = timezone
 
-    def get(self, url, **kwargs):
+    def get(self, url, stream=False, cache=False, **kwargs):
         params = {}
 
         for label, item in six.iteritems(kwargs):
             if isinstance(item, list):
                 params[label + "[]"] = item
-            else:
+            elif item is not None:
                 params[label] = item
 
-        r = requests.get(self.base_url + url, params=params, headers=self.get_header, auth=(self.username, self.password), proxies=self.proxies)
-        if r.status_code == requests.codes.ok:
-            return r.json()
+        cache_key = None
+        if cache and self.cache is not None:
+            cache_key = self.cache.key(self.base_url + url, self.username, params)
+            chunks = self.cache.read(cache_key)
+            if chunks is not None:
+                return chunks if stream else json.loads(u"".join(chunks))
+
+        from requests.exceptions import RequestException
+        run_stats = stats.current
+        started = time.time()
+        try:
+            r = self.session.get(self.base_url + url, params=params, timeout=self.timeout, stream=stream)
+        except RequestException as e:
+            self._request_failed(url, e)
+        if run_stats is not None:
+            run_stats.add("request", time.time() - started)
+            run_stats.count("requests")
+        if r.status_code == 200:
+            if stream:
+                r.encoding = r.encoding or utils.UTF8
+                chunks = self._read_chunks(url, r.iter_content(chunk_size=utils.STREAM_CHUNK_SIZE, decode_unicode=True))
+                if run_stats is not None:
+                    chunks = run_stats.receive(r, chunks)
+                return chunks if cache_key is None else self.cache.write_through(cache_key, chunks)
+            if cache_key is not None:
+                self.cache.store(cache_key, r.text)
+            if run_stats is None:
+                return r.json()
+            run_stats.count("bytes", r.raw.tell())
+            started = time.time()
+            result = r.json()
+            run_stats.add("decode", time.time() - started)
+            return result
         elif r.status_code == 401:
             click.echo("API error: {} Message: User authorization denied.".format(r.status_code))
             exit()
@@ -129,62 +343,190 @@ class GraylogAPI(object):
             click.echo("API error: URL: {} Status: {} Message: {}".format(self.base_url + url, r.status_code, r.content))
             exit()
 
-    def search(self, query, fetch_all=False):
-        sort = None
-        if query.sort is not None:
-            if query.ascending:
-                sort = query.sort + ":asc"
-            else:
-                sort = query.sort + ":desc"
+    def _read_chunks(self, url, chunks):
+        from requests.exceptions import RequestException
+        try:
+            for chunk in chunks:
+                yield chunk
+        except RequestException as e:
+            self._request_failed(url, e)
+
+    def _request_failed(self, url, error):
+        click.echo("API error: URL: {} Message: {} (requests wait at most the environment's timeout option, "
+                   "{} seconds)".format(self.base_url + url, error, self.timeout))
+        exit()
 
+    def search(self, query, fetch_all=False):
         if fetch_all and query.limit is None:
+            result = None
+            messages = []
+            for page in self.search_pages(query):
+                result = result or page
+                messages.extend(page.messages)
+            if result is None:
+                # an offset past the max result window leaves nothing to page through
+                result = SearchResult({"query": query.query, "total_results": 0})
+            result.messages = messages
+        else:
             result = self.search_raw(
-                query.query, query.search_range, 1, query.offset, query.filter, query.fields, sort
+                query.query, query.search_range, query.limit, query.offset, query.filter, query.fields, self._sort_param(query)
             )
 
-            sr = SearchRange(from_time=result.range_from, to_time=result.range_to)
+        result.query_object = query
+        return result
 
-            if result.total_results > 10000:
-                raise RuntimeError("Query returns more than 10000 log entries. Use offsets to query in chunks.")
+    def search_messages(self, query, page_size=None):
+        for page in self.search_pages(query, page_size):
+            for message in page.messages:
+                yield message
+
+    def search_pages(self, query, page_size=None):
+        """
+        Walks the query result page by page, by timestamp ascending unless the query asks for another sort.
+        """
+        page_size = page_size or self.page_size
+        sort = self._sort_param(query) or "timestamp:asc"
+        by_timestamp = sort.startswith("timestamp:")
+        descending = sort.endswith(":desc")
+
+        from_time, to_time = query.search_range.absolute_bounds()
+        fields = query.fields
+        if fields is not None:
+            fields = list(fields) + [f for f in (utils.TIMESTAMP, utils.ID) if f not in fields]
 
-            result = self.search_raw(
-                query.query, sr, result.total_results, query.offset, query.filter, query.fields, sort
-            )
+        offset = query.offset or 0
+        walk = _PageWalk()
 
-        else:
-            result = self.search_raw(
-                query.query, query.search_range, query.limit, query.offset, query.filter, query.fields, sort
+        while True:
+            limit = min(page_size, self.max_result_window - offset)
+            if limit <= 0:
+                return
+            page = self.search_raw(
+                query.query, SearchRange(from_time=from_time, to_time=to_time), limit, offset, query.filter, fields, sort, stream=True
             )
+            page.messages = walk.messages(page.messages)
+            page.query_object = query
+            yield page
+
+            # the page must be read to the end before the walk can go on
+            for _ in page.messages:
+                pass
+
+            if walk.received < limit:
+                return
+
+            offset += walk.received
+            if offset >= self.max_result_window:
+                if not by_timestamp:
+                    click.echo("[WARNING] - Stopped after {} messages, the server does not page further "
+                               "for sort '{}'.".format(self.max_result_window, sort), err=True)
+                    return
+                if descending:
+                    to_time = walk.restart_at(to_time, -1)
+                else:
+                    from_time = walk.restart_at(from_time, +1)
+                offset = 0
 
-        result.query_object = query
-        return result
+    @staticmethod
+    def _sort_param(query):
+        if query.sort is None:
+            return None
+        return query.sort + (":asc" if query.ascending else ":desc")
 
     def user_info(self):
         if not self.user:
-            self.user = self.get(url=("users/" + self.username))
+            # never read from the metadata cache, fetching it checks the credentials before any search
+            self.user = self._get_metadata("user_info", "users/" + self.username, cached=False)
         return self.user
 
     def streams(self):
-        return self.get(url="streams/enabled")
+        return self._get_metadata("streams", "streams/enabled")
 
     def get_saved_queries(self):
-        return self.get(url="search/saved")
-
-    def search_raw(self, query, search_range, limit=None, offset=None, filter=None, fields=None, sort=None):
+        return self._get_metadata("saved_queries", "search/saved")
+
+    def _get_metadata(self, name, url, cached=True):
+        if name not in self.metadata:
+            data = None
+            if cached and self.metadata_cache is not None:
+                data = self.metadata_cache.read(self.base_url, self.username, name)
+            if data is None:
+                data = self.get(url=url)
+                if cached and self.metadata_cache is not None:
+                    self.metadata_cache.write(self.base_url, self.username, name, data)
+            self.metadata[name] = data
+        return self.metadata[name]
+
+    def prefetch_metadata(self, methods):
+        """
+        Calls the given metadata methods (e.g. "user_info", "streams") concurrently.
+        """
+        errors = []
+
+        def fetch(method):
+            try:
+                getattr(self, method)()
+            except BaseException as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=fetch, args=(method,)) for method in methods]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def count(self, query):
+        """
+        Returns the number of messages matching the query, without fetching them.
+        """
+        return self.search_raw(query.query, query.search_range, 1, None, query.filter, [utils.TIMESTAMP]).total_results
+
+    def terms(self, query, field, size=utils.DEFAULT_TOP_SIZE):
+        """
+        Returns the `size` most frequent values of a field among the messages matching the query.
+        """
+        return TermsResult(self._aggregate("terms", query, field=field, size=size))
+
+    def histogram(self, query, interval=utils.DEFAULT_HISTOGRAM_INTERVAL):
+        """
+        Returns the number of messages matching the query per `interval` (minute, hour, day, week, month, quarter or year).
+        """
+        return HistogramResult(self._aggregate("histogram", query, interval=interval))
+
+    def _aggregate(self, endpoint, query, **kwargs):
+        # aggregations live next to the search endpoints, e.g. search/universal/relative/terms
+        url, range_args, filter, cache = self._search_params(query.search_range, query.filter)
+        kwargs.update(range_args)
+        return self.get(url=url + "/" + endpoint, query=query.query, filter=filter, cache=cache, **kwargs)
+
+    def _search_params(self, search_range, filter):
+        """
+        Returns the search url, range parameters and filter of a search, and whether it may be cached.
+        """
         url = "search/universal/"
         range_args = {}
 
         if filter is None and self.default_stream is not None:
             filter = "streams:{}".format(self.default_stream)
 
+        cache = False
         if search_range.is_relative():
             url += "relative"
             range_args["range"] = search_range.range_in_seconds()
         else:
+            # ranges that ended long enough ago no longer change and can be served from the cache
+            cache = search_range.to_time is not None and search_range.to_time < arrow.now().replace(seconds=-utils.CACHE_MIN_AGE)
             url += "absolute"
-            range_args["from"] = search_range.from_time.to(self.host_tz).format(utils.DEFAULT_DATE_FORMAT)
-            to_time = arrow.now(self.host_tz) if search_range.to_time is None else search_range.to_time.to(self.host_tz)
-            range_args["to"] = to_time.format(utils.DEFAULT_DATE_FORMAT)
+            range_args["from"] = render_timestamp(search_range.from_time, self.host_tz)
+            to_time = arrow.now(self.host_tz) if search_range.to_time is None else search_range.to_time
+            range_args["to"] = render_timestamp(to_time, self.host_tz)
+
+        return url, range_args, filter, cache
+
+    def search_raw(self, query, search_range, limit=None, offset=None, filter=None, fields=None, sort=None, stream=False):
+        url, range_args, filter, cache = self._search_params(search_range, filter)
 
         if fields is not None:
             fields = ",".join(fields)
@@ -197,16 +539,50 @@ class GraylogAPI(object):
             filter=filter,
             fields=fields,
             sort=sort,
+            stream=stream,
+            cache=cache,
             **range_args
         )
 
+        if stream:
+            return SearchResult.from_stream(result)
         return SearchResult(result)
 
 
+class _PageWalk(object):
+    """
+    Tracks the last timestamp yielded by a page walk and the ids yielded at it.
+    """
+
+    def __init__(self):
+        self.boundary = None
+        self.boundary_ids = set()
+        self.received = 0
+
+    def messages(self, messages):
+        self.received = 0
+        for message in messages:
+            self.received += 1
+            message_id = message.message_dict.get(utils.ID)
+            if message.timestamp == self.boundary:
+                if message_id in self.boundary_ids:
+                    continue
+            else:
+                self.boundary, self.boundary_ids = message.timestamp, set()
+            self.boundary_ids.add(message_id)
+            yield message
+
+    def restart_at(self, previous, direction):
+        if self.boundary == previous:
+            # a whole result window shares one timestamp, step over it to keep making progress
+            self.boundary, self.boundary_ids = self.boundary.replace(microseconds=direction * 1000), set()
+        return self.boundary
+
+
 class GraylogAPIFactory(object):
 
     @staticmethod
-    def get_graylog_api(cfg, environment, host, password, port, proxy, no_tls, username, keyring):
+    def get_graylog_api(cfg, environment, host, password, port, proxy, no_tls, username, keyring, metadata_cache=None, prefetch=()):
         gl_api = None
 
         scheme = "https"
@@ -214,16 +590,13 @@ class GraylogAPIFactory(object):
         if no_tls:
             scheme = "http"
 
-        if scheme == "https" and port is None:
-            port = 443
-        port = port or 80
-
         proxies = {scheme: proxy} if proxy else None
 
         if environment is not None:
             gl_api = GraylogAPIFactory.api_from_config(cfg, environment, port, proxies, no_tls, username)
         else:
             if host is not None:
+                port = port or GraylogAPIFactory.default_port(scheme)
                 if username is None:
                     username = CliInterface.prompt_username(scheme, host, port)
 
@@ -247,10 +620,18 @@ class GraylogAPIFactory(object):
         if keyring:
             store_password_in_keyring(gl_api.host, gl_api.username, password)
 
+        gl_api.metadata_cache = metadata_cache
+        if gl_api.default_stream:
+            prefetch = [method for method in prefetch if method != "streams"]
+        gl_api.prefetch_metadata(["user_info"] + list(prefetch))
         gl_api.update_host_timezone(gl_api.user_info().get('timezone'))
 
         return gl_api
 
+    @staticmethod
+    def default_port(scheme):
+        return 443 if scheme == "https" else 80
+
     @staticmethod
     def api_from_host(host, port, username, password, scheme, proxies=None, tls=True):
         scheme = "https" if tls else "http"
@@ -279,6 +660,9 @@ class GraylogAPIFactory(object):
         if no_tls:
             scheme = "http"
 
+        # the port of each environment comes from its own section unless --port is given
+        port = port or GraylogAPIFactory.default_port(scheme)
+
         if not username and cfg.has_option(section_name, utils.USERNAME):
             username = cfg.get(section_name, utils.USERNAME)
         elif not username:
@@ -291,6 +675,28 @@ class GraylogAPIFactory(object):
         if cfg.has_option(section_name, utils.DEFAULT_STREAM):
             default_stream = cfg.get(section_name, utils.DEFAULT_STREAM)
 
+        pool_size = utils.DEFAULT_POOL_SIZE
+        if cfg.has_option(section_name, utils.POOL_SIZE):
+            pool_size = cfg.getint(section_name, utils.POOL_SIZE)
+
+        timeout = utils.DEFAULT_TIMEOUT
+        if cfg.has_option(section_name, utils.TIMEOUT):
+            timeout = cfg.getfloat(section_name, utils.TIMEOUT)
+
+        keep_alive = True
+        if cfg.has_option(section_name, utils.KEEP_ALIVE):
+            keep_alive = cfg.getboolean(section_name, utils.KEEP_ALIVE)
+
+        max_result_window = utils.DEFAULT_MAX_RESULT_WINDOW
+        if cfg.has_option(section_name, utils.MAX_RESULT_WINDOW):
+            max_result_window = cfg.getint(section_name, utils.MAX_RESULT_WINDOW)
+
+        max_workers = utils.DEFAULT_MAX_WORKERS
+        if cfg.has_option(section_name, utils.MAX_WORKERS):
+            max_workers = cfg.getint(section_name, utils.MAX_WORKERS)
+
         return GraylogAPI(
-            host=host, port=port, api_path=api_path, username=username, default_stream=default_stream, scheme=scheme, proxies=proxies
+            host=host, port=port, api_path=api_path, username=username, default_stream=default_stream, scheme=scheme, proxies=proxies,
+            pool_size=pool_size, timeout=timeout, keep_alive=keep_alive, max_result_window=max_result_window,
+            max_workers=max_workers
         )
@@ -0,0 +1,81 @@
+from __future__ import division, print_function
+import syslog
+from array import array
+import six
+from glogcli.formats import LogLevel
+
+numpy = None
+
+
+def import_numpy():
+    """
+    Imports numpy on first use, it is an optional dependency. Returns None when it is not installed.
+    """
+    global numpy
+    if numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            return None
+    return numpy
+
+
+class LevelHistogram(object):
+    """
+    Number of messages per time bucket and syslog level.
+    """
+
+    LEVELS = 8
+    # LogLevel only names the levels glogcli colors
+    UNNAMED_LEVELS = {syslog.LOG_EMERG: 'EMERGENCY', syslog.LOG_ALERT: 'ALERT'}
+
+    def __init__(self, bucket_seconds, use_numpy=True):
+        self.bucket_seconds = bucket_seconds
+        self.seconds = array('l')
+        self.levels = array('b')
+        self.numpy = import_numpy() if use_numpy else None
+        self.messages = 0
+
+    @staticmethod
+    def level_name(level):
+        return LogLevel.find_by_syslog_code(level).get('name') or LevelHistogram.UNNAMED_LEVELS.get(level, str(level))
+
+    def consume(self, messages):
+        append_second = self.seconds.append
+        append_level = self.levels.append
+        for message in messages:
+            append_second(message.epoch_seconds())
+            level = message.level
+            # levels outside the syslog codes are counted as info, the level of messages without one
+            append_level(level if isinstance(level, six.integer_types) and 0 <= level < self.LEVELS else syslog.LOG_INFO)
+        self.messages = len(self.seconds)
+        return self
+
+    def counts(self):
+        """
+        Returns the start of every bucket from the first to the last message and its per level counts.
+        """
+        if not self.seconds:
+            return [], []
+        if self.numpy is not None:
+            return self._numpy_counts()
+
+        width = self.bucket_seconds
+        first = min(self.seconds) // width
+        buckets = max(self.seconds) // width - first + 1
+        flat = [0] * (buckets * self.LEVELS)
+        for second, level in zip(self.seconds, self.levels):
+            flat[(second // width - first) * self.LEVELS + level] += 1
+        starts = [(first + i) * width for i in range(buckets)]
+        return starts, [flat[i * self.LEVELS:(i + 1) * self.LEVELS] for i in range(buckets)]
+
+    def _numpy_counts(self):
+        np = self.numpy
+        seconds = np.frombuffer(self.seconds, dtype='i{}'.format(self.seconds.itemsize))
+        levels = np.frombuffer(self.levels, dtype=np.int8)
+        buckets = seconds // self.bucket_seconds
+        first = int(buckets.min())
+        size = int(buckets.max()) - first + 1
+        flat = np.bincount((buckets - first) * self.LEVELS + levels, minlength=size * self.LEVELS)
+        starts = [(first + i) * self.bucket_seconds for i in range(size)]
+        return starts, flat.reshape(size, self.LEVELS).tolist()
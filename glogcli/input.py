@@ -32,7 +32,11 @@ class CliInterface(object):
                 CliInterface.select_stream(graylog_api, stream)
 
         if stream and stream != '*':
-            return "streams:{}".format(stream)
+            return CliInterface.streams_filter(stream.split(","))
+
+    @staticmethod
+    def streams_filter(streams):
+        return " OR ".join("streams:{}".format(s.strip()) for s in streams if s.strip())
 
     @staticmethod
     def select_saved_query(graylog_api):
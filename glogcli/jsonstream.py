@@ -0,0 +1,104 @@
+from __future__ import division, print_function
+import json
+import re
+import six
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+NUMBER_TAIL = re.compile(r'[0-9.eE+-]*')
+DECODER = json.JSONDecoder()
+
+
+class ChunkReader(object):
+    """
+    Reads JSON tokens from an iterable of text chunks, keeping only the undecoded tail of the stream in memory.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = u''
+        self.pos = 0
+
+    def _fill(self):
+        for chunk in self.chunks:
+            if chunk:
+                self.buffer = self.buffer[self.pos:] + chunk
+                self.pos = 0
+                return True
+        return False
+
+    def _skip_whitespace(self):
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or not self._fill():
+                return
+
+    def peek(self):
+        self._skip_whitespace()
+        if self.pos >= len(self.buffer):
+            raise ValueError("Unexpected end of JSON stream")
+        return self.buffer[self.pos]
+
+    def next_char(self):
+        char = self.peek()
+        self.pos += 1
+        return char
+
+    def expect_end(self):
+        self._skip_whitespace()
+        if self.pos < len(self.buffer):
+            raise ValueError("Extra data after the end of the JSON stream")
+
+    def expect(self, chars):
+        char = self.next_char()
+        if char not in chars:
+            raise ValueError("Expected one of '{}' but found '{}' in JSON stream".format(chars, char))
+        return char
+
+    def decode(self):
+        self._skip_whitespace()
+        while True:
+            try:
+                value, end = DECODER.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if not self._fill():
+                    raise
+                continue
+
+            # a number running up to the end of the buffer may continue in the next chunk
+            if isinstance(value, six.integer_types + (float,)) and NUMBER_TAIL.match(self.buffer, end).end() == len(self.buffer):
+                if self._fill():
+                    continue
+
+            self.pos = end
+            return value
+
+
+def iter_json_object(chunks, array_key, members):
+    """
+    Yields the items of the `array_key` array of a JSON object read from text chunks.
+    """
+    reader = ChunkReader(chunks)
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.next_char()
+        reader.expect_end()
+        return
+
+    while True:
+        key = reader.decode()
+        reader.expect(':')
+        if key == array_key:
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.next_char()
+            else:
+                while True:
+                    yield reader.decode()
+                    if reader.expect(',]') == ']':
+                        break
+        else:
+            members[key] = reader.decode()
+
+        if reader.expect(',}') == '}':
+            reader.expect_end()
+            return
@@ -0,0 +1,149 @@
+from __future__ import division, print_function
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from glogcli import utils
+from glogcli.dateutils import epoch_millis
+from glogcli.graylog_api import Message, SearchResult
+
+TERM = re.compile(r'(?:([\w.]+):)?("[^"]*"|\S+)')
+
+
+class LocalMirror(object):
+    """
+    Local copy of Graylog messages in SQLite, answering the search calls LogPrinter makes on GraylogAPI.
+    """
+
+    COLUMNS = {utils.ID: "id", utils.TIMESTAMP: "timestamp", utils.LEVEL: "level", utils.SOURCE: "source"}
+
+    def __init__(self, path=utils.DEFAULT_MIRROR_PATH):
+        self.path = os.path.expanduser(path)
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.connection = sqlite3.connect(self.path)
+        self.host_tz = utils.LOCAL_TIMEZONE
+        self._create_schema()
+
+    def _create_schema(self):
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "id TEXT PRIMARY KEY, timestamp INTEGER NOT NULL, level INTEGER, source TEXT, streams TEXT, payload TEXT NOT NULL)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS messages_timestamp ON messages (timestamp)")
+            self.connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts4(message)")
+
+    def close(self):
+        self.connection.close()
+
+    def sync(self, api, query, page_size=utils.DEFAULT_PAGE_SIZE):
+        """
+        Stores the messages matching the query, committing once per page. Messages already in the mirror are skipped.
+        """
+        stored = 0
+        page = []
+        for message in api.search_messages(query):
+            page.append(message)
+            if len(page) >= page_size:
+                stored += self.store(page)
+                page = []
+        return stored + self.store(page)
+
+    def store(self, messages):
+        stored = 0
+        with self.connection:
+            for message in messages:
+                message_dict = message.message_dict
+                streams = message_dict.get("streams") or []
+                cursor = self.connection.execute(
+                    "INSERT OR IGNORE INTO messages (id, timestamp, level, source, streams, payload) VALUES (?, ?, ?, ?, ?, ?)",
+                    (self.key(message), epoch_millis(message.timestamp), message.level,
+                     message_dict.get(utils.SOURCE), " {} ".format(" ".join(streams)), json.dumps(message_dict))
+                )
+                if cursor.rowcount == 1:
+                    self.connection.execute("INSERT INTO messages_fts (docid, message) VALUES (?, ?)", (cursor.lastrowid, message.message))
+                    stored += 1
+        return stored
+
+    @staticmethod
+    def key(message):
+        """
+        Returns the message id, or a hash of the timestamp, source and text of messages without one.
+        """
+        message_dict = message.message_dict
+        message_id = message_dict.get(utils.ID)
+        if message_id is not None:
+            return message_id
+        fields = [message_dict.get(field) for field in (utils.TIMESTAMP, utils.SOURCE, utils.MESSAGE)]
+        return "sha1:" + hashlib.sha1(json.dumps(fields).encode(utils.UTF8)).hexdigest()
+
+    def search(self, query, fetch_all=False):
+        limit = None if fetch_all else query.limit
+        result = SearchResult({"query": query.query}, messages=list(self._select(query, limit, descending=not query.ascending)))
+        result.query_object = query
+        result.total_results = len(result.messages)
+        return result
+
+    def search_messages(self, query, page_size=None):
+        descending = query.sort is not None and not query.ascending
+        return self._select(query, query.limit, descending)
+
+    def _select(self, query, limit, descending):
+        conditions, params = self._conditions(query)
+        sql = "SELECT payload FROM messages"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY {} {}".format(self.COLUMNS.get(query.sort, "timestamp"), "DESC" if descending else "ASC")
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        if query.offset:
+            sql += " OFFSET ?" if limit else " LIMIT -1 OFFSET ?"
+            params.append(query.offset)
+
+        try:
+            rows = self.connection.execute(sql, params)
+        except sqlite3.OperationalError as e:
+            utils.cli_error("The local mirror can't run the query '{}' ({}), only terms, quoted phrases, "
+                            "field:value terms and AND are understood with --local.".format(query.query, e))
+        for row in rows:
+            yield Message({utils.MESSAGE: json.loads(row[0])})
+
+    def _conditions(self, query):
+        conditions = []
+        params = []
+
+        from_time, to_time = query.search_range.absolute_bounds()
+        conditions.append("timestamp BETWEEN ? AND ?")
+        params.extend([epoch_millis(from_time), epoch_millis(to_time)])
+
+        streams = query.streams()
+        if streams:
+            conditions.append("(" + " OR ".join(["streams LIKE ?"] * len(streams)) + ")")
+            params.extend("% {} %".format(s) for s in streams)
+
+        fts_terms = []
+        for field, value in TERM.findall(query.query or "*"):
+            if not field and value in ("*", "AND"):
+                continue
+            if not field or field == utils.MESSAGE:
+                fts_terms.append(value)
+                continue
+
+            column = self.COLUMNS.get(field, "CAST(json_extract(payload, '$.{}') AS TEXT)".format(field.replace("'", "")))
+            value = value.strip('"')
+            if value.endswith("*"):
+                conditions.append("{} LIKE ?".format(column))
+                params.append(value[:-1] + "%")
+            else:
+                conditions.append("{} = ?".format(column))
+                params.append(value)
+
+        if fts_terms:
+            conditions.append("rowid IN (SELECT docid FROM messages_fts WHERE messages_fts MATCH ?)")
+            params.append(" ".join(fts_terms))
+
+        return conditions, params
@@ -1,8 +1,16 @@
 from __future__ import division, print_function
+import errno
+import heapq
+import operator
+import os
 import time
 import arrow
+import click
+import six
 from glogcli.graylog_api import SearchRange
-from glogcli.utils import LOCAL_TIMEZONE
+from termcolor import colored
+from glogcli.formats import FormatterFactory, LogLevel, DumpFormatter
+from glogcli import stats, utils
 
 import sys
 
@@ -10,70 +18,398 @@ reload(sys)
 sys.setdefaultencoding('utf8')
 
 
-class SimpleBuffer(object):
+class MessageBuffer(object):
+    """
+    Remembers the ids of printed messages until they fall behind the polling window.
+    """
 
-    def __init__(self):
-        self.buffer = []
+    def __init__(self, max_size=utils.DEFAULT_BUFFER_SIZE):
+        self.max_size = max_size
+        self.timestamps = {}
+        self.expirations = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
-    def insert(self, object):
-        self.buffer.append(object)
+    def __len__(self):
+        return len(self.timestamps)
 
-    def _clean_buffer(self):
-        self.buffer = []
+    def insert(self, object, timestamp):
+        if object in self.timestamps:
+            return
+        timestamp = timestamp.float_timestamp
+        self.timestamps[object] = timestamp
+        heapq.heappush(self.expirations, (timestamp, object))
+        if len(self.timestamps) > self.max_size:
+            self._evict_oldest()
 
     def is_object_buffered(self, object):
-        is_object_buffered = object in self.buffer
-        if len(self.buffer) > 1000:
-            self._clean_buffer()
+        if object in self.timestamps:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def evict_older_than(self, timestamp):
+        timestamp = timestamp.float_timestamp
+        while self.expirations and self.expirations[0][0] < timestamp:
+            self._evict_oldest()
+
+    def _evict_oldest(self):
+        _, object = heapq.heappop(self.expirations)
+        del self.timestamps[object]
+        self.evictions += 1
+
+
+class FollowCursor(object):
+    """
+    High-water mark of follow mode: the newest message timestamp printed so far and the ids printed at it.
+    """
+
+    def __init__(self, timestamp):
+        self.timestamp = timestamp
+        self.ids = set()
 
-        return is_object_buffered
+    def has_seen(self, message):
+        return message.timestamp == self.timestamp and message.message_dict.get(utils.ID) in self.ids
+
+    def advance(self, message):
+        if message.timestamp > self.timestamp:
+            self.timestamp = message.timestamp
+            self.ids = set()
+        if message.timestamp == self.timestamp:
+            self.ids.add(message.message_dict.get(utils.ID))
+
+    def next_range(self, latency):
+        return SearchRange(from_time=self.timestamp.replace(seconds=-latency))
+
+
+class PollingInterval(object):
+    """
+    Polling interval in milliseconds that doubles while polls come back empty and halves while they bring new messages.
+    """
+
+    def __init__(self, minimum=utils.DEFAULT_MIN_INTERVAL, maximum=utils.DEFAULT_MAX_INTERVAL):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.current = minimum
+
+    def update(self, received):
+        if received:
+            self.current = max(self.minimum, self.current // 2)
+        else:
+            self.current = min(self.maximum, self.current * 2)
+        return self.current
+
+
+class OutputClosed(Exception):
+    pass
+
+
+class OutputSink(object):
+    """
+    Buffers formatted lines and writes them out in large chunks.
+    """
+
+    def __init__(self, stream, close_stream=False, buffer_size=utils.OUTPUT_BUFFER_SIZE, flush_interval=utils.OUTPUT_FLUSH_INTERVAL, has_content=False):
+        self.stream = stream
+        self.close_stream = close_stream
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.has_content = has_content
+        self.chunks = []
+        self.size = 0
+        self.last_flush = time.time()
+
+    @staticmethod
+    def open(output=None):
+        if output is None:
+            # a terminal reader wants lines promptly, a pipe is better served by large writes
+            interactive = sys.stdout.isatty()
+            return OutputSink(sys.stdout, flush_interval=0.1 if interactive else utils.OUTPUT_FLUSH_INTERVAL)
+        elif isinstance(output, basestring):
+            has_content = os.path.exists(output) and os.path.getsize(output) > 0
+            return OutputSink(open(output, "ab"), close_stream=True, has_content=has_content)
+        return OutputSink(output)
+
+    def write(self, line):
+        self.chunks.append(line)
+        self.chunks.append('\n')
+        self.size += len(line) + 1
+        if self.size >= self.buffer_size or time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        data = ''.join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        self.last_flush = time.time()
+        try:
+            if data:
+                self.stream.write(data)
+            self.stream.flush()
+            if stats.current is not None:
+                stats.current.add("write", time.time() - self.last_flush)
+                stats.current.count("bytes_written", len(data))
+        except IOError as e:
+            if e.errno != errno.EPIPE:
+                raise
+            if self.stream is sys.stdout:
+                # keep the interpreter from failing again when it flushes stdout at exit
+                os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            raise OutputClosed()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            if self.close_stream:
+                self.stream.close()
 
 
 class LogPrinter(object):
 
     def __init__(self):
-        self.message_buffer = SimpleBuffer()
+        self.message_buffer = MessageBuffer()
+        self.cursor = None
 
-    def run_logprint(self, api, query, formatter, follow=False, output=None, header=None, interval=1000):
-        if follow:
-            assert query.limit is None
+    def run_logprint(self, api, query, formatter, follow=False, output=None, header=None, interval=utils.DEFAULT_MIN_INTERVAL,
+                     max_interval=utils.DEFAULT_MAX_INTERVAL, latency=utils.DEFAULT_LATENCY):
+        sink = OutputSink.open(output)
+        if stats.current is not None:
+            stats.current.message_buffer = self.message_buffer
+        printed = 0
+        try:
+            if header and not sink.has_content:
+                sink.write(header.encode('utf-8'))
 
-            close_output = False
-            if output is not None and isinstance(output, basestring):
-                output = open(output, "a")
-                close_output = True
+            if follow:
+                assert query.limit is None
 
+                def print_poll(messages):
+                    printed = self._print_messages(messages, formatter, sink)
+                    sink.flush()
+                    return printed
+                self._follow(api, query, print_poll, interval, max_interval, latency)
+            else:
+                printed = self._print_messages(self.fetch_messages(api, query), formatter, sink)
+        except OutputClosed:
+            pass
+        finally:
             try:
-                while True:
-                    self.run_logprint(api, query, formatter, follow=False, output=output)
-                    new_range = SearchRange(to_time=arrow.now(LOCAL_TIMEZONE), from_time=arrow.now(LOCAL_TIMEZONE).replace(seconds=-5))
-                    query = query.copy_with_range(new_range)
-                    time.sleep(interval / 1000.0)
-            except KeyboardInterrupt:
-                print("\nInterrupted follow mode. Exiting...")
+                sink.close()
+            except OutputClosed:
+                pass
+        return printed
+
+    def run_aggregation(self, api, query, aggregator, follow=False, interval=utils.DEFAULT_MIN_INTERVAL,
+                        max_interval=utils.DEFAULT_MAX_INTERVAL, latency=utils.DEFAULT_LATENCY):
+        """
+        Feeds the messages of the query to `aggregator.consume`, and in follow mode the new messages of every poll.
+        """
+        if not follow:
+            return aggregator.consume(self._new_messages(self.fetch_messages(api, query)))
 
-            if close_output:
-                output.close()
+        def consume_poll(messages):
+            before = aggregator.messages
+            aggregator.consume(self._new_messages(messages))
+            return aggregator.messages - before
+        try:
+            self._follow(api, query, consume_poll, interval, max_interval, latency)
+        except OutputClosed:
+            pass
+        return aggregator
 
+    def _follow(self, api, query, consume, interval, max_interval, latency):
+        """
+        Polls the query for new messages until interrupted, `consume(messages)` handles each poll and returns how many were new.
+        """
+        self.cursor = FollowCursor(query.search_range.absolute_bounds()[0])
+        polling_interval = PollingInterval(interval, max_interval)
+        last_report = time.time()
+        try:
+            while True:
+                received = consume(self.fetch_messages(api, query))
+                if stats.current is not None and time.time() - last_report >= utils.STATS_INTERVAL:
+                    click.echo(stats.current.summary() + "\n", err=True)
+                    last_report = time.time()
+                new_range = self.cursor.next_range(latency)
+                query = query.copy_with_range(new_range)
+                self.message_buffer.evict_older_than(new_range.from_time)
+                time.sleep(polling_interval.update(received) / 1000.0)
+        except KeyboardInterrupt:
+            print("\nInterrupted follow mode. Exiting...")
+
+    @staticmethod
+    def fetch_messages(api, query):
+        # a limited search is printed in reverse, the oldest message last with the default newest first sort
+        if query.limit is not None:
+            return reversed(api.search(query).messages)
+        if query.sort is None:
+            return api.search_messages(query)
+        if query.sort == utils.TIMESTAMP:
+            return api.search_messages(query.copy_with_sort(query.sort, not query.ascending))
+        # the server stops other sorts at its result window, so the whole result is held anyway
+        return reversed(list(api.search_messages(query)))
+
+    def _new_messages(self, messages):
+        """
+        Yields the messages not printed yet, by follow cursor and message id.
+        """
+        for message in messages:
+            if self.cursor is not None and self.cursor.has_seen(message):
+                continue
+            message_id = message.message_dict.get(utils.ID)
+            if message_id is None or not self.message_buffer.is_object_buffered(message_id):
+                if message_id is not None:
+                    self.message_buffer.insert(message_id, message.timestamp)
+                yield message
+                if self.cursor is not None:
+                    self.cursor.advance(message)
+
+    def _print_messages(self, messages, formatter, sink):
+        run_stats = stats.current
+        if isinstance(formatter, DumpFormatter):
+            # dump lines only lose their line break, empty trailing tsv columns are data
+            strip = operator.methodcaller('rstrip', b'\r\n')
         else:
-            result = api.search(query, fetch_all=True)
-            formatted_msgs = []
-            for message in result.messages:
-                message_id = message.message_dict.get('_id')
-                if not self.message_buffer.is_object_buffered(message_id):
-                    formatted_msgs.append(formatter.format(message))
-                    self.message_buffer.insert(message_id)
-
-            formatted_msgs.reverse()
-
-            if formatted_msgs:
-                if output is None:
-                    for msg in formatted_msgs:
-                        print(msg.encode('utf-8').strip())
-                else:
-                    if isinstance(output, basestring):
-                        with open(output, "a") as f:
-                            f.writelines(('\n'.join(formatted_msgs) + '\n').encode('utf-8').strip())
-                    else:
-                        output.writelines(('\n'.join(formatted_msgs) + '\n').encode('utf-8').strip())
-            return result
+            strip = bytes.strip
+        printed = 0
+        for message in self._new_messages(messages):
+            if run_stats is None:
+                sink.write(strip(formatter.format(message).encode('utf-8')))
+            else:
+                started = time.time()
+                line = strip(formatter.format(message).encode('utf-8'))
+                run_stats.add("format", time.time() - started)
+                run_stats.count("messages")
+                sink.write(line)
+            printed += 1
+        return printed
+
+
+class AggregationPrinter(object):
+    """
+    Prints aggregation results as an aligned table, or as csv/tsv rows with a dump format.
+    """
+
+    DUMP_FORMATS = ('csv', 'tsv')
+
+    def __init__(self, dump_format=None):
+        self.dump_format = dump_format
+        self.header_written = False
+
+    def print_count(self, count, output=None):
+        self._print(["count"], [[count]], output)
+
+    def print_terms(self, field, result, output=None):
+        rows = [[term, count, self._percent(count, result.total)] for term, count in result.terms]
+        if result.other:
+            rows.append([u"(other)", result.other, self._percent(result.other, result.total)])
+        if result.missing:
+            rows.append([u"(missing)", result.missing, self._percent(result.missing, result.total)])
+        self._print([field, "count", "%"], rows, output)
+
+    def print_histogram(self, result, output=None):
+        date_format = "YYYY-MM-DD HH:mm" if result.interval in ("minute", "hour") else "YYYY-MM-DD"
+        rows = [[arrow.get(start).to(utils.LOCAL_TIMEZONE).format(date_format), count] for start, count in result.buckets]
+        self._print([utils.TIMESTAMP, "count"], rows, output)
+
+    def print_group_by(self, group_by, size, output=None):
+        rows = [[value, count, error, self._percent(count, group_by.messages)] for value, count, error in group_by.sketch.top(size)]
+        if group_by.missing:
+            rows.append([u"(missing)", group_by.missing, 0, self._percent(group_by.missing, group_by.messages)])
+        self._print([group_by.field, "count", "error", "%"], rows, output)
+
+    def print_distinct(self, distinct, output=None):
+        rows = [[distinct.field, distinct.sketch.count(), round(100 * distinct.sketch.error, 2), distinct.messages]]
+        self._print(["field", "distinct", "error %", "messages"], rows, output)
+
+    def print_quantiles(self, quantiles, percentiles, size=None, output=None, window_end=None):
+        headers = ([quantiles.group_by] if quantiles.group_by else []) + ["field", "count", "min"] + \
+            ["p{:g}".format(p) for p in percentiles] + ["max"]
+        rows = [row[1:] if quantiles.group_by is None else row for row in quantiles.rows(percentiles, size)]
+        if window_end is not None:
+            # rolling windows are stamped with the time they end at
+            timestamp = arrow.get(window_end).to(utils.LOCAL_TIMEZONE).format("YYYY-MM-DD HH:mm:ss")
+            headers = [utils.TIMESTAMP] + headers
+            rows = [[timestamp] + row for row in rows]
+        self._print(headers, rows, output)
+
+    def print_level_histogram(self, histogram, bucket, output=None, color=True, width=None):
+        """
+        Draws the messages per bucket as bars stacked by level, most severe first, or dumps them as csv/tsv rows.
+        """
+        starts, counts = histogram.counts()
+        date_format = "YYYY-MM-DD HH:mm:ss" if bucket == "second" else "YYYY-MM-DD" if bucket == "day" else "YYYY-MM-DD HH:mm"
+        timestamps = [arrow.get(start).to(utils.LOCAL_TIMEZONE).format(date_format) for start in starts]
+        levels = [level for level in range(histogram.LEVELS) if any(row[level] for row in counts)]
+
+        if self.dump_format is not None:
+            rows = [[timestamp, sum(row)] + [row[level] for level in levels] for timestamp, row in zip(timestamps, counts)]
+            self._print([utils.TIMESTAMP, "count"] + [histogram.level_name(level) for level in levels], rows, output)
+            return
+
+        totals = [sum(row) for row in counts]
+        count_width = len(str(max(totals))) if totals else 1
+        width = width or click.get_terminal_size()[0]
+        bar_width = max(10, width - len(date_format) - count_width - 4)
+        scale = bar_width / max(totals) if totals else 1
+
+        def segment(level, length):
+            if color:
+                return colored(u"\u2588" * length, LogLevel.find_by_syslog_code(level)['color'])
+            return histogram.level_name(level)[0] * length
+
+        lines = [u"  ".join(segment(level, 1) + u" " + histogram.level_name(level) for level in levels) +
+                 u"  ({} messages, a bar per {})".format(histogram.messages, bucket)]
+        for timestamp, row, total in zip(timestamps, counts, totals):
+            bar, drawn, cumulative = u"", 0, 0
+            for level in levels:
+                # rounding the running total keeps the bar length proportional to the bucket total
+                cumulative += row[level]
+                length = int(round(cumulative * scale)) - drawn
+                if length > 0:
+                    bar += segment(level, length)
+                    drawn += length
+            lines.append(u"{}  {}  {}".format(timestamp, str(total).rjust(count_width), bar).rstrip())
+
+        sink = OutputSink.open(output)
+        try:
+            for line in lines:
+                sink.write(line.encode('utf-8'))
+        finally:
+            sink.close()
+
+    @staticmethod
+    def _percent(count, total):
+        return round(100.0 * count / total, 1) if total else 0.0
+
+    def lines(self, headers, rows):
+        if self.dump_format is not None:
+            formatter = FormatterFactory.DUMP_FORMATTERS[self.dump_format](None, headers)
+            lines = [formatter.row(row) for row in rows]
+            if not self.header_written:
+                self.header_written = True
+                lines.insert(0, formatter.header())
+            return lines
+
+        # numbers are right aligned, names and dates left aligned
+        numeric = [bool(rows) and all(isinstance(row[i], (six.integer_types, float)) for row in rows) for i in range(len(headers))]
+        cells = [[six.text_type(value) for value in row] for row in [headers] + rows]
+        widths = [max(len(row[i]) for row in cells) for i in range(len(headers))]
+        lines = [u"  ".join(value.rjust(width) if right else value.ljust(width) for value, width, right in zip(row, widths, numeric)).rstrip()
+                 for row in cells]
+        if self.header_written:
+            lines.insert(0, u"")
+        self.header_written = True
+        return lines
+
+    def _print(self, headers, rows, output):
+        # OutputClosed is left to the caller, it ends the rolling windows of follow mode
+        sink = OutputSink.open(output)
+        try:
+            for line in self.lines(headers, rows):
+                sink.write(line.encode('utf-8'))
+        finally:
+            sink.close()
@@ -0,0 +1,231 @@
+from __future__ import division, print_function
+import heapq
+import threading
+from functools import partial
+from multiprocessing.pool import ThreadPool
+from six.moves import queue
+from glogcli import utils
+from glogcli.dateutils import epoch_millis
+from glogcli.graylog_api import SearchResult, TermsResult, HistogramResult
+
+# threads are waited for in short steps, which keeps the main thread responsive to KeyboardInterrupt
+WAIT_STEP = 0.5
+
+
+class TimeSlicedSearch(object):
+    """
+    Fetches unlimited, timestamp ordered queries as time slices read concurrently into bounded queues.
+    """
+
+    SLICES_PER_WORKER = 4
+
+    def __init__(self, api, workers=None, slices=None, queue_size=utils.SLICE_QUEUE_SIZE):
+        self.api = api
+        self.workers = min(workers or api.max_workers, api.max_workers)
+        self.slices = slices or self.workers * self.SLICES_PER_WORKER
+        self.queue_size = queue_size
+
+    def search(self, query, fetch_all=False):
+        return self.api.search(query, fetch_all)
+
+    def search_messages(self, query, page_size=None):
+        ordered_by_time = query.sort is None or (query.sort == utils.TIMESTAMP and query.ascending)
+        if self.workers < 2 or not ordered_by_time or query.offset:
+            for message in self.api.search_messages(query, page_size):
+                yield message
+            return
+
+        stream_queries = self._stream_queries(query)
+        stop = threading.Event()
+        pool = ThreadPool(self.workers)
+        try:
+            # the pool starts the tasks in order, so the slice being yielded is always being read
+            slices = []
+            for search_range in query.search_range.split(self.slices):
+                queues = []
+                for stream_query in stream_queries:
+                    messages = queue.Queue(self.queue_size)
+                    search = partial(self.api.search_messages, stream_query.copy_with_range(search_range), page_size)
+                    pool.apply_async(_read, (search, messages, stop))
+                    queues.append(messages)
+                slices.append(queues)
+
+            for queues in slices:
+                for message in self._slice_messages(queues):
+                    yield message
+        finally:
+            stop.set()
+            pool.terminate()
+            # workers still in a request stop at their next message, and must not outlive the search
+            pool.join()
+
+    def _stream_queries(self, query):
+        streams = query.streams()
+        # the streams of a slice are merged as they are read, which needs a worker for each of them
+        if len(streams) < 2 or len(streams) > self.workers:
+            return [query]
+        return [query.copy_with_filter("streams:{}".format(stream)) for stream in streams]
+
+    @staticmethod
+    def _slice_messages(queues):
+        if len(queues) == 1:
+            return _drain(queues[0])
+        return TimeSlicedSearch._merge_streams(queues)
+
+    @staticmethod
+    def _merge_streams(queues):
+        # a message routed to several of the streams is returned by the search of each of them
+        timestamp, ids = None, set()
+        for millis, _, _, message in heapq.merge(*[_keyed(i, _drain(q), 1) for i, q in enumerate(queues)]):
+            if millis != timestamp:
+                timestamp, ids = millis, set()
+            message_id = message.message_dict.get(utils.ID)
+            if message_id is not None:
+                if message_id in ids:
+                    continue
+                ids.add(message_id)
+            yield message
+
+
+class MergedSearch(object):
+    """
+    Searches several environments at once and merges their results into a single timeline.
+    """
+
+    def __init__(self, apis, filters=None, queue_size=utils.MERGE_QUEUE_SIZE):
+        self.apis = apis
+        self.filters = filters or {}
+        self.queue_size = queue_size
+
+    def _query_for(self, environment, query):
+        if environment in self.filters:
+            return query.copy_with_filter(self.filters[environment])
+        return query
+
+    def search(self, query, fetch_all=False):
+        def search_environment(environment):
+            result = self.apis[environment].search(self._query_for(environment, query), fetch_all)
+            for message in result.messages:
+                message.environment = environment
+            return result.messages
+
+        results = self._map(search_environment)
+
+        # a search returns its newest messages first unless asked for ascending order
+        messages = [m for result in results for m in result]
+        messages.sort(key=lambda m: epoch_millis(m.timestamp), reverse=not query.ascending)
+        if query.limit and not fetch_all:
+            messages = messages[:query.limit]
+
+        result = SearchResult({"query": query.query}, messages=messages)
+        result.query_object = query
+        result.total_results = len(messages)
+        return result
+
+    def count(self, query):
+        return sum(self._map(lambda environment: self.apis[environment].count(self._query_for(environment, query))))
+
+    def terms(self, query, field, size=utils.DEFAULT_TOP_SIZE):
+        results = self._map(lambda environment: self.apis[environment].terms(self._query_for(environment, query), field, size))
+        return TermsResult.merge(results, size)
+
+    def histogram(self, query, interval=utils.DEFAULT_HISTOGRAM_INTERVAL):
+        return HistogramResult.merge(self._map(lambda environment: self.apis[environment].histogram(self._query_for(environment, query), interval)))
+
+    def _map(self, call):
+        """
+        Calls `call(environment)` for every environment concurrently and returns the results in environment order.
+        """
+        pool = ThreadPool(len(self.apis))
+        try:
+            return [_result(*pair) for pair in _wait(pool.map_async(partial(_call, call), list(self.apis)))]
+        finally:
+            pool.terminate()
+
+    def search_messages(self, query, page_size=None):
+        ordered_by_time = query.sort is None or query.sort == utils.TIMESTAMP
+        direction = -1 if query.sort is not None and not query.ascending else 1
+        stop = threading.Event()
+        queues = []
+        for environment in self.apis:
+            messages = queue.Queue(self.queue_size)
+            search = partial(self._tagged, environment, self._query_for(environment, query), page_size)
+            reader = threading.Thread(target=_read, args=(search, messages, stop))
+            reader.daemon = True
+            reader.start()
+            queues.append(messages)
+
+        try:
+            if ordered_by_time:
+                keyed = [_keyed(i, _drain(q), direction) for i, q in enumerate(queues)]
+                for _, _, _, message in heapq.merge(*keyed):
+                    yield message
+            else:
+                for q in queues:
+                    for message in _drain(q):
+                        yield message
+        finally:
+            stop.set()
+
+    def _tagged(self, environment, query, page_size):
+        for message in self.apis[environment].search_messages(query, page_size):
+            message.environment = environment
+            yield message
+
+
+# GraylogAPI.get exits on API errors, so the errors of worker threads, SystemExit included, are
+# handed over with their results and raised again by the thread reading them
+def _call(function, *args):
+    try:
+        return function(*args), None
+    except BaseException as e:
+        return None, e
+
+
+def _result(result, error):
+    if error is not None:
+        raise error
+    return result
+
+
+def _read(search, messages, stop):
+    _, error = _call(_copy, search, messages, stop)
+    _put(messages, (None, error), stop)
+
+
+def _copy(search, messages, stop):
+    for message in search():
+        if not _put(messages, (message, None), stop):
+            return
+
+
+def _put(messages, item, stop):
+    while not stop.is_set():
+        try:
+            messages.put(item, timeout=WAIT_STEP)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _drain(messages):
+    while True:
+        try:
+            message = _result(*messages.get(timeout=WAIT_STEP))
+        except queue.Empty:
+            continue
+        if message is None:
+            return
+        yield message
+
+
+def _wait(async_result):
+    while not async_result.ready():
+        async_result.wait(WAIT_STEP)
+    return async_result.get()
+
+
+def _keyed(index, messages, direction):
+    for position, message in enumerate(messages):
+        yield direction * epoch_millis(message.timestamp), index, position, message
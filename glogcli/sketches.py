@@ -0,0 +1,372 @@
+from __future__ import division, print_function
+import hashlib
+import heapq
+import itertools
+import math
+import struct
+import time
+from collections import deque
+import six
+from glogcli import utils
+
+
+class SpaceSaving(object):
+    """
+    Heavy hitters of a stream in `capacity` counters (Metwally et al., Space-Saving).
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counters = {}
+        self.heap = []
+        self.sequence = itertools.count()
+        self.total = 0
+
+    @staticmethod
+    def with_error(error):
+        """
+        Returns a sketch whose counts are overestimated by at most `error` times the number of values added.
+        """
+        return SpaceSaving(int(math.ceil(1 / error)))
+
+    def add(self, value, n=1):
+        self.total += n
+        counter = self.counters.get(value)
+        if counter is not None:
+            counter[0] += n
+            return
+
+        if len(self.counters) < self.capacity:
+            self.counters[value] = [n, 0]
+            heapq.heappush(self.heap, (n, next(self.sequence), value))
+            return
+
+        while True:
+            count, _, evicted = self.heap[0]
+            current = self.counters[evicted][0]
+            if current == count:
+                break
+            heapq.heapreplace(self.heap, (current, next(self.sequence), evicted))
+        del self.counters[evicted]
+        self.counters[value] = [count + n, count]
+        heapq.heapreplace(self.heap, (count + n, next(self.sequence), value))
+
+    def top(self, n):
+        """
+        Returns the `n` values with the highest counts as (value, count, error) tuples.
+        """
+        ordered = sorted(six.iteritems(self.counters), key=lambda item: (-item[1][0], item[1][1], item[0]))
+        return [(value, count, error) for value, (count, error) in ordered[:n]]
+
+
+class HyperLogLog(object):
+    """
+    Approximate number of distinct values of a stream (Flajolet et al., HyperLogLog).
+    """
+
+    MIN_PRECISION = 4
+    MAX_PRECISION = 18
+
+    def __init__(self, precision=14):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+        self.max_rank = 64 - precision + 1
+
+    @staticmethod
+    def with_error(error):
+        """
+        Returns a sketch whose estimates have a relative standard error of at most `error`, within the supported precisions.
+        """
+        precision = int(math.ceil(math.log((1.04 / error) ** 2, 2)))
+        return HyperLogLog(max(HyperLogLog.MIN_PRECISION, min(HyperLogLog.MAX_PRECISION, precision)))
+
+    @property
+    def error(self):
+        return 1.04 / math.sqrt(self.size)
+
+    def add(self, value):
+        if not isinstance(value, six.binary_type):
+            value = six.text_type(value).encode(utils.UTF8)
+        hashed = struct.unpack('<Q', hashlib.md5(value).digest()[:8])[0]
+        register = hashed >> (64 - self.precision)
+        remaining = hashed & ((1 << (64 - self.precision)) - 1)
+        # position of the leftmost 1 bit in the 64 - precision remaining bits
+        rank = self.max_rank - remaining.bit_length()
+        if rank > self.registers[register]:
+            self.registers[register] = rank
+
+    def count(self):
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size * self.size / sum(2.0 ** -rank for rank in self.registers)
+        empty = self.registers.count(b'\x00')
+        if estimate <= 2.5 * self.size and empty:
+            # small cardinalities are estimated better by linear counting of the empty registers
+            return int(round(self.size * math.log(self.size / empty)))
+        return int(round(estimate))
+
+
+class TDigest(object):
+    """
+    Mergeable streaming quantiles (Dunning, merging t-digest).
+    """
+
+    def __init__(self, compression=utils.DEFAULT_TDIGEST_COMPRESSION):
+        self.compression = compression
+        self.means = []
+        self.weights = []
+        self.buffer = []
+        self.buffer_size = 5 * compression
+        self.count = 0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def add(self, value, weight=1):
+        self.buffer.append((value, weight))
+        self.count += weight
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        if len(self.buffer) >= self.buffer_size:
+            self._compress()
+
+    def merge(self, other):
+        for centroid in zip(other.means, other.weights):
+            self.buffer.append(centroid)
+        self.buffer.extend(other.buffer)
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _compress(self):
+        if not self.buffer:
+            return
+        centroids = sorted(list(zip(self.means, self.weights)) + self.buffer)
+        self.buffer = []
+        total = self.count
+        means, weights = [], []
+        mean, weight = centroids[0]
+        before = 0
+        k_start = self._k(0)
+        for next_mean, next_weight in centroids[1:]:
+            if self._k((before + weight + next_weight) / total) - k_start <= 1:
+                weight += next_weight
+                mean += (next_mean - mean) * next_weight / weight
+            else:
+                means.append(mean)
+                weights.append(weight)
+                before += weight
+                k_start = self._k(before / total)
+                mean, weight = next_mean, next_weight
+        means.append(mean)
+        weights.append(weight)
+        self.means, self.weights = means, weights
+
+    def _k(self, q):
+        return self.compression / (2 * math.pi) * math.asin(max(-1.0, min(1.0, 2 * q - 1)))
+
+    def quantile(self, q):
+        """
+        Returns the estimated value below which a share `q` (between 0 and 1) of the values fall, None when empty.
+        """
+        self._compress()
+        if not self.count:
+            return None
+        if len(self.means) == 1:
+            return self.means[0]
+
+        # each centroid's mean sits at the middle of its weight, values are interpolated between centroids
+        target = q * self.count
+        if target <= self.weights[0] / 2:
+            return self.min + (self.means[0] - self.min) * target / (self.weights[0] / 2)
+        cumulative = self.weights[0] / 2
+        for i in range(1, len(self.means)):
+            step = (self.weights[i - 1] + self.weights[i]) / 2
+            if target <= cumulative + step:
+                return self.means[i - 1] + (self.means[i] - self.means[i - 1]) * (target - cumulative) / step
+            cumulative += step
+        last = self.weights[-1] / 2
+        return self.means[-1] + (self.max - self.means[-1]) * min(1, (target - cumulative) / last)
+
+
+def field_values(message, field):
+    """
+    Returns the values of a message field, one per element when the field is a list (e.g. streams).
+    """
+    value = message.environment if field == utils.ENVIRONMENT else message.message_dict.get(field)
+    if value is None:
+        return ()
+    if isinstance(value, list):
+        return value
+    return (value,)
+
+
+class GroupBy(object):
+    """
+    Approximate most frequent values of a field over a stream of messages, in memory bounded by the error.
+    """
+
+    def __init__(self, field, error=utils.DEFAULT_SKETCH_ERROR):
+        self.field = field
+        self.sketch = SpaceSaving.with_error(error)
+        self.messages = 0
+        self.missing = 0
+
+    def consume(self, messages):
+        add = self.sketch.add
+        for message in messages:
+            self.messages += 1
+            values = field_values(message, self.field)
+            if not values:
+                self.missing += 1
+            for value in values:
+                add(value if isinstance(value, six.string_types) else six.text_type(value))
+        return self
+
+
+class Distinct(object):
+    """
+    Approximate number of distinct values of a field over a stream of messages, in memory bounded by the error.
+    """
+
+    def __init__(self, field, error=utils.DEFAULT_SKETCH_ERROR):
+        self.field = field
+        self.sketch = HyperLogLog.with_error(error)
+        self.messages = 0
+        self.missing = 0
+
+    def consume(self, messages):
+        add = self.sketch.add
+        for message in messages:
+            self.messages += 1
+            values = field_values(message, self.field)
+            if not values:
+                self.missing += 1
+            for value in values:
+                add(value)
+        return self
+
+
+def numeric_value(message, field):
+    """
+    Returns a message field as a float, None when it is missing or not a number.
+    """
+    value = message.message_dict.get(field)
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class Quantiles(object):
+    """
+    Streaming quantiles of numeric fields, per value of a group-by field when one is given.
+    """
+
+    OTHER = u"(other)"
+    MISSING = u"(missing)"
+
+    def __init__(self, fields, group_by=None, max_groups=utils.MAX_QUANTILE_GROUPS, compression=utils.DEFAULT_TDIGEST_COMPRESSION):
+        self.fields = fields
+        self.group_by = group_by
+        self.max_groups = max_groups
+        self.compression = compression
+        self.groups = {}
+        self.counts = {}
+        self.messages = 0
+
+    def _group(self, message):
+        if self.group_by is None:
+            return None
+        values = field_values(message, self.group_by)
+        return six.text_type(values[0]) if values else self.MISSING
+
+    def _digests(self, group):
+        digests = self.groups.get(group)
+        if digests is None:
+            if len(self.groups) >= self.max_groups and group != self.OTHER:
+                return self._digests(self.OTHER)
+            digests = self.groups[group] = dict((field, TDigest(self.compression)) for field in self.fields)
+            self.counts[group] = 0
+        return group, digests
+
+    def consume(self, messages):
+        for message in messages:
+            self.messages += 1
+            group, digests = self._digests(self._group(message))
+            self.counts[group] += 1
+            for field in self.fields:
+                value = numeric_value(message, field)
+                if value is not None:
+                    digests[field].add(value)
+        return self
+
+    def merge(self, other):
+        for name, other_digests in six.iteritems(other.groups):
+            group, digests = self._digests(name)
+            self.counts[group] += other.counts[name]
+            for field in self.fields:
+                digests[field].merge(other_digests[field])
+        self.messages += other.messages
+        return self
+
+    def rows(self, percentiles, size=None):
+        """
+        Returns [group, field, count, min, percentiles..., max] rows, the groups with the most messages first.
+        """
+        groups = sorted(self.groups, key=lambda group: (group == self.OTHER, -self.counts[group], group))
+        if size:
+            groups = groups[:size]
+        rows = []
+        for group in groups:
+            for field in self.fields:
+                digest = self.groups[group][field]
+                if not digest.count:
+                    continue
+                values = [digest.min] + [digest.quantile(p / 100) for p in percentiles] + [digest.max]
+                rows.append([group, field, digest.count] + [round(v, 3) for v in values])
+        return rows
+
+
+class RollingQuantiles(object):
+    """
+    Quantiles over the last `window` seconds of a follow run.
+    """
+
+    def __init__(self, fields, group_by, on_window, window=utils.DEFAULT_QUANTILE_WINDOW, slots=utils.QUANTILE_WINDOW_SLOTS):
+        self.fields = fields
+        self.group_by = group_by
+        self.on_window = on_window
+        self.slot_seconds = window / slots
+        self.slots = deque(maxlen=slots)
+        self.slot = None
+        self.messages = 0
+
+    def _current(self, now):
+        slot = int(now // self.slot_seconds)
+        if slot != self.slot:
+            if self.slot is not None:
+                self.report(slot)
+            self.slot = slot
+            self.slots.append((slot, Quantiles(self.fields, self.group_by)))
+        return self.slots[-1][1]
+
+    def consume(self, messages, now=None):
+        quantiles = self._current(time.time() if now is None else now)
+        before = quantiles.messages
+        quantiles.consume(messages)
+        self.messages += quantiles.messages - before
+        return self
+
+    def report(self, end_slot):
+        # sub-windows older than the window are left out, they are still held after a pause in the messages
+        merged = Quantiles(self.fields, self.group_by)
+        for slot, quantiles in self.slots:
+            if slot >= end_slot - self.slots.maxlen:
+                merged.merge(quantiles)
+        self.on_window(merged, end_slot * self.slot_seconds)
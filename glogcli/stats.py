@@ -0,0 +1,88 @@
+from __future__ import division, print_function
+import threading
+import time
+from collections import defaultdict
+
+# The stats of the running command, None unless --stats is given. Instrumented code checks it
+# before taking any timing, so a run without --stats only pays for that check.
+current = None
+
+
+def enable():
+    global current
+    current = PipelineStats()
+    return current
+
+
+def disable():
+    global current
+    current = None
+
+
+class PipelineStats(object):
+    """
+    Time spent per stage of a run and counters of what went through it.
+    """
+
+    STAGES = ('request', 'receive', 'decode', 'format', 'write')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.seconds = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.message_buffer = None
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.seconds[stage] += seconds
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counts[name] += n
+
+    def timed(self, iterable, stage):
+        """
+        Yields the items of `iterable`, adding the time taken to produce each one to `stage`.
+        """
+        iterator = iter(iterable)
+        while True:
+            started = time.time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(stage, time.time() - started)
+                return
+            self.add(stage, time.time() - started)
+            yield item
+
+    def receive(self, response, chunks):
+        """
+        Times the reading of a streamed response body and counts its bytes once it has been read.
+        """
+        for chunk in self.timed(chunks, 'receive'):
+            yield chunk
+        self.count('bytes', response.raw.tell())
+
+    def summary(self):
+        elapsed = time.time() - self.started
+        requests = self.counts['requests']
+        printed = self.counts['messages']
+        # streamed bodies are read while they are decoded, so decode time includes receive time
+        decode = max(0.0, self.seconds['decode'] - self.seconds['receive'])
+
+        lines = [
+            "Requests: {} in {:.3f} s ({:.1f} ms avg), {:.1f} KB received".format(
+                requests, self.seconds['request'], 1000 * self.seconds['request'] / requests if requests else 0,
+                self.counts['bytes'] / 1024),
+            "Receive:  {:.3f} s".format(self.seconds['receive']),
+            "Decode:   {:.3f} s".format(decode),
+            "Format:   {:.3f} s".format(self.seconds['format']),
+            "Write:    {:.3f} s, {:.1f} KB written".format(self.seconds['write'], self.counts['bytes_written'] / 1024),
+            "Messages: {} printed in {:.3f} s ({:.0f} messages/s)".format(printed, elapsed, printed / elapsed if elapsed else 0),
+        ]
+        if self.message_buffer is not None:
+            lookups = self.message_buffer.hits + self.message_buffer.misses
+            lines.append("Dedup:    {} of {} messages already printed ({:.1f}%)".format(
+                self.message_buffer.hits, lookups, 100.0 * self.message_buffer.hits / lookups if lookups else 0))
+        return "\n".join(lines)
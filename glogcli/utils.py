@@ -5,11 +5,11 @@ try:
 except:
     from six.moves import configparser
 
+import fnmatch
 import re
 import os
 import sys
 import click
-import keyring
 
 
 DEFAULT_DATE_FORMAT = "YYYY-MM-DD HH:mm:ss.SSS"
@@ -18,6 +18,8 @@ FACILITY = "facility"
 SOURCE = "source"
 LEVEL = "level"
 TIMESTAMP = "timestamp"
+ENVIRONMENT = "environment"
+ID = "_id"
 MODULE = "module"
 LINE = "line"
 LOCAL_TIMEZONE = "local"
@@ -33,6 +35,47 @@ FORMAT = "format"
 COLOR = "color"
 PROXY = "proxy"
 DEFAULT_STREAM = "default_stream"
+POOL_SIZE = "pool_size"
+TIMEOUT = "timeout"
+KEEP_ALIVE = "keep_alive"
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 60
+MAX_RESULT_WINDOW = "max_result_window"
+DEFAULT_MAX_RESULT_WINDOW = 10000
+DEFAULT_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 64 * 1024
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+OUTPUT_FLUSH_INTERVAL = 1
+CACHE_SECTION = "cache"
+CACHE_DIR = "directory"
+CACHE_SIZE = "max_size"
+DEFAULT_CACHE_DIR = "~/.glogcli/cache"
+DEFAULT_CACHE_SIZE = 512 * 1024 * 1024
+CACHE_MIN_AGE = 300
+METADATA_TTL = "metadata_ttl"
+DEFAULT_METADATA_TTL = 3600
+MERGE_QUEUE_SIZE = 1000
+SLICE_QUEUE_SIZE = 1000
+COLUMNAR_FORMATS = ('arrow', 'parquet')
+DEFAULT_MIRROR_PATH = "~/.glogcli/mirror.db"
+MAX_WORKERS = "max_workers"
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_BUFFER_SIZE = 100000
+DEFAULT_LATENCY = 2
+DEFAULT_MIN_INTERVAL = 500
+DEFAULT_MAX_INTERVAL = 10000
+STATS_INTERVAL = 60
+DEFAULT_TOP_SIZE = 10
+HISTOGRAM_INTERVALS = ('minute', 'hour', 'day', 'week', 'month', 'quarter', 'year')
+DEFAULT_HISTOGRAM_INTERVAL = 'minute'
+CHART_BUCKET_SECONDS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+MAX_CHART_BUCKETS = 10000
+DEFAULT_SKETCH_ERROR = 0.01
+DEFAULT_TDIGEST_COMPRESSION = 100
+DEFAULT_PERCENTILES = "50,95,99"
+MAX_QUANTILE_GROUPS = 1000
+DEFAULT_QUANTILE_WINDOW = 60
+QUANTILE_WINDOW_SLOTS = 6
 DEFAULT_MESSAGE_FORMAT_TEMPLATE = "{source} {level} {timestamp} {facility} {message}"
 
 
@@ -74,6 +117,26 @@ def get_config(config_file_path="~/.glogcli.cfg"):
     return config
 
 
+def get_environments(cfg, environment):
+    """
+    Expands a comma separated list of environment labels or globs, e.g. 'dc*' or 'dc1,dc2'.
+    """
+    configured = [s[len("environment:"):] for s in cfg.sections() if s.startswith("environment:")]
+    environments = []
+    for label in environment.split(","):
+        label = label.strip()
+        if not label:
+            continue
+        if any(c in label for c in "*?["):
+            matches = fnmatch.filter(configured, label)
+            if not matches:
+                cli_error("No environment matches '{}'.".format(label))
+        else:
+            matches = [label]
+        environments.extend(m for m in matches if m not in environments)
+    return environments
+
+
 def cli_error(msg):
     click.echo(click.style(msg, fg='red'))
     sys.exit(1)
@@ -84,10 +147,12 @@ def _get_host(cfg, section_name):
 
 
 def store_password_in_keyring(host, username, password):
+    import keyring
     keyring.set_password('glog_' + host, username, password)
 
 
 def get_password_from_keyring(host, username):
+    import keyring
     return keyring.get_password('glog_' + host, username)
 
 
@@ -21,6 +21,11 @@ install_requires = [
     'six>=1.9.0',
 ]
 
+extras_require = {
+    'columnar': ['pyarrow'],
+    'histogram': ['numpy'],
+}
+
 tests_require = [
     'coverage==4.1',
     'httpretty==0.8.14',
@@ -51,11 +56,12 @@ setup(
                  'glogcli'},
     entry_points={
         'console_scripts': [
-            'glogcli=glogcli.cli:run'
+            'glogcli=glogcli.cli:main'
         ]
     },
     include_package_data=True,
     install_requires=install_requires,
+    extras_require=extras_require,
     setup_requires=setup_requires,
     license="Apache Software License 2.0",
     zip_safe=False,
@@ -1,7 +1,9 @@
 from __future__ import division, print_function
+import json
 import unittest
 import arrow
 import httpretty
+import mock
 import glogcli.graylog_api as api
 
 
@@ -24,6 +26,18 @@ class GraylogAPITestCase(unittest.TestCase):
         sr = api.SearchRange("10 minutes ago", "10 minutes ago")
         self.assertEquals(1, sr.range_in_seconds())
 
+    def test_message_parses_lazily_from_the_payload(self):
+        payload = {"message": {"_id": "a", "timestamp": "2015-04-20T10:43:01.793Z", "level": 3, "message": "m"}}
+        message = api.Message(payload)
+
+        self.assertIs(payload["message"], message.message_dict)
+        self.assertIsNone(message._timestamp)
+        self.assertEquals(arrow.get("2015-04-20T10:43:01.793Z"), message.timestamp)
+        self.assertEquals(3, message.level)
+        self.assertEquals("m", message.message)
+        with self.assertRaises(AttributeError):
+            message.extra = True
+
     @httpretty.activate
     def test_graylog_api_search(self):
         httpretty.register_uri(
@@ -55,18 +69,68 @@ class GraylogAPITestCase(unittest.TestCase):
         self.assertEquals("*", result.query)
 
     @httpretty.activate
-    def test_to_many_results(self):
-        httpretty.register_uri(
-            httpretty.GET, "http://dummyhost:80/api/search/universal/absolute",
-            body=self.generate_search_result(1000000),
-            content_type="application/json"
-        )
+    def test_search_messages_walks_pages(self):
+        self.register_paged_search(total_results=25)
 
-        sr = api.SearchRange("10 minutes ago", arrow.now())
-        q = api.SearchQuery(sr)
+        sr = api.SearchRange("2015-04-20 09:00:00+00:00", "2015-04-20 11:00:00+00:00")
+        messages = list(self.api.search_messages(api.SearchQuery(sr), page_size=10))
+
+        self.assertEquals(25, len(messages))
+        self.assertEquals(["msg-%d" % i for i in range(25)], [m.message_dict["_id"] for m in messages])
+        self.assertEquals(["10", "10", "10"], [r.querystring["limit"][0] for r in httpretty.HTTPretty.latest_requests])
+        self.assertEquals(["timestamp:asc"], httpretty.last_request().querystring["sort"])
+
+    @httpretty.activate
+    def test_search_messages_splits_on_time_past_result_window(self):
+        self.register_paged_search(total_results=25)
+        self.api.max_result_window = 10
+
+        sr = api.SearchRange("2015-04-20 09:00:00+00:00", "2015-04-20 11:00:00+00:00")
+        messages = list(self.api.search_messages(api.SearchQuery(sr), page_size=4))
+
+        self.assertEquals(["msg-%d" % i for i in range(25)], [m.message_dict["_id"] for m in messages])
+        offsets = [int(r.querystring["offset"][0]) for r in httpretty.HTTPretty.latest_requests]
+        self.assertTrue(max(offsets) < 10)
+
+    @httpretty.activate
+    def test_search_fetch_all_has_no_result_limit(self):
+        self.register_paged_search(total_results=30)
+        self.api.max_result_window = 10
 
-        with self.assertRaises(RuntimeError):
-            self.api.search(q, fetch_all=True)
+        sr = api.SearchRange("2015-04-20 09:00:00+00:00", "2015-04-20 11:00:00+00:00")
+        result = self.api.search(api.SearchQuery(sr), fetch_all=True)
+        self.assertEquals(30, len(result.messages))
+
+    @httpretty.activate
+    def test_search_fetch_all_past_result_window_is_empty(self):
+        self.register_paged_search(total_results=30)
+        self.api.max_result_window = 10
+
+        sr = api.SearchRange("2015-04-20 09:00:00+00:00", "2015-04-20 11:00:00+00:00")
+        result = self.api.search(api.SearchQuery(sr, offset=10), fetch_all=True)
+        self.assertEquals([], result.messages)
+        self.assertEquals(0, result.total_results)
+        self.assertFalse(httpretty.HTTPretty.latest_requests)
+
+    def register_paged_search(self, total_results):
+        """
+        Serves `total_results` messages, three per second, honoring the from/offset/limit parameters.
+        """
+        base = arrow.get("2015-04-20T10:00:00.000Z")
+        entries = [("msg-%d" % i, base.replace(seconds=i // 3)) for i in range(total_results)]
+
+        def callback(request, uri, headers):
+            params = request.querystring
+            from_time = arrow.get(params["from"][0], "YYYY-MM-DD HH:mm:ss.SSS")
+            offset, limit = int(params["offset"][0]), int(params["limit"][0])
+            matching = [e for e in entries if e[1] >= from_time.replace(tzinfo=e[1].tzinfo)]
+            page = [{"message": {"_id": i, "timestamp": ts.isoformat(), "message": i}} for i, ts in matching[offset:offset + limit]]
+            body = json.dumps({"query": "*", "messages": page, "total_results": len(matching),
+                               "from": base.isoformat(), "to": base.isoformat()})
+            return 200, headers, body
+
+        httpretty.register_uri(httpretty.GET, "http://dummyhost:80/api/search/universal/absolute", body=callback)
+        self.api.host_tz = "UTC"
 
     @httpretty.activate
     def test_userinfo(self):
@@ -79,6 +143,44 @@ class GraylogAPITestCase(unittest.TestCase):
         result = self.api.user_info()
         self.assertEquals({"someuser": "info"}, result)
 
+    @httpretty.activate
+    def test_requests_share_pooled_session(self):
+        httpretty.register_uri(
+            httpretty.GET, "http://dummyhost:80/api/streams/enabled",
+            body='[{"somestream" : "a" }]',
+            content_type="application/json"
+        )
+
+        session = self.api.session
+        self.api.streams()
+        self.api.streams()
+        self.assertIs(session, self.api.session)
+
+        request = httpretty.last_request()
+        self.assertEquals("application/json", request.headers["Accept"])
+        self.assertIn("gzip", request.headers["Accept-Encoding"])
+        self.assertTrue(request.headers["Authorization"].startswith("Basic "))
+
+    def test_request_errors_are_reported(self):
+        from requests.exceptions import ReadTimeout, ConnectionError
+        query = api.SearchQuery(api.SearchRange("10 minutes ago", relative=True))
+        self.api.session.get = mock.Mock(side_effect=ReadTimeout("read timed out"))
+        with self.assertRaises(SystemExit):
+            self.api.count(query)
+
+        def chunks(**kwargs):
+            yield u'{"messages": ['
+            raise ConnectionError("read timed out")
+
+        response = mock.Mock(status_code=200, encoding=None, iter_content=chunks)
+        self.api.session.get = mock.Mock(return_value=response)
+        with self.assertRaises(SystemExit):
+            list(self.api.search_messages(query))
+
+    def test_password_updates_session_auth(self):
+        self.api.password = "secret"
+        self.assertEquals(("dummy", "secret"), self.api.session.auth)
+
     @httpretty.activate
     def test_streams(self):
         httpretty.register_uri(
@@ -102,6 +204,56 @@ class GraylogAPITestCase(unittest.TestCase):
         self.assertEquals("level:INFO", saved_searches['searches'][0]['query']['query'])
         self.assertEquals("timestamp,message", saved_searches['searches'][0]['query']['fields'])
 
+    @httpretty.activate
+    def test_terms_are_asked_next_to_the_search_endpoint(self):
+        httpretty.register_uri(
+            httpretty.GET, "http://dummyhost:80/api/search/universal/relative/terms",
+            body='{"terms": {"web-1": 3, "web-2": 7, "db": 3}, "missing": 1, "other": 4, "total": 18}',
+            content_type="application/json"
+        )
+
+        query = api.SearchQuery(api.SearchRange("10 minutes ago", relative=True), query="level:3", filter="streams:s1")
+        result = self.api.terms(query, "source", 3)
+
+        self.assertEquals([("web-2", 7), ("db", 3), ("web-1", 3)], result.terms)
+        self.assertEquals((1, 4, 18), (result.missing, result.other, result.total))
+        request = httpretty.last_request().querystring
+        self.assertEquals((["source"], ["3"], ["level:3"], ["streams:s1"], ["600"]),
+                          (request["field"], request["size"], request["query"], request["filter"], request["range"]))
+
+    @httpretty.activate
+    def test_histogram_buckets_are_in_time_order(self):
+        httpretty.register_uri(
+            httpretty.GET, "http://dummyhost:80/api/search/universal/absolute/histogram",
+            body='{"interval": "hour", "results": {"1429527600": 5, "1429520400": 2}}',
+            content_type="application/json"
+        )
+
+        sr = api.SearchRange("2015-04-20 09:00:00+00:00", "2015-04-20 11:00:00+00:00")
+        result = self.api.histogram(api.SearchQuery(sr), "hour")
+
+        self.assertEquals([(1429520400, 2), (1429527600, 5)], result.buckets)
+        self.assertEquals(["hour"], httpretty.last_request().querystring["interval"])
+
+    @httpretty.activate
+    def test_count_does_not_fetch_messages(self):
+        httpretty.register_uri(
+            httpretty.GET, "http://dummyhost:80/api/search/universal/relative",
+            body=self.generate_search_result(total_results=1234),
+            content_type="application/json"
+        )
+
+        self.assertEquals(1234, self.api.count(api.SearchQuery(api.SearchRange("10 minutes ago", relative=True))))
+        self.assertEquals((["1"], ["timestamp"]), (httpretty.last_request().querystring["limit"], httpretty.last_request().querystring["fields"]))
+
+    def test_merged_terms_keep_the_top(self):
+        results = [api.TermsResult({"terms": {"a": 5, "b": 2}, "other": 1, "total": 8}),
+                   api.TermsResult({"terms": {"b": 4, "c": 1}, "missing": 2, "total": 7})]
+        merged = api.TermsResult.merge(results, 2)
+
+        self.assertEquals([("b", 6), ("a", 5)], merged.terms)
+        self.assertEquals((2, 2, 15), (merged.missing, merged.other, merged.total))
+
     def generate_search_result(self, total_results=1000):
         result = """{{
           "query": "*",
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import json
+import unittest
+from benchmarks.pipeline import run_case, STAGES
+from benchmarks.synthetic import SyntheticMessages
+from glogcli.graylog_api import SearchResult
+
+
+class SyntheticMessagesTestCase(unittest.TestCase):
+
+    def test_messages_are_deterministic(self):
+        self.assertEquals(list(SyntheticMessages(5, seed=3)), list(SyntheticMessages(5, seed=3)))
+        self.assertNotEquals(list(SyntheticMessages(5, seed=3)), list(SyntheticMessages(5, seed=4)))
+
+    def test_shapes(self):
+        wide = next(iter(SyntheticMessages.shape('wide', 1)))['message']
+        long = next(iter(SyntheticMessages.shape('long', 1)))['message']
+
+        self.assertEquals(50, len([f for f in wide if f.startswith('field_')]))
+        self.assertGreaterEqual(len(long['message']), 4096)
+
+    def test_chunks_decode_to_the_payload(self):
+        synthetic = SyntheticMessages(50, extra_fields=2)
+        chunks = list(synthetic.chunks(chunk_size=500))
+
+        self.assertGreater(len(chunks), 1)
+        self.assertEquals(synthetic.payload(), json.loads(u''.join(chunks)))
+
+        result = SearchResult.from_stream(iter(chunks))
+        messages = list(result.messages)
+        self.assertEquals(50, len(messages))
+        self.assertEquals(50, result.total_results)
+        self.assertTrue(all(a.timestamp < b.timestamp for a, b in zip(messages, messages[1:])))
+
+
+class PipelineBenchmarkTestCase(unittest.TestCase):
+
+    def test_every_stage_runs(self):
+        for stage, _ in STAGES:
+            result = run_case(stage, 'short', 20, 1)
+            self.assertEquals(20, result['size'])
+            self.assertGreater(result['per_second'], 0)
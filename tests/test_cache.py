@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import arrow
+import httpretty
+import glogcli.graylog_api as api
+from glogcli.cache import ResultCache, MetadataCache
+
+
+class ResultCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_store_and_read(self):
+        cache = ResultCache(self.directory)
+        key = cache.key("url", {"query": "*"})
+
+        self.assertIsNone(cache.read(key))
+        cache.store(key, u'{"message": "café"}')
+
+        self.assertEquals(u'{"message": "café"}', u''.join(cache.read(key)))
+        self.assertEquals(1, cache.hits)
+        self.assertEquals(1, cache.misses)
+
+    def test_key_does_not_depend_on_parameter_order(self):
+        self.assertEquals(ResultCache.key("url", {"a": 1, "b": 2}), ResultCache.key("url", {"b": 2, "a": 1}))
+        self.assertNotEquals(ResultCache.key("url", {"a": 1}), ResultCache.key("url", {"a": 2}))
+
+    def test_partial_write_through_is_not_stored(self):
+        cache = ResultCache(self.directory)
+        chunks = cache.write_through("key", iter([u'{"a"', u': 1}']))
+        next(chunks)
+        chunks.close()
+
+        self.assertIsNone(cache.read("key"))
+        self.assertEquals([], os.listdir(self.directory))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = ResultCache(self.directory, max_size=25)
+        for i, key in enumerate(["a", "b", "c"]):
+            cache.store(key, u"x" * 10)
+            os.utime(os.path.join(self.directory, key + ".json"), (time.time() - 100 + i, time.time() - 100 + i))
+            if key == "b":
+                list(cache.read("a"))
+
+        cache.evict()
+        self.assertIsNotNone(cache.read("a"))
+        self.assertIsNone(cache.read("b"))
+        self.assertIsNotNone(cache.read("c"))
+
+
+class MetadataCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_entries_expire_after_ttl(self):
+        cache = MetadataCache(self.directory, ttl=60)
+        cache.write("http://host/api/", "john", "streams", {"streams": []})
+        self.assertEquals({"streams": []}, cache.read("http://host/api/", "john", "streams"))
+        self.assertIsNone(cache.read("http://host/api/", "jane", "streams"))
+
+        path = os.path.join(self.directory, os.listdir(self.directory)[0])
+        os.utime(path, (time.time() - 120, time.time() - 120))
+        self.assertIsNone(cache.read("http://host/api/", "john", "streams"))
+
+    def test_refresh_ignores_stored_entries(self):
+        MetadataCache(self.directory).write("http://host/api/", "john", "streams", {"streams": []})
+        self.assertIsNone(MetadataCache(self.directory, refresh=True).read("http://host/api/", "john", "streams"))
+
+    @httpretty.activate
+    def test_metadata_is_fetched_once_per_ttl(self):
+        httpretty.register_uri(httpretty.GET, "http://dummyhost:80/api/users/dummy", body='{"timezone": "UTC"}', content_type="application/json")
+        httpretty.register_uri(httpretty.GET, "http://dummyhost:80/api/streams/enabled", body='{"streams": []}', content_type="application/json")
+
+        for _ in range(2):
+            graylog_api = api.GraylogAPI("dummyhost", 80, "dummy", password="dummy")
+            graylog_api.metadata_cache = MetadataCache(self.directory)
+            graylog_api.prefetch_metadata(["user_info", "streams"])
+            self.assertEquals({"timezone": "UTC"}, graylog_api.user_info())
+            self.assertEquals({"streams": []}, graylog_api.streams())
+
+        paths = [request.path for request in httpretty.HTTPretty.latest_requests]
+        self.assertEquals(["/api/streams/enabled", "/api/users/dummy", "/api/users/dummy"], sorted(paths))
+
+    @httpretty.activate
+    def test_credentials_are_checked_with_a_warm_cache(self):
+        MetadataCache(self.directory).write("http://dummyhost:80/api/", "dummy", "user_info", {"timezone": "UTC"})
+        httpretty.register_uri(httpretty.GET, "http://dummyhost:80/api/users/dummy", status=401, body="")
+
+        graylog_api = api.GraylogAPI("dummyhost", 80, "dummy", password="wrong")
+        graylog_api.metadata_cache = MetadataCache(self.directory)
+        with self.assertRaises(SystemExit):
+            graylog_api.prefetch_metadata(["user_info"])
+
+
+class CachedSearchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.api = api.GraylogAPI("dummyhost", 80, "dummy", password="dummy")
+        self.api.cache = ResultCache(self.directory)
+        body = json.dumps({"query": "*", "total_results": 1, "messages": [
+            {"message": {"_id": "a", "timestamp": "2016-11-21T10:00:00.000Z", "message": "cached"}}
+        ]})
+        httpretty.enable()
+        self.addCleanup(httpretty.disable)
+        self.addCleanup(httpretty.reset)
+        httpretty.register_uri(httpretty.GET, "http://dummyhost:80/api/search/universal/absolute", body=body,
+                               content_type="application/json")
+
+    def test_past_ranges_are_served_from_cache(self):
+        query = api.SearchQuery(api.SearchRange("2016-11-21 09:00:00", "2016-11-21 11:00:00"))
+        for _ in range(3):
+            self.assertEquals(["a"], [m.message_dict["_id"] for m in self.api.search_messages(query)])
+            self.assertEquals("a", self.api.search(query).messages[0].message_dict["_id"])
+
+        self.assertEquals(2, len(httpretty.HTTPretty.latest_requests))
+        self.assertEquals(4, self.api.cache.hits)
+
+    def test_recent_ranges_are_not_cached(self):
+        query = api.SearchQuery(api.SearchRange("10 minutes ago", arrow.now()))
+        list(self.api.search_messages(query))
+        list(self.api.search_messages(query))
+
+        self.assertEquals(2, len(httpretty.HTTPretty.latest_requests))
+        self.assertEquals(0, self.api.cache.hits + self.api.cache.misses)
@@ -0,0 +1,73 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import arrow
+from click.testing import CliRunner
+from mock import patch
+from benchmarks.fakeserver import FakeGraylog
+from glogcli import cli
+# output reloads sys when it is first imported, which would undo the CliRunner stream capture
+import glogcli.output  # noqa
+
+
+class CliTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeGraylog(rate=2, backfill=1800).start()
+        self.addCleanup(self.server.stop)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.config = os.path.join(self.directory, "glogcli.cfg")
+        with open(self.config, "w") as f:
+            f.write("[environment:default]\nhost=127.0.0.1\nport={}\nusername=user\n\n"
+                    "[cache]\ndirectory={}\n".format(self.server.port, os.path.join(self.directory, "cache")))
+
+    def run_cli(self, *args):
+        result = CliRunner().invoke(cli.run, ["-c", self.config, "--no-tls", "-p", "secret", "-st", "*"] + list(args))
+        self.assertEquals(0, result.exit_code, result.output)
+        return result.output
+
+    def test_cache_summary_is_only_printed_with_stats(self):
+        start = arrow.get(self.server.start_ms / 1000.0).to("local")
+        search_range = ["-@", start.format("YYYY-MM-DD HH:mm:ss"), "-#", start.replace(minutes=+5).format("YYYY-MM-DD HH:mm:ss"), "-n", "3"]
+
+        self.assertNotIn("Result cache", self.run_cli(*search_range))
+        self.assertIn("Result cache: 1 hits, 0 misses", self.run_cli("--stats", *search_range))
+
+    def test_environments_are_searched_on_their_own_ports(self):
+        other = FakeGraylog(rate=2, backfill=1800, seed=1).start()
+        self.addCleanup(other.stop)
+        with open(self.config, "a") as f:
+            for name, server in (("dc1", self.server), ("dc2", other)):
+                f.write("\n[environment:{}]\nhost=127.0.0.1\nport={}\nusername=user\n".format(name, server.port))
+
+        lines = self.run_cli("-e", "dc*", "--no-color", "-n", "4").splitlines()
+
+        self.assertEquals(4, len(lines))
+        self.assertEquals(set(["[dc1]", "[dc2]"]), set(line.split()[0] for line in lines))
+
+    def test_chart_ranges_with_too_many_buckets_are_rejected(self):
+        result = CliRunner().invoke(cli.run, ["-c", self.config, "--no-tls", "-p", "secret", "-st", "*",
+                                              "--chart", "--bucket", "second", "-@", "2 days ago"])
+
+        self.assertEquals(1, result.exit_code, result.output)
+        self.assertIn("--chart draws at most 10000 bars, use --bucket minute for this range.", result.output)
+        # a row per minute of the 30 minutes backfilled by the server, 2 messages a second
+        self.assertIn("  120  ", self.run_cli("--chart", "--bucket", "minute", "-@", "2 days ago", "--no-color"))
+
+
+class MainTestCase(unittest.TestCase):
+
+    @patch('glogcli.cli.sync')
+    @patch('glogcli.cli.run')
+    def test_sync_is_picked_with_a_flag(self, run, sync):
+        with patch.object(sys, 'argv', ['glogcli', 'sync']):
+            cli.main()
+        run.assert_called_once_with()
+        self.assertFalse(sync.called)
+
+        with patch.object(sys, 'argv', ['glogcli', '-e', 'dev', '--sync', 'source:x', '--', '--sync']):
+            cli.main()
+        sync.assert_called_once_with(args=['-e', 'dev', 'source:x', '--', '--sync'], prog_name='glogcli --sync')
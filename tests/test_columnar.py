@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+import arrow
+from glogcli.columnar import ColumnarWriter, import_pyarrow
+from glogcli.graylog_api import Message
+
+
+pyarrow = import_pyarrow()
+
+
+@unittest.skipIf(pyarrow is None, "pyarrow is not installed")
+class ColumnarWriterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.timestamp = arrow.get("2016-11-21T10:00:00.123Z")
+        self.messages = [Message({'message': {
+            'timestamp': self.timestamp.replace(seconds=+i).isoformat(),
+            'level': 3 + i % 2,
+            'message': u'message %d é' % i,
+            'source': 'host-%d' % (i % 2),
+            'status': 200 + i
+        }}) for i in range(5)]
+        self.fields = ['timestamp', 'level', 'message', 'source', 'status', 'missing']
+
+    def test_parquet_dump(self):
+        path = os.path.join(self.directory, 'dump.parquet')
+        ColumnarWriter(path, self.fields, 'parquet', batch_size=2).write(iter(self.messages))
+
+        import pyarrow.parquet
+        table = pyarrow.parquet.read_table(path)
+        self.assertEquals(pyarrow.dictionary(pyarrow.int32(), pyarrow.string()), table.schema.field('source').type)
+        self.assert_table(table)
+
+    def test_arrow_dump(self):
+        path = os.path.join(self.directory, 'dump.arrow')
+        ColumnarWriter(path, self.fields, 'arrow', batch_size=2).write(iter(self.messages))
+
+        table = pyarrow.RecordBatchFileReader(pyarrow.OSFile(path)).read_all()
+        self.assertEquals(3, table.column('source').num_chunks)
+        self.assert_table(table)
+
+    def test_empty_dump_writes_schema(self):
+        path = os.path.join(self.directory, 'empty.arrow')
+        ColumnarWriter(path, ['timestamp', 'message'], 'arrow').write(iter([]))
+
+        table = pyarrow.RecordBatchFileReader(pyarrow.OSFile(path)).read_all()
+        self.assertEquals(0, table.num_rows)
+        self.assertEquals(['timestamp', 'message'], table.schema.names)
+
+    def assert_table(self, table):
+        rows = table.drop(['timestamp']).to_pydict()
+        self.assertEquals(self.fields, table.schema.names)
+        self.assertEquals(pyarrow.timestamp('ms', tz='UTC'), table.schema.field('timestamp').type)
+        self.assertEquals([3, 4, 3, 4, 3], rows['level'])
+        self.assertEquals([u'message %d é' % i for i in range(5)], rows['message'])
+        self.assertEquals([u'host-0', u'host-1'] * 2 + [u'host-0'], rows['source'])
+        self.assertEquals([u'200', u'201', u'202', u'203', u'204'], rows['status'])
+        self.assertEquals([None] * 5, rows['missing'])
+        epoch_ms = [self.timestamp.timestamp * 1000 + 123 + i * 1000 for i in range(5)]
+        self.assertEquals(epoch_ms, table.column('timestamp').cast(pyarrow.int64()).to_pylist())
@@ -1,6 +1,8 @@
 import unittest
-from mock import Mock, MagicMock
-from glogcli.utils import extract_fields_from_format, get_color_option
+from mock import Mock, MagicMock, patch
+from six.moves import configparser
+from glogcli.graylog_api import GraylogAPI, GraylogAPIFactory
+from glogcli.utils import extract_fields_from_format, get_color_option, get_environments
 
 
 class UtilsTestCase(unittest.TestCase):
@@ -21,3 +23,46 @@ class UtilsTestCase(unittest.TestCase):
         mock.get = Mock(return_value=get_return)
         mock.has_option = Mock(return_value=has_option_return)
         return mock
+
+    def test_get_environments_expands_lists_and_globs(self):
+        cfg = configparser.ConfigParser()
+        for section in ("environment:dc1", "environment:dc2", "environment:staging", "format:short"):
+            cfg.add_section(section)
+
+        self.assertEquals(["default"], get_environments(cfg, "default"))
+        self.assertEquals(["dc1", "dc2"], get_environments(cfg, "dc*"))
+        self.assertEquals(["staging", "dc1", "dc2"], get_environments(cfg, "staging, dc*,dc1"))
+
+
+class GraylogAPIFactoryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cfg = configparser.ConfigParser()
+        for name, port in (("dc1", "9000"), ("dc2", "12900"), ("dc3", None)):
+            section = "environment:" + name
+            self.cfg.add_section(section)
+            self.cfg.set(section, "host", name + ".example")
+            self.cfg.set(section, "username", "john")
+            if port:
+                self.cfg.set(section, "port", port)
+        for method in ("prefetch_metadata", "update_host_timezone"):
+            patcher = patch.object(GraylogAPI, method)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(GraylogAPI, "user_info", return_value={})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def base_urls(self, port=None, no_tls=False):
+        return [GraylogAPIFactory.get_graylog_api(self.cfg, name, None, "secret", port, None, no_tls, None, False).base_url
+                for name in get_environments(self.cfg, "dc*")]
+
+    def test_every_environment_uses_its_own_port(self):
+        self.assertEquals(["https://dc1.example:9000/api/", "https://dc2.example:12900/api/", "https://dc3.example:443/api/"],
+                          self.base_urls())
+        self.assertEquals(["http://dc1.example:9000/api/", "http://dc2.example:12900/api/", "http://dc3.example:80/api/"],
+                          self.base_urls(no_tls=True))
+
+    def test_port_option_overrides_the_configuration(self):
+        self.assertEquals(["https://dc1.example:8443/api/", "https://dc2.example:8443/api/", "https://dc3.example:8443/api/"],
+                          self.base_urls(port="8443"))
@@ -1,6 +1,7 @@
 import unittest
 import arrow
-from glogcli.dateutils import datetime_parser, datetime_converter
+from glogcli.dateutils import datetime_parser, datetime_converter, iso_timestamp_parser, iso_epoch_seconds, TimestampRenderer
+from glogcli import utils
 
 
 class DateUtilsTestCase(unittest.TestCase):
@@ -26,4 +27,45 @@ class DateUtilsTestCase(unittest.TestCase):
         now = arrow.now()
         self.assertIsNone(datetime_converter(None))
         self.assertEquals(datetime_converter(now), now)
-        self.assertEquals(datetime_converter("1 day ago") , arrow.now().replace(days=-1, microsecond=0, tzinfo='local'))
\ No newline at end of file
+        self.assertEquals(datetime_converter("1 day ago") , arrow.now().replace(days=-1, microsecond=0, tzinfo='local'))
+
+    def test_iso_timestamp_parser(self):
+        timestamps = [
+            "2015-04-20T10:43:01.793Z",
+            "2015-04-20T10:43:01Z",
+            "2015-04-20 10:43:01.7",
+            "2015-04-20T10:43:01.123456+02:00",
+            "2015-04-20T10:43:01.000-0330",
+        ]
+        for ts in timestamps:
+            self.assertEquals(arrow.get(ts), iso_timestamp_parser(ts))
+            self.assertEquals(arrow.get(ts).utcoffset(), iso_timestamp_parser(ts).utcoffset())
+
+        now = arrow.now()
+        self.assertEquals(now, iso_timestamp_parser(now))
+        self.assertEquals(arrow.get(1461000000), iso_timestamp_parser(1461000000))
+
+    def test_iso_epoch_seconds(self):
+        timestamps = [
+            "2015-04-20T10:43:01.793Z",
+            "2015-04-20T10:43:01.999Z",
+            "2015-04-20T10:43:01Z",
+            "2015-04-20T10:43:01.123456+02:00",
+            "2015-04-20T10:43:01.000-0330",
+        ]
+        for ts in timestamps:
+            self.assertEquals(arrow.get(ts).timestamp, iso_epoch_seconds(ts))
+        self.assertEquals(1461000000, iso_epoch_seconds(1461000000))
+
+    def test_timestamp_renderer_matches_arrow_format(self):
+        base = arrow.get("2016-10-30T00:59:58.100Z")
+        timestamps = [base.replace(microseconds=+i * 250999) for i in range(20)]
+        for timezone in ("local", "UTC", "Europe/Berlin", "America/Sao_Paulo"):
+            renderer = TimestampRenderer(timezone)
+            for ts in timestamps:
+                self.assertEquals(ts.to(timezone).format(utils.DEFAULT_DATE_FORMAT), renderer.render(ts))
+            self.assertEquals(len(set(ts.timestamp for ts in timestamps)), len(renderer.seconds))
+
+    def test_timestamp_renderer_without_milliseconds(self):
+        ts = arrow.get("2016-10-30T00:59:58.100Z")
+        self.assertEquals("2016-10-30 00:59", TimestampRenderer("UTC", "YYYY-MM-DD HH:mm").render(ts))
@@ -0,0 +1,76 @@
+import unittest
+import arrow
+from benchmarks.fakeserver import FakeGraylog
+from benchmarks.loadtest import build_api, run_dump, run_follow
+from glogcli.graylog_api import SearchRange, SearchQuery
+
+
+class FakeGraylogTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeGraylog(rate=20, backfill=600, max_result_window=500).start()
+        self.addCleanup(self.server.stop)
+        self.api = build_api(self.server)
+        self.addCleanup(self.api.close)
+
+    def test_metadata(self):
+        self.assertEquals("UTC", self.api.host_tz)
+        self.assertEquals(["stream-1", "stream-2"], [s["id"] for s in self.api.streams()["streams"]])
+        self.assertEquals(1, len(self.api.get_saved_queries()["searches"]))
+
+    def test_relative_search_returns_newest_first(self):
+        result = self.api.search(SearchQuery(SearchRange(from_time="1 minute ago", relative=True), limit=5))
+
+        self.assertEquals(5, len(result.messages))
+        self.assertGreater(result.total_results, 1000)
+        timestamps = [m.timestamp for m in result.messages]
+        self.assertEquals(sorted(timestamps, reverse=True), timestamps)
+
+    def test_pages_past_the_result_window(self):
+        from_time = arrow.get(self.server.start_ms / 1000.0)
+        to_time = from_time.replace(minutes=+2)
+        query = SearchQuery(SearchRange(from_time=from_time, to_time=to_time), filter="streams:stream-2")
+
+        ids = [m.message_dict["_id"] for m in self.api.search_messages(query, page_size=200)]
+        expected = self.server.ids_between(self.server.start_ms, self.server.start_ms + 120000, streams=["stream-2"])
+        self.assertEquals(expected, ids)
+        self.assertEquals(1200, len(ids))
+
+    def test_aggregations(self):
+        from_time = arrow.get(self.server.start_ms / 1000.0)
+        query = SearchQuery(SearchRange(from_time=from_time, to_time=from_time.replace(minutes=+2)), filter="streams:stream-2")
+        expected = len(self.server.ids_between(self.server.start_ms, self.server.start_ms + 120000, streams=["stream-2"]))
+
+        self.assertEquals(expected, self.api.count(query))
+        self.assertEquals(expected, sum(count for _, count in self.api.histogram(query, "minute").buckets))
+        terms = self.api.terms(query, "source", 2)
+        self.assertEquals(2, len(terms.terms))
+        self.assertEquals(expected, terms.total)
+        self.assertEquals(expected, sum(count for _, count in terms.terms) + terms.other + terms.missing)
+
+    def test_stop_closes_open_connections(self):
+        self.api.search(SearchQuery(SearchRange(from_time="1 minute ago", relative=True), limit=5))
+        handlers = list(self.server.server.connections)
+        self.assertEquals(1, len(handlers))
+
+        self.server.stop()
+        self.assertFalse(handlers[0].is_alive())
+
+
+class LoadTestTestCase(unittest.TestCase):
+
+    def test_dump_delivers_every_message_once(self):
+        with FakeGraylog(rate=50, backfill=120, max_result_window=1000) as server:
+            report = run_dump(server, 60, workers=3)
+
+        self.assertEquals(report["expected"], report["delivered"])
+        self.assertEquals(0, report["dropped"])
+        self.assertEquals(0, report["duplicated"])
+
+    def test_follow_delivers_every_message_once(self):
+        with FakeGraylog(rate=50, backfill=10) as server:
+            report = run_follow(server, 1.5, interval=200)
+
+        self.assertGreater(report["delivered"], 50)
+        self.assertEquals(0, report["dropped"])
+        self.assertEquals(0, report["duplicated"])
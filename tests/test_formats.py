@@ -1,9 +1,11 @@
+# -*- coding: utf-8 -*-
+import json
 import unittest
 import arrow
 import syslog
 from glogcli import utils
 from termcolor import colored
-from glogcli.formats import TailFormatter, DumpFormatter, LogLevel
+from glogcli.formats import TailFormatter, DumpFormatter, CsvFormatter, TsvFormatter, NdjsonFormatter, LogLevel
 from glogcli.graylog_api import Message
 
 
@@ -31,6 +33,11 @@ class TailFormatterTestCase(FormatterTestCase):
         log = TailFormatter('({source}) - {message}', color=False).format(self.message)
         self.assertEquals('(dummy.source) - dummy message', log)
 
+    def test_format_tags_environment(self):
+        self.message.environment = u'dc1'
+        self.assertEquals('[dc1] (dummy.source) - dummy message', TailFormatter('({source}) - {message}', color=False).format(self.message))
+        self.assertEquals('dc1 dummy message', TailFormatter('{environment} {message}', color=False).format(self.message))
+
     def test_format_colored_with_level_debug(self):
         self.message.level = syslog.LOG_DEBUG
         log = TailFormatter('({source}) - {message}', color=True).format(self.message)
@@ -73,6 +80,21 @@ class TailFormatterTestCase(FormatterTestCase):
         log = TailFormatter('{blank_field}', fields=['blank_field'], color=False).format(self.message)
         self.assertEquals('', log)
 
+    def test_format_with_format_spec(self):
+        log = TailFormatter('[{level:<8}] {source:>14}', color=False).format(self.message)
+        self.assertEquals('[DEBUG   ]   dummy.source', log)
+
+    def test_format_with_conversion_falls_back_to_str_format(self):
+        formatter = TailFormatter('{source!s} {message}', color=False)
+        self.assertIsNone(formatter.pieces)
+        self.assertEquals('dummy.source dummy message', formatter.format(self.message))
+
+    def test_color_sequences_are_computed_once_per_level(self):
+        formatter = TailFormatter('{message}', color=True)
+        formatter.format(self.message)
+        formatter.format(self.message)
+        self.assertEquals([syslog.LOG_DEBUG], list(formatter.compiled_levels.keys()))
+
 
 class DumpFormatterTestCase(FormatterTestCase):
 
@@ -89,6 +111,35 @@ class DumpFormatterTestCase(FormatterTestCase):
         self.assertEquals("'DEBUG';''", log)
 
 
+class CsvFormatterTestCase(FormatterTestCase):
+
+    def test_header(self):
+        self.assertEquals('level,message', CsvFormatter(None, fields=['level', 'message']).header())
+
+    def test_format_escapes_quotes_and_delimiters(self):
+        self.message.message_dict['message'] = u'say "hi"; bye, café'
+        log = CsvFormatter(None, fields=['level', 'message', 'a']).format(self.message)
+        self.assertEquals(u'DEBUG,"say ""hi""; bye, café",1', log)
+
+    def test_tsv_format(self):
+        log = TsvFormatter(None, fields=['level', 'message', 'blank']).format(self.message)
+        self.assertEquals('DEBUG\tdummy message\t', log)
+
+
+class NdjsonFormatterTestCase(FormatterTestCase):
+
+    def test_format(self):
+        log = NdjsonFormatter(None, fields=['timestamp', 'level', 'message', 'a', 'blank']).format(self.message)
+        self.assertEquals({
+            'timestamp': self.timestamp.isoformat(),
+            'level': 'DEBUG',
+            'message': 'dummy message',
+            'a': 1,
+            'blank': None
+        }, json.loads(log))
+        self.assertIsNone(NdjsonFormatter(None).header())
+
+
 class LogLevelTestCase(unittest.TestCase):
 
     def test_get_log_level_from_code(self):
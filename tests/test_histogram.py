@@ -0,0 +1,57 @@
+import unittest
+from six import BytesIO
+from glogcli.graylog_api import Message
+from glogcli.histogram import LevelHistogram, import_numpy
+from glogcli.output import AggregationPrinter
+
+
+def make_message(timestamp, level=None):
+    message = {'timestamp': timestamp}
+    if level is not None:
+        message['level'] = level
+    return Message({'message': message})
+
+
+class LevelHistogramTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.messages = [
+            make_message("2016-01-01T00:00:05.000Z", 3),
+            make_message("2016-01-01T00:00:59.999Z", 3),
+            make_message("2016-01-01T00:01:00.000Z"),
+            make_message("2016-01-01T00:03:30.000Z", 7),
+            make_message("2016-01-01T00:03:31.000Z", "ERROR"),
+        ]
+
+    def test_counts_per_bucket_and_level(self):
+        starts, counts = LevelHistogram(60, use_numpy=False).consume(self.messages).counts()
+
+        self.assertEquals([1451606400, 1451606460, 1451606520, 1451606580], starts)
+        self.assertEquals([0, 0, 0, 2, 0, 0, 0, 0], counts[0])
+        self.assertEquals([0, 0, 0, 0, 0, 0, 1, 0], counts[1])
+        self.assertEquals([0] * 8, counts[2])
+        self.assertEquals([0, 0, 0, 0, 0, 0, 1, 1], counts[3])
+
+    @unittest.skipIf(import_numpy() is None, "numpy is not installed")
+    def test_numpy_counts_match_the_fallback(self):
+        histogram = LevelHistogram(1).consume(self.messages * 3)
+
+        self.assertIsNotNone(histogram.numpy)
+        self.assertEquals(LevelHistogram(1, use_numpy=False).consume(self.messages * 3).counts(), histogram.counts())
+
+    def test_empty(self):
+        self.assertEquals(([], []), LevelHistogram(60).counts())
+
+    def test_chart_bars_are_proportional(self):
+        output = BytesIO()
+        histogram = LevelHistogram(60).consume(self.messages)
+        AggregationPrinter().print_level_histogram(histogram, "minute", output, color=False, width=40)
+
+        lines = output.getvalue().splitlines()
+        self.assertEquals("E ERROR  I INFO  D DEBUG  (5 messages, a bar per minute)", lines[0])
+        self.assertEquals(5, len(lines))
+        bars = [line.split("  ")[-1] for line in lines[1:]]
+        self.assertEquals("E" * 19, bars[0])
+        self.assertEquals("I" * 10, bars[1])
+        self.assertEquals("IIIIIIIIIIDDDDDDDDD", bars[3])
+        self.assertTrue(lines[3].endswith("  0"))
@@ -25,6 +25,11 @@ class CliInterfaceTestCase(unittest.TestCase):
         stream_filter = CliInterface.select_stream(graylog_api, '123456')
         self.assertEquals('streams:123456', stream_filter)
 
+    def test_select_stream_given_several_streams(self):
+        graylog_api = self._mock_graylog_api_streams(user=self.admin_user)
+        stream_filter = CliInterface.select_stream(graylog_api, '123,456')
+        self.assertEquals('streams:123 OR streams:456', stream_filter)
+
     def test_select_stream_with_default_stream_set(self):
         graylog_api = self._mock_graylog_api_streams(user=self.admin_user, default_stream='abc')
         stream_filter = CliInterface.select_stream(graylog_api, None)
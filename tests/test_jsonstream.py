@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import json
+import unittest
+from glogcli.jsonstream import iter_json_object
+from glogcli.graylog_api import SearchResult
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class IterJsonObjectTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.document = {
+            u"query": u"*",
+            u"messages": [{u"message": {u"_id": u"id-%d" % i, u"message": u"café \"%d\"" % i, u"level": i}} for i in range(5)],
+            u"total_results": 12345,
+            u"time": 1.5,
+            u"fields": [u"source", u"level"],
+            u"flag": True
+        }
+        self.text = json.dumps(self.document)
+
+    def test_decodes_any_chunking(self):
+        for size in (1, 2, 7, 64, len(self.text)):
+            members = {}
+            items = list(iter_json_object(chunked(self.text, size), u"messages", members))
+
+            self.assertEquals(self.document[u"messages"], items)
+            self.assertEquals(12345, members[u"total_results"])
+            self.assertEquals(1.5, members[u"time"])
+            self.assertEquals(True, members[u"flag"])
+            self.assertNotIn(u"messages", members)
+
+    def test_empty_array_and_object(self):
+        members = {}
+        self.assertEquals([], list(iter_json_object([u'{"messages": [ ], "a": 1}'], u"messages", members)))
+        self.assertEquals({u"a": 1}, members)
+        self.assertEquals([], list(iter_json_object([u'{ }'], u"messages", {})))
+
+    def test_truncated_stream_raises(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_object(chunked(self.text[:-20], 10), u"messages", {}))
+
+    def test_search_result_from_stream(self):
+        result = SearchResult.from_stream(chunked(self.text, 16))
+        self.assertIsNone(result.total_results)
+
+        messages = list(result.messages)
+        self.assertEquals([u"id-%d" % i for i in range(5)], [m.message_dict[u"_id"] for m in messages])
+        self.assertEquals(12345, result.total_results)
+        self.assertEquals(u"*", result.query)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+import arrow
+from glogcli.graylog_api import Message, SearchQuery, SearchRange
+from glogcli.mirror import LocalMirror
+
+
+class FakeAPI(object):
+
+    def __init__(self, messages):
+        self.messages = messages
+
+    def search_messages(self, query):
+        return iter(self.messages)
+
+
+class LocalMirrorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.mirror = LocalMirror(os.path.join(directory, 'mirror.db'))
+        self.addCleanup(self.mirror.close)
+
+        self.start = arrow.get("2016-11-21T10:00:00Z")
+        entries = [
+            ('a', 3, 'web-1', 'stream-1', u'GET /index timeout'),
+            ('b', 6, 'web-2', 'stream-1', u'GET /login ok'),
+            ('c', 3, 'db-1', 'stream-2', u'connection timeout to replica'),
+            ('d', 7, 'web-1', 'stream-2', u'café served'),
+        ]
+        self.messages = [Message({'message': {
+            '_id': message_id, 'level': level, 'source': source, 'streams': [stream], 'message': text,
+            'timestamp': self.start.replace(seconds=+i).isoformat(), 'status': 200 + i
+        }}) for i, (message_id, level, source, stream, text) in enumerate(entries)]
+
+        self.assertEquals(4, self.mirror.sync(FakeAPI(self.messages), None, page_size=3))
+
+    def ids(self, query="*", filter=None, limit=None, from_seconds=0, to_seconds=10, **kwargs):
+        search_range = SearchRange(self.start.replace(seconds=+from_seconds), self.start.replace(seconds=+to_seconds))
+        q = SearchQuery(search_range, query=query, filter=filter, limit=limit, **kwargs)
+        return [m.message_dict['_id'] for m in self.mirror.search_messages(q)]
+
+    def test_sync_skips_known_messages(self):
+        self.assertEquals(0, self.mirror.sync(FakeAPI(self.messages), None))
+        self.assertEquals(['a', 'b', 'c', 'd'], self.ids())
+
+    def test_messages_without_id_are_stored_once(self):
+        messages = [Message({'message': {'timestamp': self.start.isoformat(), 'source': 'web-3', 'message': text}})
+                    for text in (u'no id', u'no id', u'another')]
+
+        self.assertEquals(2, self.mirror.sync(FakeAPI(messages), None))
+        self.assertEquals(0, self.mirror.sync(FakeAPI(messages), None))
+        q = SearchQuery(SearchRange(self.start, self.start.replace(seconds=+10)), query="source:web-3")
+        self.assertEquals([u'another', u'no id'], sorted(m.message for m in self.mirror.search_messages(q)))
+
+    def test_full_text_terms(self):
+        self.assertEquals(['a', 'c'], self.ids("timeout"))
+        self.assertEquals(['a'], self.ids("timeout AND message:GET"))
+        self.assertEquals(['d'], self.ids(u"café"))
+        self.assertEquals(['c'], self.ids('"timeout to replica"'))
+
+    def test_unsupported_syntax_is_reported(self):
+        for query in ("NOT timeout", '"unbalanced'):
+            with self.assertRaises(SystemExit):
+                self.ids(query)
+
+    def test_field_terms(self):
+        self.assertEquals(['a', 'd'], self.ids("source:web-1"))
+        self.assertEquals(['a', 'b', 'd'], self.ids("source:web*"))
+        self.assertEquals(['a', 'c'], self.ids("level:ERROR"))
+        self.assertEquals(['b'], self.ids("status:201"))
+
+    def test_stream_filter_range_and_limit(self):
+        self.assertEquals(['c', 'd'], self.ids(filter="streams:stream-2"))
+        self.assertEquals(['a', 'b', 'c', 'd'], self.ids(filter="streams:stream-1 OR streams:stream-2"))
+        self.assertEquals(['b', 'c'], self.ids(from_seconds=1, to_seconds=2))
+        self.assertEquals(['a', 'b'], self.ids(limit=2))
+
+    def test_search_returns_newest_messages_first(self):
+        q = SearchQuery(SearchRange(self.start, self.start.replace(seconds=+10)), limit=2)
+        result = self.mirror.search(q)
+        self.assertEquals(['d', 'c'], [m.message_dict['_id'] for m in result.messages])
+        self.assertEquals(self.messages[3].timestamp, result.messages[0].timestamp)
@@ -0,0 +1,276 @@
+import errno
+import os
+import shutil
+import tempfile
+import unittest
+import arrow
+from mock import patch
+from six import BytesIO
+from glogcli.graylog_api import Message, SearchRange, SearchQuery, TermsResult
+from glogcli.formats import TailFormatter, TsvFormatter
+from glogcli.sketches import Quantiles
+from glogcli.output import MessageBuffer, FollowCursor, PollingInterval, LogPrinter, OutputSink, OutputClosed, AggregationPrinter
+
+
+def make_message(message_id, timestamp):
+    return Message({'message': {'_id': message_id, 'timestamp': timestamp, 'message': message_id}})
+
+
+class MessageBufferTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.now = arrow.utcnow()
+
+    def test_buffered_ids_are_counted_as_hits(self):
+        buffer = MessageBuffer()
+        buffer.insert('a', self.now)
+
+        self.assertTrue(buffer.is_object_buffered('a'))
+        self.assertFalse(buffer.is_object_buffered('b'))
+        self.assertEquals(1, buffer.hits)
+        self.assertEquals(1, buffer.misses)
+
+    def test_evict_only_ids_older_than_window(self):
+        buffer = MessageBuffer()
+        buffer.insert('old', self.now.replace(seconds=-10))
+        buffer.insert('new', self.now.replace(seconds=-1))
+
+        buffer.evict_older_than(self.now.replace(seconds=-5))
+
+        self.assertFalse(buffer.is_object_buffered('old'))
+        self.assertTrue(buffer.is_object_buffered('new'))
+        self.assertEquals(1, buffer.evictions)
+
+    def test_max_size_evicts_oldest_first(self):
+        buffer = MessageBuffer(max_size=2)
+        buffer.insert('b', self.now.replace(seconds=-2))
+        buffer.insert('a', self.now.replace(seconds=-3))
+        buffer.insert('c', self.now.replace(seconds=-1))
+
+        self.assertEquals(2, len(buffer))
+        self.assertFalse(buffer.is_object_buffered('a'))
+        self.assertTrue(buffer.is_object_buffered('b'))
+        self.assertTrue(buffer.is_object_buffered('c'))
+
+    def test_reinserting_an_id_keeps_a_single_entry(self):
+        buffer = MessageBuffer()
+        buffer.insert('a', self.now)
+        buffer.insert('a', self.now)
+
+        self.assertEquals(1, len(buffer))
+        self.assertEquals(1, len(buffer.expirations))
+
+
+class FollowCursorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.now = arrow.utcnow()
+
+    def test_advance_tracks_ids_at_newest_timestamp(self):
+        cursor = FollowCursor(self.now.replace(seconds=-10))
+        cursor.advance(make_message('a', self.now.replace(seconds=-1)))
+        cursor.advance(make_message('b', self.now))
+        cursor.advance(make_message('c', self.now))
+        cursor.advance(make_message('late', self.now.replace(seconds=-5)))
+
+        self.assertEquals(self.now, cursor.timestamp)
+        self.assertEquals(set(['b', 'c']), cursor.ids)
+        self.assertTrue(cursor.has_seen(make_message('b', self.now)))
+        self.assertFalse(cursor.has_seen(make_message('d', self.now)))
+
+    def test_next_range_starts_at_the_lag_allowance(self):
+        cursor = FollowCursor(self.now)
+        search_range = cursor.next_range(latency=3)
+
+        self.assertEquals(self.now.replace(seconds=-3), search_range.from_time)
+        self.assertIsNone(search_range.to_time)
+
+
+class PollingIntervalTestCase(unittest.TestCase):
+
+    def test_backs_off_when_idle_and_tightens_when_busy(self):
+        interval = PollingInterval(minimum=500, maximum=3000)
+
+        self.assertEquals([1000, 2000, 3000, 3000], [interval.update(0) for _ in range(4)])
+        self.assertEquals([1500, 750, 500], [interval.update(10) for _ in range(3)])
+
+
+class FakeFollowAPI(object):
+
+    def __init__(self, polls):
+        self.polls = list(polls)
+        self.ranges = []
+
+    def search_messages(self, query):
+        self.ranges.append(query.search_range)
+        return iter(self.polls.pop(0))
+
+
+class SortedAPI(object):
+
+    def __init__(self, messages):
+        self.messages = messages
+
+    def search_messages(self, query):
+        return iter(sorted(self.messages, key=lambda m: m.message_dict[query.sort], reverse=not query.ascending))
+
+    def search(self, query, fetch_all=False):
+        return FakeResult(list(self.search_messages(query))[:query.limit])
+
+
+class FakeResult(object):
+
+    def __init__(self, messages):
+        self.messages = messages
+
+
+class LogPrinterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.now = arrow.utcnow()
+
+    def test_header_is_written_once_to_a_new_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'dump.csv')
+        query = SearchQuery(SearchRange(from_time=self.now.replace(seconds=-3)))
+
+        for batch in (['a', 'b'], ['c']):
+            api = FakeFollowAPI([[make_message(i, self.now) for i in batch]])
+            LogPrinter().run_logprint(api, query, IdFormatter(), output=path, header=u'id')
+
+        with open(path) as f:
+            self.assertEquals('id\na\nb\nc\n', f.read())
+
+    def test_tail_lines_are_stripped_and_dump_lines_keep_empty_columns(self):
+        query = SearchQuery(SearchRange(from_time=self.now.replace(seconds=-3)))
+        message = Message({'message': {'_id': 'a', 'timestamp': self.now, 'message': ' a ', 'source': ''}})
+        tail, dump = BytesIO(), BytesIO()
+
+        LogPrinter().run_logprint(FakeFollowAPI([[message]]), query, TailFormatter("{message}", color=False), output=tail)
+        LogPrinter().run_logprint(FakeFollowAPI([[message]]), query, TsvFormatter(None, ['message', 'source']), output=dump)
+
+        self.assertEquals('a\n', tail.getvalue())
+        self.assertEquals(' a \t\n', dump.getvalue())
+
+    def test_sorted_results_are_printed_in_the_same_order_with_or_without_a_limit(self):
+        messages = [make_message(i, self.now.replace(seconds=-i)) for i in range(3)]
+        for message, level in zip(messages, (6, 3, 4)):
+            message.message_dict['level'] = level
+        api = SortedAPI(messages)
+        search_range = SearchRange(from_time=self.now.replace(seconds=-5))
+
+        for sort in ('level', 'timestamp'):
+            for ascending in (False, True):
+                orders = [[m.message_dict['_id'] for m in LogPrinter.fetch_messages(api, SearchQuery(search_range, limit=limit, sort=sort, ascending=ascending))]
+                          for limit in (None, 50)]
+                self.assertEquals(orders[0], orders[1])
+        self.assertEquals([1, 2, 0], [m.message_dict['_id'] for m in LogPrinter.fetch_messages(api, SearchQuery(search_range, sort='level'))])
+
+    @patch('time.sleep')
+    def test_follow_queries_from_the_high_water_mark(self, sleep):
+        first = [make_message('a', self.now.replace(seconds=-2)), make_message('b', self.now.replace(seconds=-1))]
+        second = [make_message('b', self.now.replace(seconds=-1)), make_message('c', self.now)]
+        api = FakeFollowAPI([first, second, []])
+        sleep.side_effect = [None, None, KeyboardInterrupt()]
+        output = BytesIO()
+
+        query = SearchQuery(SearchRange(from_time=self.now.replace(seconds=-3)))
+        LogPrinter().run_logprint(api, query, IdFormatter(), follow=True, output=output, latency=2)
+
+        self.assertEquals(b'a\nb\nc\n', output.getvalue())
+        self.assertEquals(self.now.replace(seconds=-3), api.ranges[1].from_time)
+        self.assertEquals(self.now.replace(seconds=-2), api.ranges[2].from_time)
+
+
+class ClosedPipe(object):
+
+    def __init__(self):
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        raise IOError(errno.EPIPE, "Broken pipe")
+
+    def flush(self):
+        pass
+
+
+class OutputSinkTestCase(unittest.TestCase):
+
+    def test_lines_are_written_in_large_chunks(self):
+        stream = BytesIO()
+        sink = OutputSink(stream, buffer_size=10, flush_interval=60)
+        sink.write(b'abc')
+        self.assertEquals(b'', stream.getvalue())
+        sink.write(b'defghi')
+        self.assertEquals(b'abc\ndefghi\n', stream.getvalue())
+        sink.write(b'j')
+        sink.close()
+        self.assertEquals(b'abc\ndefghi\nj\n', stream.getvalue())
+
+    def test_closed_pipe_raises_output_closed(self):
+        sink = OutputSink(ClosedPipe(), buffer_size=1)
+        with self.assertRaises(OutputClosed):
+            sink.write(b'line')
+
+    def test_closed_pipe_stops_fetching(self):
+        fetched = []
+
+        class EndlessAPI(object):
+            def search_messages(self, query):
+                i = 0
+                while True:
+                    fetched.append(i)
+                    yield make_message('id-%d' % i, arrow.utcnow())
+                    i += 1
+
+        pipe = ClosedPipe()
+        with patch.object(OutputSink, 'open', staticmethod(lambda output: OutputSink(output, buffer_size=1))):
+            query = SearchQuery(SearchRange(from_time=arrow.utcnow()))
+            LogPrinter().run_logprint(EndlessAPI(), query, IdFormatter(), output=pipe)
+
+        self.assertEquals(1, pipe.writes)
+        self.assertEquals([0], fetched)
+
+
+class IdFormatter(object):
+
+    def format(self, entry):
+        return entry.message_dict['_id']
+
+
+class AggregationPrinterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.terms = TermsResult({"terms": {u"web-1": 1200, u"db": 30}, "other": 70, "missing": 0, "total": 1300})
+
+    def test_terms_are_printed_as_an_aligned_table(self):
+        output = BytesIO()
+        AggregationPrinter().print_terms("source", self.terms, output)
+
+        self.assertEquals([
+            "source   count     %",
+            "web-1     1200  92.3",
+            "db          30   2.3",
+            "(other)     70   5.4",
+        ], output.getvalue().splitlines())
+
+    def test_terms_are_dumped_as_csv(self):
+        output = BytesIO()
+        AggregationPrinter('csv').print_terms("source", self.terms, output)
+
+        self.assertEquals(["source,count,%", "web-1,1200,92.3", "db,30,2.3", "(other),70,5.4"], output.getvalue().splitlines())
+
+    def test_rolling_quantiles_write_the_csv_header_once(self):
+        quantiles = Quantiles(["response_time"]).consume([make_message('a', '2016-01-01T00:00:00Z')])
+        quantiles.consume([Message({'message': {'response_time': 12.5}})])
+        output = BytesIO()
+        printer = AggregationPrinter('csv')
+        printer.print_quantiles(quantiles, [50], output=output, window_end=0)
+        printer.print_quantiles(quantiles, [50], output=output, window_end=60)
+
+        lines = output.getvalue().splitlines()
+        self.assertEquals(3, len(lines))
+        self.assertEquals("timestamp,field,count,min,p50,max", lines[0])
+        self.assertTrue(lines[2].endswith(",response_time,1,12.5,12.5,12.5"))
@@ -0,0 +1,253 @@
+import threading
+import time
+import unittest
+from collections import OrderedDict
+import arrow
+from glogcli.graylog_api import SearchRange, SearchQuery, HistogramResult
+from glogcli.parallel import TimeSlicedSearch, MergedSearch
+
+
+class FakeMessage(object):
+
+    def __init__(self, timestamp):
+        self.timestamp = timestamp
+        self.environment = None
+
+
+class StreamMessage(FakeMessage):
+
+    def __init__(self, message_id, timestamp):
+        super(StreamMessage, self).__init__(timestamp)
+        self.message_dict = {"_id": message_id}
+
+
+class StreamAPI(object):
+
+    max_workers = 4
+
+    def __init__(self, messages, latency=0):
+        self.messages = messages
+        self.latency = latency
+        self.filters = []
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+
+    def search_messages(self, query, page_size=None):
+        with self.lock:
+            self.filters.append(query.filter)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.latency)
+        with self.lock:
+            self.running -= 1
+        streams = query.streams()
+        from_time, to_time = query.search_range.absolute_bounds()
+        return iter([StreamMessage(i, ts) for i, ts, stream in self.messages if stream in streams and from_time <= ts <= to_time])
+
+
+class FakeResult(object):
+
+    def __init__(self, messages):
+        self.messages = messages
+
+
+class FakeAPI(object):
+
+    def __init__(self, timestamps, max_workers=4):
+        self.timestamps = timestamps
+        self.max_workers = max_workers
+        self.queries = []
+
+    def search_messages(self, query, page_size=None):
+        self.queries.append(query)
+        from_time, to_time = query.search_range.absolute_bounds()
+        return (FakeMessage(ts) for ts in self.timestamps if from_time <= ts <= to_time)
+
+    def search(self, query, fetch_all=False):
+        self.queries.append(query)
+        return FakeResult([FakeMessage(ts) for ts in reversed(self.timestamps)][:query.limit])
+
+    def count(self, query):
+        return len(self.timestamps)
+
+    def histogram(self, query, interval):
+        buckets = {}
+        for ts in self.timestamps:
+            start = ts.timestamp // 60 * 60
+            buckets[str(start)] = buckets.get(str(start), 0) + 1
+        return HistogramResult({"interval": interval, "results": buckets})
+
+
+class CountingAPI(FakeAPI):
+
+    def __init__(self, timestamps, max_workers=4):
+        super(CountingAPI, self).__init__(timestamps, max_workers)
+        self.read = 0
+
+    def search_messages(self, query, page_size=None):
+        for message in super(CountingAPI, self).search_messages(query, page_size):
+            self.read += 1
+            yield message
+
+
+class FailingAPI(FakeAPI):
+
+    def search_messages(self, query, page_size=None):
+        yield FakeMessage(arrow.utcnow())
+        raise IOError("connection reset")
+
+
+class ExitingAPI(FakeAPI):
+    # GraylogAPI.get calls exit() when a request fails
+
+    def search_messages(self, query, page_size=None):
+        exit()
+
+    def search(self, query, fetch_all=False):
+        exit()
+
+
+class TimeSlicedSearchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.start = arrow.get("2016-01-01T00:00:00+00:00")
+        self.end = self.start.replace(minutes=+10)
+        self.timestamps = [self.start.replace(seconds=+s) for s in range(0, 601, 7)]
+        self.query = SearchQuery(SearchRange(from_time=self.start, to_time=self.end))
+
+    def test_messages_are_yielded_in_time_order_without_duplicates(self):
+        api = FakeAPI(self.timestamps)
+        messages = list(TimeSlicedSearch(api, workers=3).search_messages(self.query))
+
+        self.assertEquals(self.timestamps, [m.timestamp for m in messages])
+        self.assertEquals(12, len(api.queries))
+
+    def test_slices_are_read_into_bounded_queues(self):
+        api = CountingAPI([self.start.replace(microseconds=+100000 * i) for i in range(6000)])
+        messages = TimeSlicedSearch(api, workers=3, slices=3, queue_size=10).search_messages(self.query)
+
+        next(messages)
+        time.sleep(0.2)
+        self.assertLessEqual(api.read, 3 * 12)
+        self.assertEquals(6000, 1 + len(list(messages)))
+
+    def test_workers_are_capped_by_environment(self):
+        self.assertEquals(2, TimeSlicedSearch(FakeAPI([], max_workers=2), workers=16).workers)
+        self.assertEquals(2, TimeSlicedSearch(FakeAPI([], max_workers=2)).workers)
+
+    def test_custom_sort_is_searched_serially(self):
+        api = FakeAPI(self.timestamps)
+        query = SearchQuery(SearchRange(from_time=self.start, to_time=self.end), sort="source")
+        messages = list(TimeSlicedSearch(api, workers=3).search_messages(query))
+
+        self.assertEquals(len(self.timestamps), len(messages))
+        self.assertEquals(1, len(api.queries))
+
+    def test_worker_exit_is_raised_in_the_caller(self):
+        api = FakeAPI(self.timestamps)
+        api.search_messages = lambda query, page_size=None: exit()
+
+        with self.assertRaises(SystemExit):
+            list(TimeSlicedSearch(api, workers=3).search_messages(self.query))
+
+    def test_split_ranges_do_not_overlap(self):
+        ranges = SearchRange(from_time=self.start, to_time=self.end).split(4)
+
+        self.assertEquals(4, len(ranges))
+        self.assertEquals(self.start, ranges[0].from_time)
+        self.assertEquals(self.end, ranges[-1].to_time)
+        for previous, current in zip(ranges, ranges[1:]):
+            self.assertEquals(previous.to_time.replace(microseconds=+1000), current.from_time)
+
+
+class MergedSearchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.start = arrow.get("2016-01-01T00:00:00+00:00")
+        self.query = SearchQuery(SearchRange(from_time=self.start, to_time=self.start.replace(minutes=+10)))
+        self.apis = OrderedDict([
+            ("dc1", FakeAPI([self.start.replace(seconds=+s) for s in range(0, 600, 3)])),
+            ("dc2", FakeAPI([self.start.replace(seconds=+s) for s in range(1, 600, 5)])),
+        ])
+
+    def test_messages_are_merged_by_timestamp_and_tagged(self):
+        messages = list(MergedSearch(self.apis, queue_size=10).search_messages(self.query))
+
+        timestamps = [m.timestamp for m in messages]
+        self.assertEquals(200 + 120, len(messages))
+        self.assertEquals(sorted(timestamps), timestamps)
+        self.assertEquals(set(["dc1", "dc2"]), set(m.environment for m in messages))
+        self.assertEquals("dc2", messages[1].environment)
+
+    def test_each_environment_gets_its_own_filter(self):
+        list(MergedSearch(self.apis, {"dc1": "streams:a", "dc2": "streams:b"}).search_messages(self.query))
+
+        self.assertEquals("streams:a", self.apis["dc1"].queries[0].filter)
+        self.assertEquals("streams:b", self.apis["dc2"].queries[0].filter)
+
+    def test_search_keeps_the_newest_messages(self):
+        query = SearchQuery(self.query.search_range, limit=4)
+        result = MergedSearch(self.apis).search(query)
+
+        self.assertEquals(4, len(result.messages))
+        self.assertEquals(["dc1", "dc2", "dc1"], [m.environment for m in result.messages[:3]])
+        self.assertEquals(self.start.replace(seconds=+597), result.messages[0].timestamp)
+
+    def test_aggregations_add_up_the_environments(self):
+        search = MergedSearch(self.apis)
+        histogram = search.histogram(self.query, "minute")
+
+        self.assertEquals(200 + 120, search.count(self.query))
+        self.assertEquals(10, len(histogram.buckets))
+        self.assertEquals((self.start.timestamp, 20 + 12), histogram.buckets[0])
+
+    def test_environment_errors_are_raised(self):
+        self.apis["dc3"] = FailingAPI([])
+        with self.assertRaises(IOError):
+            list(MergedSearch(self.apis).search_messages(self.query))
+
+    def test_environment_exit_is_raised_in_the_caller(self):
+        self.apis["dc3"] = ExitingAPI([])
+        with self.assertRaises(SystemExit):
+            list(MergedSearch(self.apis).search_messages(self.query))
+        with self.assertRaises(SystemExit):
+            MergedSearch(self.apis).search(SearchQuery(self.query.search_range, limit=4))
+
+
+class StreamSplitTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.start = arrow.get("2016-01-01T00:00:00+00:00")
+        self.api = StreamAPI([
+            ("a", self.start, "s1"),
+            ("b", self.start.replace(seconds=+1), "s2"),
+            ("b", self.start.replace(seconds=+1), "s1"),
+            ("c", self.start.replace(seconds=+2), "s2"),
+        ])
+
+    def query(self, hours, filter="streams:s1 OR streams:s2"):
+        return SearchQuery(SearchRange(from_time=self.start, to_time=self.start.replace(hours=+hours)), filter=filter)
+
+    def test_query_streams(self):
+        self.assertEquals(["s1", "s2"], self.query(1).streams())
+        self.assertEquals([], self.query(1, "streams:s1 AND source:x").streams())
+
+    def test_ranges_are_split_per_stream(self):
+        messages = list(TimeSlicedSearch(self.api, workers=2, slices=3).search_messages(self.query(0.5)))
+
+        self.assertEquals(["a", "b", "c"], [m.message_dict["_id"] for m in messages])
+        self.assertEquals(["streams:s1"] * 3 + ["streams:s2"] * 3, sorted(self.api.filters))
+
+    def test_workers_bound_the_requests_of_all_streams(self):
+        api = StreamAPI([], latency=0.02)
+        list(TimeSlicedSearch(api, workers=3, slices=4).search_messages(self.query(8, "streams:s0 OR streams:s1 OR streams:s2")))
+
+        self.assertEquals(3 * 4, len(api.filters))
+        self.assertLessEqual(api.max_running, 3)
+
+    def test_streams_past_the_workers_are_not_split(self):
+        filter = " OR ".join("streams:s%d" % i for i in range(6))
+        list(TimeSlicedSearch(self.api, workers=2, slices=4).search_messages(self.query(8, filter)))
+
+        self.assertEquals([filter] * 4, self.api.filters)
@@ -0,0 +1,155 @@
+import random
+import unittest
+from collections import Counter
+from glogcli.graylog_api import Message
+from glogcli.sketches import SpaceSaving, HyperLogLog, GroupBy, Distinct, TDigest, Quantiles, RollingQuantiles
+
+
+class SpaceSavingTestCase(unittest.TestCase):
+
+    def test_counts_are_exact_below_capacity(self):
+        sketch = SpaceSaving(10)
+        for value in "abracadabra":
+            sketch.add(value)
+
+        self.assertEquals([("a", 5, 0), ("b", 2, 0), ("r", 2, 0)], sketch.top(3))
+        self.assertEquals(11, sketch.total)
+
+    def test_counts_stay_within_the_error_bound(self):
+        generator = random.Random(1)
+        values = [int(generator.paretovariate(1.2)) for _ in range(20000)]
+        sketch = SpaceSaving.with_error(0.01)
+        for value in values:
+            sketch.add(value)
+
+        self.assertEquals(100, len(sketch.counters))
+        self.assertEquals(100, len(sketch.heap))
+        exact = Counter(values)
+        for value, count, error in sketch.top(10):
+            self.assertLessEqual(count - error, exact[value])
+            self.assertLessEqual(exact[value], count)
+            self.assertLessEqual(count - exact[value], len(values) * 0.01)
+        self.assertEquals([value for value, _ in exact.most_common(5)], [value for value, _, _ in sketch.top(5)])
+
+
+class HyperLogLogTestCase(unittest.TestCase):
+
+    def test_precision_follows_the_error(self):
+        self.assertEquals(14, HyperLogLog.with_error(0.01).precision)
+        self.assertEquals(HyperLogLog.MAX_PRECISION, HyperLogLog.with_error(0.0001).precision)
+        self.assertLessEqual(HyperLogLog.with_error(0.05).error, 0.05)
+
+    def test_small_cardinalities_are_counted_closely(self):
+        sketch = HyperLogLog.with_error(0.01)
+        for i in range(1000):
+            sketch.add(u"user-%d" % (i % 250))
+
+        self.assertLessEqual(abs(sketch.count() - 250), 5)
+
+    def test_large_cardinalities_are_within_the_error(self):
+        sketch = HyperLogLog.with_error(0.02)
+        for i in range(200000):
+            sketch.add(i)
+
+        self.assertLess(abs(sketch.count() - 200000), 3 * sketch.error * 200000)
+
+
+class TDigestTestCase(unittest.TestCase):
+
+    def setUp(self):
+        generator = random.Random(2)
+        self.values = [generator.expovariate(0.01) for _ in range(50000)]
+
+    def exact(self, q):
+        return sorted(self.values)[int(q * (len(self.values) - 1))]
+
+    def test_quantiles_are_close_and_memory_is_bounded(self):
+        digest = TDigest(100)
+        for value in self.values:
+            digest.add(value)
+
+        self.assertLess(len(digest.means), 200)
+        self.assertEquals((min(self.values), max(self.values)), (digest.min, digest.max))
+        for q in (0.5, 0.95, 0.99):
+            self.assertLess(abs(digest.quantile(q) - self.exact(q)) / self.exact(q), 0.02)
+
+    def test_merged_digests_match_a_single_one(self):
+        parts = [TDigest(100) for _ in range(4)]
+        for i, value in enumerate(self.values):
+            parts[i % 4].add(value)
+        merged = TDigest(100)
+        for part in parts:
+            merged.merge(part)
+
+        self.assertEquals(len(self.values), merged.count)
+        self.assertLess(abs(merged.quantile(0.99) - self.exact(0.99)) / self.exact(0.99), 0.02)
+
+    def test_small_digests(self):
+        digest = TDigest()
+        self.assertIsNone(digest.quantile(0.5))
+        digest.add(7)
+        self.assertEquals(7, digest.quantile(0.99))
+
+
+class QuantilesTestCase(unittest.TestCase):
+
+    def messages(self, count, source="web-1"):
+        return [Message({"message": {"source": source, "response_time": i, "size": "n/a"}}) for i in range(1, count + 1)]
+
+    def test_quantiles_per_group(self):
+        quantiles = Quantiles(["response_time", "size"], "source").consume(self.messages(100) + self.messages(11, "db"))
+
+        self.assertEquals([
+            [u"web-1", "response_time", 100, 1.0, 50.5, 100.0],
+            [u"db", "response_time", 11, 1.0, 6.0, 11.0],
+        ], quantiles.rows([50]))
+
+    def test_groups_past_the_limit_share_a_digest(self):
+        quantiles = Quantiles(["response_time"], "source", max_groups=2)
+        for source in ("a", "b", "c", "d"):
+            quantiles.consume(self.messages(10, source))
+
+        self.assertEquals([u"a", u"b", u"(other)"], [row[0] for row in quantiles.rows([50])])
+        self.assertEquals(20, quantiles.counts[u"(other)"])
+
+    def test_rolling_windows_leave_out_old_slots(self):
+        windows = []
+        rolling = RollingQuantiles(["response_time"], None, lambda quantiles, end: windows.append((end, quantiles.rows([50]))), window=60)
+
+        rolling.consume(self.messages(10), now=1000)
+        rolling.consume(self.messages(20), now=1005)
+        rolling.consume([], now=1012)
+        rolling.consume(self.messages(4), now=1015)
+        rolling.consume([], now=1100)
+
+        self.assertEquals(34, rolling.messages)
+        self.assertEquals((1010, [[None, "response_time", 30, 1.0, 8.0, 20.0]]), windows[0])
+        self.assertEquals(1100, windows[1][0])
+        self.assertEquals([], windows[1][1])
+
+
+class FieldSketchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.messages = [
+            Message({"message": {"source": "web-1", "streams": ["s1", "s2"]}}),
+            Message({"message": {"source": "web-1", "streams": ["s1"]}}),
+            Message({"message": {"source": "db", "level": 3}}),
+            Message({"message": {"level": 3}}),
+        ]
+
+    def test_group_by_counts_missing_fields_and_list_elements(self):
+        sources = GroupBy("source").consume(self.messages)
+        streams = GroupBy("streams").consume(self.messages)
+        levels = GroupBy("level").consume(self.messages)
+
+        self.assertEquals([("web-1", 2, 0), ("db", 1, 0)], sources.sketch.top(10))
+        self.assertEquals((4, 1), (sources.messages, sources.missing))
+        self.assertEquals([("s1", 2, 0), ("s2", 1, 0)], streams.sketch.top(10))
+        self.assertEquals([(u"3", 2, 0)], levels.sketch.top(10))
+
+    def test_distinct(self):
+        distinct = Distinct("source").consume(self.messages)
+
+        self.assertEquals(2, distinct.sketch.count())
+        self.assertEquals((4, 1), (distinct.messages, distinct.missing))
@@ -0,0 +1,22 @@
+import sys
+import unittest
+from benchmarks.startup import StartupBenchmark, MODES
+
+
+class StartupTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.benchmark = StartupBenchmark(sys.executable)
+        self.addCleanup(self.benchmark.close)
+        self.modes = dict((name, args) for name, args, _ in MODES)
+
+    def test_version_and_help_import_no_heavy_dependency(self):
+        for mode in ('version', 'help', 'sync-help'):
+            _, modules = self.benchmark.run(self.modes[mode])
+            self.assertEquals([], modules, mode)
+
+    def test_local_modes_skip_network_dependencies(self):
+        for mode in ('local-tail', 'local-dump'):
+            _, modules = self.benchmark.run(self.modes[mode])
+            for module in ('keyring', 'requests', 'pyarrow'):
+                self.assertNotIn(module, modules, mode)
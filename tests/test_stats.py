@@ -0,0 +1,60 @@
+import unittest
+import arrow
+from six import BytesIO
+from benchmarks.fakeserver import FakeGraylog
+from benchmarks.loadtest import build_api, IdFormatter
+from glogcli import stats
+from glogcli.graylog_api import SearchRange, SearchQuery
+from glogcli.output import LogPrinter
+from glogcli.parallel import TimeSlicedSearch
+
+
+class PipelineStatsTestCase(unittest.TestCase):
+
+    def test_timed_yields_every_item_and_adds_time(self):
+        run_stats = stats.PipelineStats()
+
+        self.assertEquals([1, 2, 3], list(run_stats.timed([1, 2, 3], "decode")))
+        self.assertIn("decode", run_stats.seconds)
+
+    def test_summary_subtracts_receive_from_decode(self):
+        run_stats = stats.PipelineStats()
+        run_stats.add("decode", 3.0)
+        run_stats.add("receive", 1.0)
+        run_stats.add("request", 0.5)
+        run_stats.count("requests", 2)
+
+        summary = run_stats.summary()
+        self.assertIn("Requests: 2 in 0.500 s (250.0 ms avg)", summary)
+        self.assertIn("Decode:   2.000 s", summary)
+        self.assertNotIn("Dedup", summary)
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(stats.current)
+
+
+class InstrumentedRunTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeGraylog(rate=20, backfill=600).start()
+        self.addCleanup(self.server.stop)
+        self.api = build_api(self.server)
+        self.addCleanup(self.api.close)
+        self.run_stats = stats.enable()
+        self.addCleanup(stats.disable)
+
+    def test_dump_fills_every_stage(self):
+        from_time = arrow.get(self.server.start_ms / 1000.0)
+        query = SearchQuery(SearchRange(from_time=from_time, to_time=from_time.replace(minutes=+2)))
+        output = BytesIO()
+
+        LogPrinter().run_logprint(TimeSlicedSearch(self.api, 2), query, IdFormatter(), output=output)
+
+        expected = len(self.server.ids_between(self.server.start_ms, self.server.start_ms + 120000))
+        self.assertEquals(expected, self.run_stats.counts["messages"])
+        self.assertEquals(len(output.getvalue()), self.run_stats.counts["bytes_written"])
+        self.assertGreater(self.run_stats.counts["requests"], 0)
+        self.assertGreater(self.run_stats.counts["bytes"], 0)
+        for stage in stats.PipelineStats.STAGES:
+            self.assertIn(stage, self.run_stats.seconds)
+        self.assertIn("Dedup:    0 of {} messages already printed".format(expected), self.run_stats.summary())